@@ -0,0 +1,269 @@
+"""This module contains the batch runner which profiles and trains on many tables,
+of many projects, from a manifest instead of calling univariate.test_func and
+decision_tree.decision_tree table by table.
+Every entry of the manifest is a job, run by a pool of workers with a limit on the
+jobs of the same project running at the same time. The univariate jobs profile the
+columns of their table a chunk at a time and save every finished column as a
+checkpoint, the decision tree jobs save their result once the model is exported, so
+a batch stopped half way is resumed by running it again, only the columns and tables
+without a checkpoint being run. The results of all the jobs are written as parquet
+files, one for every kind of univariate output alongwith the decision tree results
+and the status of every job.
+Usage: python batch.py manifest.json --output batch_output --workers 4 --per-project 2"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+#pandas is imported by the functions using it, so the jobs start without waiting for it.
+import schema_catalog
+#the version of the layout of the checkpoints, a change makes new job ids.
+BATCH_VERSION = 1
+WORKFLOWS = ('univariate', 'decision_tree')
+def read_manifest(manifest):
+    """This function reads the jobs of a manifest.
+    Parameters required:a.)manifest: The path of a JSON file, or the list itself, of
+                        the jobs, each a dictionary with the project, table, workflow
+                        ('univariate' if not given), columns(all the columns of the
+                        table if not given) and params passed to
+                        univariate.table_profile or decision_tree.decision_tree.
+    Result: A list with the jobs, each with its job id."""
+    if not isinstance(manifest, (list, tuple)):
+        with open(manifest) as manifest_file:
+            manifest = json.load(manifest_file)
+    jobs = []
+    for i in manifest:
+        job = {'project': i['project'], 'table': i['table'],
+               'workflow': i.get('workflow', 'univariate'),
+               'columns': list(i['columns']) if i.get('columns') else None,
+               'params': dict(i.get('params') or {})}
+        if job['workflow'] not in WORKFLOWS:
+            raise ValueError("Unknown workflow {workflow} for {project}.{table}".format(
+                **job))
+        job['id'] = job_id(job)
+        jobs.append(job)
+    return jobs
+def job_id(job):
+    """This function gives the id of a job, the same whenever the same job is run again.
+    Parameters required:a.)job: The job dictionary.
+    Result: The id as a string made of the table, the workflow and a fingerprint."""
+    text = json.dumps({'version': BATCH_VERSION, 'workflow': job['workflow'],
+                       'columns': job['columns'], 'params': job['params']},
+                      sort_keys=True, default=str)
+    return "{project}.{table}.{workflow}.{key}".format(
+        key=hashlib.sha256(text.encode("utf-8")).hexdigest()[:12], **job)
+def _checkpoint_directory(output, job):
+    """Gives the directory of the checkpoints of a job."""
+    return os.path.join(output, 'checkpoints', job['id'])
+def _column_path(output, job, column_name):
+    """Gives the checkpoint file of a column of a univariate job."""
+    name = hashlib.sha256(column_name.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(_checkpoint_directory(output, job), 'columns', name+'.pkl')
+def _write_checkpoint(path, value):
+    """Writes a checkpoint, replacing the file at once so a stopped batch never
+    leaves half of one."""
+    import pandas as pd
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.to_pickle(value, path+".tmp")
+    os.replace(path+".tmp", path)
+def _job_columns(job):
+    """Gives the columns of a job, all the columns of the table if none are given."""
+    if job['columns'] is not None:
+        return job['columns']
+    columns = list(schema_catalog.get_catalog(job['project'], job['table']).types)
+    if not columns:
+        #a table which is not there has no columns, the job is failed instead of done.
+        raise ValueError("No columns found for {project}.{table}".format(**job))
+    return columns
+def run_univariate(job, output, chunk_size=25):
+    """This function profiles the columns of a univariate job without a checkpoint,
+    chunk_size columns at a time with table_profile, saving every column as soon as
+    its chunk is done.
+    Parameters required:a.)job: The job dictionary.
+                        b.)output: The output directory of the batch.
+                        c.)chunk_size: The number of columns profiled together.
+    Result: The number of columns profiled by this run."""
+    import univariate
+    columns = [i for i in _job_columns(job)
+               if not os.path.isfile(_column_path(output, job, i))]
+    for i in range(0, len(columns), chunk_size):
+        chunk = columns[i:i+chunk_size]
+        profile = univariate.table_profile(chunk, job['project'], job['table'],
+                                           **job['params'])
+        for j in chunk:
+            _write_checkpoint(_column_path(output, job, j), profile[j])
+    return len(columns)
+def run_decision_tree(job, output):
+    """This function trains the decision tree of a job, unless its checkpoint is there.
+    Parameters required:a.)job: The job dictionary.
+                        b.)output: The output directory of the batch.
+    Result: The dictionary decision_tree returns."""
+    import pandas as pd
+    import decision_tree
+    path = os.path.join(_checkpoint_directory(output, job), 'result.pkl')
+    if os.path.isfile(path):
+        return pd.read_pickle(path)
+    params = dict(job['params'])
+    params.setdefault('model_directory', os.path.join(output, 'models', job['id']))
+    column_list = _job_columns(job)
+    result = decision_tree.decision_tree(column_list, job['project'], job['table'], **params)
+    _write_checkpoint(path, result)
+    return result
+class _ProjectSlots:
+    """Counts the running jobs of every project against their limits."""
+    def __init__(self, per_project, project_limits):
+        self.per_project = per_project
+        self.project_limits = dict(project_limits or {})
+        self.running = {}
+        self._lock = threading.Lock()
+    def acquire(self, project):
+        """Takes a slot of the project, False if all of them are taken."""
+        with self._lock:
+            limit = self.project_limits.get(project, self.per_project)
+            if self.running.get(project, 0) >= limit:
+                return False
+            self.running[project] = self.running.get(project, 0)+1
+            return True
+    def release(self, project):
+        """Gives back a slot of the project."""
+        with self._lock:
+            self.running[project] -= 1
+def _run_job(job, output, chunk_size):
+    """Runs a job and gives its status."""
+    start = time.perf_counter()
+    status = {'job_id': job['id'], 'project': job['project'], 'table': job['table'],
+              'workflow': job['workflow'], 'state': 'done', 'error': None, 'profiled': None}
+    try:
+        if job['workflow'] == 'univariate':
+            status['profiled'] = run_univariate(job, output, chunk_size)
+        else:
+            run_decision_tree(job, output)
+    except Exception as error:
+        #a failed job keeps the checkpoints it made and the other jobs go on.
+        status['state'] = 'failed'
+        status['error'] = repr(error)
+    status['seconds'] = time.perf_counter()-start
+    return status
+def run_batch(manifest, output="batch_output", workers=4, per_project=2,
+              project_limits=None, chunk_size=25):
+    """This function runs all the jobs of a manifest, resuming from the checkpoints of
+    an earlier run of the same manifest, and writes the results as parquet files.
+    Parameters required:a.)manifest: The path of the JSON manifest or the list of jobs,
+                        see read_manifest.
+                        b.)output: The directory of the checkpoints and results.
+                        c.)workers: The number of jobs running at the same time.
+                        d.)per_project: The number of jobs of the same project running
+                        at the same time.
+                        e.)project_limits: A dictionary with the limits of the projects
+                        which need another limit than per_project.
+                        f.)chunk_size: The number of columns profiled together by the
+                        univariate jobs, and so the columns run again after a stop.
+    Result: A dataframe with the status of every job, also written as status.parquet."""
+    import pandas as pd
+    jobs = read_manifest(manifest)
+    os.makedirs(output, exist_ok=True)
+    slots = _ProjectSlots(per_project, project_limits)
+    pending, running, statuses = list(jobs), {}, []
+    with ThreadPoolExecutor(workers, thread_name_prefix="batch") as pool:
+        while pending or running:
+            #the jobs of the projects with a free slot are started in manifest order.
+            for job in list(pending):
+                if len(running) >= workers:
+                    break
+                if slots.acquire(job['project']):
+                    pending.remove(job)
+                    running[pool.submit(_run_job, job, output, chunk_size)] = job
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                slots.release(job['project'])
+                statuses.append(future.result())
+    write_results(jobs, output)
+    order = {j['id']: i for i, j in enumerate(jobs)}
+    status = pd.DataFrame(statuses).sort_values('job_id', key=lambda i: i.map(order))
+    status = status.reset_index(drop=True)
+    status.to_parquet(os.path.join(output, 'status.parquet'), index=False)
+    return status
+def _long_frame(frame, job, column_name):
+    """Puts the output of a column in the long layout shared by all the columns, the
+    column itself renamed value and the project, table and column added."""
+    import pandas as pd
+    if not isinstance(frame.index, pd.RangeIndex):
+        frame = frame.reset_index().rename(columns={'index': 'statistic'})
+    frame = frame.rename(columns={column_name: 'value'})
+    frame.insert(0, 'column_name', column_name)
+    frame.insert(0, 'table', job['table'])
+    frame.insert(0, 'project', job['project'])
+    return frame
+def write_results(jobs, output):
+    """This function writes the results of the checkpoints of the jobs as parquet files,
+    univariate/<output>.parquet for every output of table_profile,
+    univariate/columns.parquet with the datatypes, and decision_tree.parquet.
+    Parameters required:a.)jobs: The jobs from read_manifest.
+                        b.)output: The output directory of the batch.
+    Result: A dictionary with the paths written."""
+    import pandas as pd
+    frames, columns, trees = {}, [], []
+    for job in jobs:
+        if job['workflow'] == 'decision_tree':
+            path = os.path.join(_checkpoint_directory(output, job), 'result.pkl')
+            if os.path.isfile(path):
+                result = dict(pd.read_pickle(path))
+                result['best_params'] = json.dumps(result['best_params'], default=str)
+                trees.append(dict(project=job['project'], table=job['table'],
+                                  job_id=job['id'], **result))
+            continue
+        try:
+            column_list = _job_columns(job)
+        except ValueError:
+            #the job failed on a table without columns, so it has no checkpoints.
+            continue
+        for i in column_list:
+            path = _column_path(output, job, i)
+            if not os.path.isfile(path):
+                continue
+            profile = pd.read_pickle(path)
+            columns.append({'project': job['project'], 'table': job['table'],
+                            'column_name': i, 'data_type': profile['data_type']})
+            for kind, value in profile.items():
+                if kind == 'data_type':
+                    continue
+                if isinstance(value, str):
+                    #the bucket CASE of dynamic_bucket.
+                    value = pd.DataFrame({'bucket_case': [value]})
+                frames.setdefault(kind, []).append(_long_frame(value, job, i))
+    paths = {}
+    if columns or frames:
+        os.makedirs(os.path.join(output, 'univariate'), exist_ok=True)
+    if columns:
+        paths['columns'] = os.path.join(output, 'univariate', 'columns.parquet')
+        pd.DataFrame(columns).to_parquet(paths['columns'], index=False)
+    for kind, value in frames.items():
+        paths[kind] = os.path.join(output, 'univariate', kind+'.parquet')
+        data = pd.concat(value, ignore_index=True)
+        #the values of categorical and numeric columns can be in the same output.
+        if 'value' in data.columns and data['value'].dtype == object:
+            data['value'] = data['value'].astype('string')
+        data.to_parquet(paths[kind], index=False)
+    if trees:
+        paths['decision_tree'] = os.path.join(output, 'decision_tree.parquet')
+        pd.DataFrame(trees).to_parquet(paths['decision_tree'], index=False)
+    return paths
+def main(arguments=None):
+    """Runs a batch from the command line."""
+    parser = argparse.ArgumentParser(description="Profile and train on the tables of a manifest.")
+    parser.add_argument('manifest', help="The JSON manifest of the jobs.")
+    parser.add_argument('--output', default='batch_output')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--per-project', type=int, default=2)
+    parser.add_argument('--chunk-size', type=int, default=25)
+    arguments = parser.parse_args(arguments)
+    status = run_batch(arguments.manifest, arguments.output, arguments.workers,
+                       arguments.per_project, chunk_size=arguments.chunk_size)
+    print(status)
+if __name__ == "__main__":
+    main()
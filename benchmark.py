@@ -0,0 +1,255 @@
+"""This module contains the offline benchmark of the univariate and decision tree
+workflows, run on synthetic google analytics shaped tables with the local DuckDB
+stand-in of local_bigquery instead of bigquery.
+Every case, a workflow on a table of some number of rows and columns, is run in a
+fresh process so its peak memory is its own, and the wall time, number of queries,
+rows and bytes handed back by the queries, peak RSS and model fit time are written
+to a JSON file which can be compared with the one of another version.
+The cold start of the command line of cli.py, the seconds from the launch of the
+process to the first query, is measured the same way for every workflow.
+Usage: python benchmark.py --rows 10000 100000 --columns 4 16 --output benchmark.json"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+#the version of the layout of the results file.
+BENCHMARK_VERSION = 1
+WORKFLOWS = ('univariate', 'decision_tree')
+#the column names of the synthetic tables, numbered once they run out.
+NUMERIC_NAMES = ('totals_hits', 'totals_pageviews', 'totals_timeOnSite',
+                 'totals_sessionQualityDim', 'visitNumber', 'totals_newVisits')
+STRING_NAMES = ('device_browser', 'device_operatingSystem', 'device_deviceCategory',
+                'geoNetwork_country', 'trafficSource_source', 'trafficSource_medium',
+                'channelGrouping')
+def _names(names, number):
+    """Gives number column names, numbering the names once they are all used."""
+    return [names[i % len(names)]+("" if i < len(names) else "_"+str(i//len(names)))
+            for i in range(number)]
+def synthetic_table(rows, numeric_columns=3, string_columns=3, cardinality=50,
+                    null_rate=0.05, positive_rate=0.05, seed=0):
+    """This function makes a table shaped like a google analytics session export.
+    Parameters required:a.)rows: The number of sessions.
+                        b.)numeric_columns: The number of numeric columns.
+                        c.)string_columns: The number of categorical columns.
+                        d.)cardinality: The number of distinct values of the
+                        categorical columns, drawn with a long tail.
+                        e.)null_rate: The share of null values of every column.
+                        f.)positive_rate: The share of the sessions with label 1.
+                        g.)seed: The seed of the random values.
+    Result: A dataframe with the columns, visitStartTime and label."""
+    generator = np.random.default_rng(seed)
+    data = {}
+    for position, i in enumerate(_names(NUMERIC_NAMES, numeric_columns)):
+        values = generator.poisson(2+(3*position) % 20, rows).astype('float64')
+        values[generator.random(rows) < null_rate] = np.nan
+        data[i] = values
+    #the values are picked with zipf like weights the way real traffic is spread.
+    weights = 1/np.arange(1, cardinality+1)
+    weights = weights/weights.sum()
+    for position, i in enumerate(_names(STRING_NAMES, string_columns)):
+        values = np.array(["{col_name}_{value}".format(col_name=i, value=j)
+                           for j in range(cardinality)], dtype=object)
+        values = values[generator.choice(cardinality, rows, p=weights)]
+        values[generator.random(rows) < null_rate] = None
+        data[i] = values
+    data['visitStartTime'] = generator.integers(1_500_000_000, 1_600_000_000, rows)
+    #the label leans on the first numeric column so the tree has something to find.
+    score = np.ones(rows)
+    if numeric_columns:
+        first = np.nan_to_num(data[_names(NUMERIC_NAMES, 1)[0]])
+        score = 0.5+0.5*first/max(first.mean(), 1e-9)
+    data['label'] = (generator.random(rows) < np.clip(positive_rate*score, 0, 1)).astype('int64')
+    return pd.DataFrame(data)
+def _peak_rss():
+    """Gives the peak resident memory of the process in bytes, None where unknown."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #linux gives kilobytes and macOS bytes.
+    return peak if sys.platform == 'darwin' else peak*1024
+@contextlib.contextmanager
+def _timed(module, name, timings):
+    """Adds the seconds spent in module.name to timings while the block runs."""
+    function = getattr(module, name)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings.append(time.perf_counter()-start)
+    setattr(module, name, timed)
+    try:
+        yield
+    finally:
+        setattr(module, name, function)
+def run_case(workflow, rows, columns, table_options=None, param_grid=None, n_jobs=1):
+    """This function runs one workflow on a synthetic table and measures it, it is
+    meant to be run in a fresh process.
+    Parameters required:a.)workflow: 'univariate' or 'decision_tree'.
+                        b.)rows: The number of rows of the table.
+                        c.)columns: The number of columns profiled or trained on,
+                        half of them numeric.
+                        d.)table_options: Other parameters of synthetic_table.
+                        e.)param_grid: The grid of the decision tree search.
+                        f.)n_jobs: The worker processes of the decision tree search.
+    Result: A dictionary with the case and its measures."""
+    import local_bigquery
+    import model_search
+    import query_executor
+    options = dict(table_options or {})
+    numeric_columns = (columns+1)//2
+    data = synthetic_table(rows, numeric_columns, columns-numeric_columns, **options)
+    client = local_bigquery.LocalClient({('benchmark', 'sessions'): data})
+    query_executor.set_executor(query_executor.QueryExecutor(lambda: client))
+    column_list = [i for i in data.columns if i not in ('visitStartTime', 'label')]
+    fit_times = []
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        if workflow == 'univariate':
+            import univariate
+            univariate.test_func(column_list, 'benchmark', 'sessions')
+        elif workflow == 'decision_tree':
+            import decision_tree
+            with tempfile.TemporaryDirectory() as directory, \
+                    _timed(model_search, 'search', fit_times):
+                decision_tree.decision_tree(
+                    column_list+['visitStartTime', 'label'], 'benchmark', 'sessions',
+                    param_grid=param_grid, n_jobs=n_jobs,
+                    model_directory=os.path.join(directory, 'model'))
+        else:
+            raise ValueError("Unknown workflow {workflow}".format(workflow=workflow))
+    wall_time = time.perf_counter()-start
+    counters = client.counters()
+    return {'workflow': workflow, 'rows': rows, 'columns': columns,
+            'table_options': options, 'wall_time': wall_time,
+            'queries': counters['queries'], 'rows_transferred': counters['rows'],
+            'bytes_transferred': counters['bytes'], 'peak_rss': _peak_rss(),
+            'fit_time': sum(fit_times) if fit_times else None}
+def run_suite(rows=(10000, 100000), columns=(4, 16), workflows=WORKFLOWS,
+              table_options=None, param_grid=None, n_jobs=1, repeat=1):
+    """This function runs every workflow at every size of table, each case in a
+    fresh process.
+    Parameters required:a.)rows: The numbers of rows of the tables.
+                        b.)columns: The numbers of columns of the tables.
+                        c.)workflows: The workflows to be run.
+                        d.)table_options: Other parameters of synthetic_table.
+                        e.)param_grid: The grid of the decision tree search.
+                        f.)n_jobs: The worker processes of the decision tree search.
+                        g.)repeat: The number of times every case is run.
+    Result: A dictionary with the environment and the measures of every case."""
+    cases = []
+    context = multiprocessing.get_context('spawn')
+    for workflow in workflows:
+        for i in rows:
+            for j in columns:
+                for _ in range(repeat):
+                    with ProcessPoolExecutor(1, mp_context=context) as pool:
+                        cases.append(pool.submit(run_case, workflow, i, j, table_options,
+                                                 param_grid, n_jobs).result())
+    return {'version': BENCHMARK_VERSION, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'environment': _environment(), 'cases': cases}
+def cold_start(workflows=WORKFLOWS, rows=10000, columns=4, repeat=5):
+    """This function measures the cold start of the command line, every run being a
+    new python process running cli.py on a synthetic parquet table with the local
+    stand-in, the way a user starts it.
+    Parameters required:a.)workflows: The workflows to be run, through the profile
+                        and train commands.
+                        b.)rows: The number of rows of the table.
+                        c.)columns: The number of columns of the table.
+                        d.)repeat: The number of runs of every workflow.
+    Result: A list with the cold start of every run, see cli.cold_start."""
+    commands = {'univariate': ['profile'], 'decision_tree': ['train', '--n-jobs', '1']}
+    numeric_columns = (columns+1)//2
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py')
+    result = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'sessions.parquet')
+        synthetic_table(rows, numeric_columns, columns-numeric_columns).to_parquet(path)
+        for workflow in workflows:
+            for _ in range(repeat):
+                arguments = [sys.executable, script, '--backend', 'duckdb', '--timing',
+                             '--table', 'benchmark.sessions='+path]+commands[workflow]
+                arguments += ['benchmark', 'sessions']
+                if workflow == 'decision_tree':
+                    arguments += ['--model-directory', os.path.join(directory, 'model')]
+                run = subprocess.run(arguments, capture_output=True, text=True, check=True,
+                                     cwd=directory)
+                line = [i for i in run.stderr.splitlines() if i.startswith('cold start: ')][-1]
+                result.append(dict(json.loads(line[len('cold start: '):]), workflow=workflow))
+    return result
+def _environment():
+    """Gives the versions the benchmark was run with."""
+    versions = {'python': platform.python_version(), 'platform': platform.platform(),
+                'cpus': os.cpu_count()}
+    for i in ('numpy', 'pandas', 'sklearn', 'duckdb'):
+        try:
+            versions[i] = __import__(i).__version__
+        except ImportError:
+            versions[i] = None
+    return versions
+def write_results(results, path):
+    """This function writes the results of run_suite as JSON."""
+    with open(path, 'w') as result_file:
+        json.dump(results, result_file, indent=1)
+    return path
+def compare_results(baseline, current, measures=('wall_time', 'queries', 'rows_transferred',
+                                                 'peak_rss', 'fit_time')):
+    """This function compares the results of two versions case by case.
+    Parameters required:a.)baseline: The results, or the path of the JSON file, to compare to.
+                        b.)current: The results, or the path of the JSON file, of the
+                        version being checked.
+                        c.)measures: The measures to be compared.
+    Result: A dataframe with the ratio current/baseline of every measure of every
+            case run by both, the average of the repeats being taken."""
+    frames = []
+    for i in (baseline, current):
+        if not isinstance(i, dict):
+            with open(i) as result_file:
+                i = json.load(result_file)
+        frame = pd.DataFrame(i['cases'])
+        frames.append(frame.groupby(['workflow', 'rows', 'columns'])[list(measures)].mean())
+    joined = frames[1].join(frames[0], how='inner', rsuffix='_baseline')
+    result = pd.DataFrame({i: joined[i]/joined[i+'_baseline'] for i in measures})
+    return result
+def main(arguments=None):
+    """Runs the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description="Benchmark the workflows on a local stand-in.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--columns', type=int, nargs='+', default=[4, 16])
+    parser.add_argument('--workflows', nargs='+', default=list(WORKFLOWS), choices=WORKFLOWS)
+    parser.add_argument('--cardinality', type=int, default=50)
+    parser.add_argument('--null-rate', type=float, default=0.05)
+    parser.add_argument('--positive-rate', type=float, default=0.05)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--n-jobs', type=int, default=1)
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--baseline', help="A results file to compare the run with.")
+    parser.add_argument('--cold-start', action='store_true',
+                        help="Also measure the cold start of the command line.")
+    arguments = parser.parse_args(arguments)
+    table_options = {'cardinality': arguments.cardinality, 'null_rate': arguments.null_rate,
+                     'positive_rate': arguments.positive_rate}
+    results = run_suite(arguments.rows, arguments.columns, arguments.workflows,
+                        table_options, n_jobs=arguments.n_jobs, repeat=arguments.repeat)
+    if arguments.cold_start:
+        results['cold_start'] = cold_start(arguments.workflows, repeat=max(arguments.repeat, 3))
+        print(pd.DataFrame(results['cold_start']).groupby('workflow').median(numeric_only=True))
+    write_results(results, arguments.output)
+    print(pd.DataFrame(results['cases']).drop(columns='table_options'))
+    if arguments.baseline:
+        print(compare_results(arguments.baseline, results))
+if __name__ == "__main__":
+    main()
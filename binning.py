@@ -0,0 +1,155 @@
+"""This module contains the quantile pre-binning of the decision tree training matrix.
+Every numeric feature is cut at the quantiles of the table, found for all the
+features with a single APPROX_QUANTILES query, or from the matrix itself when it did
+not come from bigquery, and the matrix is kept as uint8 bin codes, so the candidates
+and folds of the search are handed a matrix a quarter of the size with at most 256
+distinct values in every column to sort and split on, a sparse matrix staying sparse.
+The code of a value is the number of edges below it, so a split of the tree on the
+codes is a split on the raw values at one of the edges, and the thresholds of the
+fitted tree are turned back into raw values before it is exported for scoring."""
+import numpy as np
+import query_executor
+import tree_sql
+#the most bins a feature can have with uint8 codes.
+MAX_BINS = 256
+def _check_bins(bins):
+    """Checks the number of bins is one uint8 codes can hold."""
+    if not 2 <= bins <= MAX_BINS:
+        raise ValueError("bins must be between 2 and {limit}, not {bins}".format(
+            limit=MAX_BINS, bins=bins))
+def _edges(points):
+    """Gives the edges of the bins from the quantile points, the maximum left out
+    since no value is above it, as float32 values like the ones of the matrix."""
+    points = np.asarray([i for i in points if i is not None], dtype='float64')
+    points = points[~np.isnan(points)].astype(np.float32)
+    return np.unique(points[:-1]) if len(points) > 1 else points
+def edges_query(state, project_name, table_name, bins=MAX_BINS):
+    """This function writes the query giving the quantiles of all the numeric features
+    of a preprocessing state, after their null values are filled.
+    Parameters required:a.)state: The preprocessing state.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)bins: The number of bins of every feature.
+    Result: The query as a string, with the quantiles of the feature at position i of
+            state['feature_names'] as the column f<i>, None if there is no numeric feature."""
+    select = ["APPROX_QUANTILES({column}, {number}) as f{position}".format(
+        column=tree_sql._column_sql(i, state), number=bins-1, position=position)
+              for position, (i, value) in enumerate(tree_sql._features(state)) if value is None]
+    if not select:
+        return None
+    query = """SELECT {select}
+            FROM {project_name}.{table_name}""".format(
+                select=",\n            ".join(select), project_name=project_name,
+                table_name=table_name)
+    return query
+def fit_edges(state, project_name, table_name, bins=MAX_BINS):
+    """This function finds the edges of the bins of every feature with one scan of
+    the table.
+    Parameters required:a.)state: The preprocessing state.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)bins: The number of bins of every feature, at most 256.
+    Result: A list with the sorted edges of every feature, in the order of
+            state['feature_names'], the one hot features having the single edge 0."""
+    _check_bins(bins)
+    features = tree_sql._features(state)
+    edges = [np.zeros(1) for _ in features]
+    query = edges_query(state, project_name, table_name, bins)
+    if query is not None:
+        data = query_executor.run_query(query).iloc[0]
+        for position, (_, value) in enumerate(features):
+            if value is None:
+                edges[position] = _edges(data["f{position}".format(position=position)])
+    return edges
+def matrix_edges(matrix, bins=MAX_BINS):
+    """This function finds the edges of the bins of every column of a matrix which did
+    not come from bigquery, like the ones of the local backend.
+    Parameters required:a.)matrix: The feature matrix, dense or sparse.
+                        b.)bins: The number of bins of every column, at most 256.
+    Result: A list with the sorted edges of every column."""
+    _check_bins(bins)
+    points = np.linspace(0, 1, bins)
+    edges = []
+    for i in range(matrix.shape[1]):
+        column = matrix[:, i]
+        column = column.toarray().ravel() if hasattr(column, 'toarray') else np.asarray(column)
+        column = column[~np.isnan(column)].astype('float64')
+        #discrete quantiles, values of the column the way APPROX_QUANTILES gives them.
+        edges.append(_edges(np.quantile(column, points, method='inverted_cdf'))
+                     if len(column) else np.zeros(0))
+    return edges
+def _check_edges(edge, position):
+    """Checks the codes of a column fit in uint8."""
+    if len(edge) >= MAX_BINS:
+        raise ValueError("Feature {i} has {n} edges, more than uint8 codes can hold".format(
+            i=position, n=len(edge)))
+def bin_matrix(matrix, edges):
+    """This function turns a feature matrix into its uint8 bin codes.
+    Parameters required:a.)matrix: The feature matrix, dense or sparse.
+                        b.)edges: The edges of every column from fit_edges or matrix_edges.
+    Result: A uint8 matrix with the number of edges below every value, the null
+            values having the last code of their column, a CSR matrix for a sparse
+            matrix so the one hot columns stay sparse."""
+    if len(edges) != matrix.shape[1]:
+        raise ValueError("There are edges for {n} features but the matrix has {m}".format(
+            n=len(edges), m=matrix.shape[1]))
+    if hasattr(matrix, 'tocsc'):
+        return _bin_sparse(matrix, edges)
+    result = np.empty(matrix.shape, dtype=np.uint8)
+    for i, edge in enumerate(edges):
+        _check_edges(edge, i)
+        column = np.asarray(matrix[:, i])
+        #the float32 values are compared with the edges the way scoring compares
+        #them with the thresholds, nan is sorted after every edge.
+        result[:, i] = np.searchsorted(edge, column.astype('float64'), side='left')
+    return result
+def _bin_sparse(matrix, edges):
+    """Bins a sparse matrix column by column, the columns whose zero has the code 0,
+    like the one hot ones, keeping only their stored values."""
+    from scipy.sparse import csc_matrix
+    matrix = matrix.tocsc()
+    rows, values, pointers = [], [], [0]
+    for i, edge in enumerate(edges):
+        _check_edges(edge, i)
+        start, end = matrix.indptr[i], matrix.indptr[i+1]
+        zero = np.searchsorted(edge, 0.0, side='left')
+        if zero == 0:
+            row = matrix.indices[start:end]
+            codes = np.searchsorted(edge, matrix.data[start:end].astype('float64'), side='left')
+        else:
+            #the zeros of the column have a code of their own, so it is binned whole.
+            column = np.zeros(matrix.shape[0])
+            column[matrix.indices[start:end]] = matrix.data[start:end]
+            row = np.arange(matrix.shape[0])
+            codes = np.searchsorted(edge, column, side='left')
+        stored = codes != 0
+        rows.append(row[stored])
+        values.append(codes[stored].astype(np.uint8))
+        pointers.append(pointers[-1]+int(stored.sum()))
+    result = csc_matrix(
+        (np.concatenate(values) if values else np.zeros(0, dtype=np.uint8),
+         np.concatenate(rows) if rows else np.zeros(0, dtype=int), pointers),
+        shape=matrix.shape, dtype=np.uint8)
+    return result.tocsr()
+def raw_thresholds(feature, threshold, edges):
+    """This function turns the thresholds of a tree fitted on the bin codes into
+    thresholds on the raw values.
+    Parameters required:a.)feature: The split feature of every node.
+                        b.)threshold: The threshold of every node, on the codes.
+                        c.)edges: The edges of every feature.
+    Result: An array with the raw threshold of every split, the leaves keeping theirs.
+            A split of the codes at k.5 is the raw split at the edge k, since a
+            value is at most that edge exactly when its code is at most k, and the
+            threshold is put halfway to the next float32 value the way scikit-learn
+            puts its thresholds, so the float64 values in bigquery split the same."""
+    feature = np.asarray(feature)
+    result = np.array(threshold, dtype='float64')
+    for node in np.flatnonzero(feature >= 0):
+        edge = np.asarray(edges[feature[node]], dtype=np.float32)
+        code = int(np.floor(result[node]))
+        if code < len(edge):
+            above = np.nextafter(edge[code], np.float32(np.inf))
+            result[node] = (float(edge[code])+float(above))/2
+        else:
+            result[node] = np.inf
+    return result
@@ -0,0 +1,161 @@
+"""This module contains the command line of the univariate and decision tree
+workflows, profile to profile the columns of a table with univariate.test_func and
+train to train the decision tree of a table with decision_tree.decision_tree, on
+bigquery or, with --backend duckdb, on parquet files with the local stand-in of
+local_bigquery.
+Nothing but argparse is imported before the arguments are read, the client is made
+in the background while the workflow module and pandas are imported, so the first
+query is sent as soon as the two are there. --timing gives the cold start, the
+seconds from the launch of the process to the first query handed to the backend.
+Usage: python cli.py profile project table --columns totals_hits device_browser
+       python cli.py train project table --backend duckdb --table project.table=sessions.parquet"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+#the time this module was imported at, the launch time where /proc is not there.
+_IMPORTED = time.time()
+#the wall times of the steps of the cold start.
+marks = {}
+def launch_time():
+    """This function gives the wall time the process was launched at.
+    Result: The time from /proc on linux, to the 10 milliseconds of the clock ticks,
+            or the time this module was imported at elsewhere."""
+    try:
+        with open('/proc/self/stat') as stat_file:
+            #the fields after the name of the command, which can hold spaces.
+            fields = stat_file.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        return time.time()-uptime+int(fields[19])/os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return _IMPORTED
+def _tables(values):
+    """Turns the project.table=path arguments into the tables of the local stand-in."""
+    tables = {}
+    for i in values or []:
+        name, _, path = i.partition('=')
+        project_name, _, table_name = name.partition('.')
+        if not (path and project_name and table_name):
+            raise ValueError("A table is given as project.table=path, not {value}".format(
+                value=i))
+        tables[(project_name, table_name)] = path
+    return tables
+def _warm_client(executor):
+    """Makes the client of the executor, importing the bigquery library or DuckDB."""
+    try:
+        executor.client
+    except Exception:
+        #the first query makes the client again and raises the error where it is seen.
+        pass
+def _columns(arguments):
+    """Gives the columns of the command, all the columns of the table if none are given."""
+    if arguments.columns:
+        return arguments.columns
+    import schema_catalog
+    return list(schema_catalog.get_catalog(arguments.project, arguments.table).types)
+def profile(arguments):
+    """Profiles the columns of a table, printing the univariate outputs."""
+    import univariate
+    marks['imported'] = time.time()
+    univariate.test_func(_columns(arguments), arguments.project, arguments.table,
+                         arguments.terms, arguments.buckets)
+def train(arguments):
+    """Trains the decision tree of a table, exporting the best tree for scoring."""
+    import decision_tree
+    marks['imported'] = time.time()
+    result = decision_tree.decision_tree(
+        _columns(arguments), arguments.project, arguments.table, arguments.threshold,
+        arguments.cat_threshold, sparse=not arguments.dense,
+        search_strategy=arguments.search_strategy, n_jobs=arguments.n_jobs,
+        model_directory=arguments.model_directory,
+        feature_directory=arguments.feature_directory, encoding=arguments.encoding,
+        bins=arguments.bins, batch_size=arguments.batch_size, timezone=arguments.timezone,
+        calendar=arguments.calendar)
+    print(json.dumps(result, default=str))
+def cold_start(recorder):
+    """This function gives the cold start of the run.
+    Parameters required:a.)recorder: The tracing.TraceRecorder of the run.
+    Result: A dictionary with the seconds from the launch of the process to the start
+            of the command line, the import of the workflow module and the first
+            query handed to the backend, None for the steps which did not happen."""
+    submitted = [i['submitted'] for i in recorder.events
+                 if i['type'] == 'query' and i.get('submitted') is not None]
+    launched = marks['launched']
+    result = {}
+    for name, value in (('startup', marks.get('started')), ('imports', marks.get('imported')),
+                        ('first_query', min(submitted) if submitted else None)):
+        result[name] = value-launched if value is not None else None
+    return result
+def parser():
+    """Gives the argument parser of the command line."""
+    parser = argparse.ArgumentParser(description="Profile and train on a bigquery table.")
+    parser.add_argument('--backend', default='bigquery', choices=('bigquery', 'duckdb'))
+    parser.add_argument('--table', action='append', dest='tables', metavar='PROJECT.TABLE=PATH',
+                        help="A parquet file queried as PROJECT.TABLE by the duckdb backend.")
+    parser.add_argument('--max-concurrency', type=int, default=8)
+    parser.add_argument('--cache', help="The directory of the query result cache.")
+    parser.add_argument('--trace', help="The trace event JSON file of the queries.")
+    parser.add_argument('--timing', action='store_true',
+                        help="Print the cold start as JSON to stderr.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, function in (('profile', profile), ('train', train)):
+        command = commands.add_parser(name, help=function.__doc__)
+        command.set_defaults(function=function)
+        command.add_argument('project')
+        command.add_argument('table')
+        command.add_argument('--columns', nargs='+',
+                             help="The columns, all the columns of the table if not given.")
+    profile_command = commands.choices['profile']
+    profile_command.add_argument('--terms', type=int, default=10)
+    profile_command.add_argument('--buckets', type=int, default=10)
+    train_command = commands.choices['train']
+    train_command.add_argument('--threshold', type=float, default=80)
+    train_command.add_argument('--cat-threshold', type=int, default=10)
+    train_command.add_argument('--dense', action='store_true')
+    train_command.add_argument('--search-strategy', default='grid', choices=('grid', 'halving'))
+    train_command.add_argument('--n-jobs', type=int, default=-1)
+    train_command.add_argument('--model-directory', default='finalized_model')
+    train_command.add_argument('--feature-directory')
+    train_command.add_argument('--encoding', default='pandas', choices=('pandas', 'sql', 'stream'))
+    train_command.add_argument('--bins', type=int)
+    train_command.add_argument('--batch-size', type=int, default=100000)
+    train_command.add_argument('--timezone',
+                               help="The timezone of the time columns, UTC if not given.")
+    train_command.add_argument('--calendar', action='store_true',
+                               help="Add the month, is_weekend and part_day time columns.")
+    return parser
+def main(arguments=None):
+    """Runs a command from the command line."""
+    marks['launched'] = launch_time()
+    marks['started'] = _IMPORTED
+    arguments = parser().parse_args(arguments)
+    import query_executor
+    query_executor.use_backend(arguments.backend, _tables(arguments.tables),
+                               max_concurrency=arguments.max_concurrency)
+    executor = query_executor.get_executor()
+    if arguments.cache:
+        import query_cache
+        query_cache.enable_cache(arguments.cache)
+    #the client is made while the workflow imports pandas, the two being the most
+    #of the time before the first query.
+    warming = threading.Thread(target=_warm_client, args=(executor,), daemon=True)
+    warming.start()
+    if not (arguments.trace or arguments.timing):
+        arguments.function(arguments)
+        return
+    import tracing
+    #the queries are only recorded when they are traced or timed.
+    with tracing.record(arguments.trace, queries=bool(arguments.trace)) as recorder:
+        try:
+            arguments.function(arguments)
+        finally:
+            if arguments.timing:
+                timing = dict(cold_start(recorder), command=arguments.command,
+                              backend=arguments.backend)
+                print("cold start: {timing}".format(timing=json.dumps(timing)),
+                      file=sys.stderr)
+if __name__ == "__main__":
+    main()
@@ -3,24 +3,23 @@
 best hyperparameters using grid search cross validation
 and outputs the precision-recall and accuracy score in the end.."""
 import datetime
-import pickle
-from google.cloud import bigquery
-import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.model_selection import GridSearchCV
-from sklearn import metrics
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.metrics import confusion_matrix
-from sklearn.metrics import classification_report
-def main_func(query_passed):
+#pandas, numpy and the modules of the training are imported by the functions using
+#them, so the first queries of a run are not kept waiting for their imports.
+import query_executor
+import schema_catalog
+import tracing
+def main_func(query_passed, arrow=False):
     """ This function takes the query as the parameter and runs
     it on bigquery to generate a table which is
     then converted to dataframe.
     Parameters:
         a.)query_passed:The query which is to be run on bigquery.
+        b.)arrow:Whether to return the pyarrow.Table the result is downloaded
+                as, without converting it, see query_executor.arrow_frame.
     Result:The table generated by the query will be converted to a dataframe."""
-    client = bigquery.Client()
-    data = client.query(query_passed).to_dataframe()
+    if arrow:
+        return query_executor.run_arrow(query_passed)
+    data = query_executor.run_query(query_passed)
     return data
 def count_coverage(column_name, project_name, table_name, threshold):
     """This function calculates count and coverage for a categorical column.
@@ -70,9 +69,10 @@ def main_dt_list(column_list, project_name, table_name, threshold):
             of its values greater than the threshold."""
     #the list for final dataset generation.
     final_columns = []
-    for i in column_list:
-        #passing the value to count_coverage function.
-        data = count_coverage(i, project_name, table_name, threshold)
+    #the count_coverage queries of all the columns are run concurrently.
+    coverages = query_executor.map_columns(
+        count_coverage, column_list, project_name, table_name, threshold)
+    for i, data in zip(column_list, coverages):
         #returned dataframe contains values which has
         #coverage over the threshold limit.
         if data.empty:
@@ -85,11 +85,286 @@ def main_dt_list(column_list, project_name, table_name, threshold):
             #column_list even if it crosses the threshold.
             final_columns.append(i)
     return final_columns
+def fill_values(column_list, project_name, table_name):
+    """This function finds the value with which the null values of every column
+    are to be filled, computing the null coverage, median and mode of all the
+    columns inside bigquery with a single query.
+    Parameters required:a)column_list:All the names of the columns
+                        for which the fill value is to be found.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+    Result: A dictionary with the column names and their fill values, None for the
+            columns with no null values. Numeric columns with null coverage up to 10
+            are filled with the median and others with -9999999999, categorical
+            columns with the mode and "not set" the same way."""
+    catalog = schema_catalog.get_catalog(project_name, table_name)
+    numeric_columns = catalog.numeric_columns(column_list)
+    string_columns = catalog.string_columns(column_list)
+    if not numeric_columns and not string_columns:
+        return {}
+    select = []
+    for i in numeric_columns:
+        select.append("""COUNTIF({col_name} IS NULL)*100/COUNT(*) as {col_name}__null_coverage,
+            APPROX_QUANTILES(SAFE_CAST({col_name} AS FLOAT64), 100)[OFFSET(50)] as {col_name}__median""".format(
+                col_name=i))
+    for i in string_columns:
+        #two values are asked for since null itself can be the most frequent one.
+        select.append("""COUNTIF({col_name} IS NULL)*100/COUNT(*) as {col_name}__null_coverage,
+            APPROX_TOP_COUNT({col_name}, 2) as {col_name}__top""".format(col_name=i))
+    query = """SELECT {select}
+            FROM {project_name}.{table_name}""".format(
+                select=",\n            ".join(select), project_name=project_name,
+                table_name=table_name)
+    data = main_func(query).iloc[0]
+    result = {}
+    for i in numeric_columns:
+        if data[i+'__null_coverage'] == 0:
+            result[i] = None
+        elif data[i+'__null_coverage'] <= 10:
+            result[i] = float(data[i+'__median'])
+        else:
+            result[i] = -9999999999
+    for i in string_columns:
+        if data[i+'__null_coverage'] == 0:
+            result[i] = None
+        elif data[i+'__null_coverage'] <= 10:
+            result[i] = [j['value'] for j in data[i+'__top'] if j['value'] is not None][0]
+        else:
+            result[i] = "not set"
+    return result
+def build_dataset(column_list, project_name, table_name, values=None):
+    """This function extracts all the columns with their null values filled in
+    a single result set, so the columns are always aligned row by row.
+    Parameters required:a)column_list:All the names of the columns
+                        that you want to consider for dataset generation.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)values: The fill values from fill_values, found with
+                        fill_values if not passed.
+    Result: A dataframe with all the columns asked with no null values, the
+            categorical columns as pandas Categorical."""
+    if values is None:
+        values = fill_values(column_list, project_name, table_name)
+    #the strings are kept dictionary encoded from the download to the one hot encoding.
+    result = query_executor.arrow_frame(main_func(
+        dataset_query(column_list, project_name, table_name, values), arrow=True))
+    return result
+def dataset_query(column_list, project_name, table_name, values):
+    """This function writes the query selecting the columns with their
+    null values filled.
+    Parameters required:a)column_list:All the names of the columns to be selected.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)values: The fill values from fill_values.
+    Result: The query as a string."""
+    select = []
+    for i in column_list:
+        value = values.get(i)
+        if value is None:
+            select.append(i)
+        elif isinstance(value, str):
+            select.append("IFNULL({col_name}, {value}) as {col_name}".format(
+                col_name=i, value=_string_literal(value)))
+        else:
+            select.append("IFNULL(SAFE_CAST({col_name} AS FLOAT64), {value}) as {col_name}".format(
+                col_name=i, value=repr(float(value))))
+    query = """SELECT {select}
+            FROM {project_name}.{table_name}""".format(
+                select=", ".join(select), project_name=project_name, table_name=table_name)
+    return query
+def encoded_query(state, project_name, table_name):
+    """This function writes the query giving the one hot encoded dataset of a
+    preprocessing state, the null values filled, the values not kept grouped into
+    'Others' and the one hot columns written as booleans inside bigquery.
+    Parameters required:a.)state: The preprocessing state.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+    Result: The query as a string, with the features as f0, f1, ... in the order of
+            state['feature_names'] and the label column."""
+    import tree_sql
+    select = []
+    for position, (i, value) in enumerate(tree_sql._features(state)):
+        if value is None:
+            column = tree_sql._column_sql(i, state)
+        else:
+            column = tree_sql._indicator_sql(i, value, state)
+        select.append("{column} as f{position}".format(column=column, position=position))
+    if 'label' in state['columns']:
+        label = 'label' if state['fill_values'].get('label') is None else \
+            tree_sql._column_sql('label', state)
+        select.append("{column} as label".format(column=label))
+    query = """SELECT {select}
+            FROM {project_name}.{table_name}""".format(
+                select=",\n            ".join(select), project_name=project_name,
+                table_name=table_name)
+    return query
+def build_matrix(state, project_name, table_name, sparse=False):
+    """This function extracts the feature matrix of a preprocessing state ready for
+    training, the encoding being done by encoded_query, so only the numeric columns
+    and one boolean column for every kept value are downloaded instead of the strings.
+    Parameters required:a.)state: The preprocessing state.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)sparse: Whether to give the matrix as a scipy CSR matrix.
+    Result: A tuple with the float32 feature matrix, in the order of
+            state['feature_names'], and the label values, the same as
+            preprocessing.transform gives."""
+    import numpy as np
+    #the columns are read from the arrow table straight into the matrix.
+    data = main_func(encoded_query(state, project_name, table_name), arrow=True)
+    columns = ["f{position}".format(position=i) for i in range(len(state['feature_names']))]
+    matrix = np.zeros((len(data), len(columns)), dtype=np.float32)
+    for position, i in enumerate(columns):
+        matrix[:, position] = data.column(i).to_numpy()
+    label = data.column('label').to_numpy() if 'label' in data.column_names else None
+    if sparse:
+        from scipy.sparse import csr_matrix
+        matrix = csr_matrix(matrix)
+    return matrix, label
+def top_categories(column_list, project_name, table_name, cat_threshold, values=None):
+    """This function finds the values kept by grouping for all the categorical columns
+    with a single query, counting the values after the null values are filled.
+    Parameters required:a)column_list:All the names of the columns
+                        that you want to consider for dataset generation.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)cat_threshold: The number of values after which every value
+                        will be considered under 'Others'
+                        e.)values: The fill values from fill_values, found with
+                        fill_values if not passed.
+    Result: A dictionary with the categorical column names and the sorted list of
+            their values, with 'Others' added for the columns that are grouped."""
+    catalog = schema_catalog.get_catalog(project_name, table_name)
+    string_columns = catalog.string_columns(column_list)
+    if not string_columns:
+        return {}
+    if values is None:
+        values = fill_values(string_columns, project_name, table_name)
+    structs = []
+    for i in string_columns:
+        value = i if values.get(i) is None else "IFNULL({col_name}, {value})".format(
+            col_name=i, value=_string_literal(values[i]))
+        structs.append("STRUCT('{col_name}' AS name, {value} AS value)".format(
+            col_name=i, value=value))
+    #RANK keeps the values tied with the value at the threshold
+    #the same way as the count comparison in grouping.
+    query = """With table as(
+            SELECT f.name as name, f.value as value, Count(*) as Count
+            FROM {project_name}.{table_name}, UNNEST([{structs}]) as f
+            Group by name, value),
+            table_2 as(
+            SELECT *, COUNT(*) OVER (PARTITION BY name) as distinct_values,
+            RANK() OVER (PARTITION BY name ORDER BY Count DESC) as rank
+            FROM table)
+            Select name, value, distinct_values from table_2
+            WHERE rank<={cat_threshold};""".format(
+                structs=",\n            ".join(structs), cat_threshold=str(cat_threshold),
+                project_name=project_name, table_name=table_name)
+    data = main_func(query)
+    result = {}
+    for i in string_columns:
+        column = data[data['name'] == i]
+        kept = sorted(column['value'].dropna())
+        if len(column) and column['distinct_values'].iloc[0] > len(kept):
+            kept = sorted(kept+["Others"])
+        result[i] = kept
+    return result
+def screen_columns(column_list, project_name, table_name, threshold, cat_threshold):
+    """This function does the screening of main_dt_list and finds the values kept by
+    top_categories in the same single scan of the table, counting the values of all
+    the columns at once and keeping only the most frequent ones of every column.
+    Parameters required:a)column_list:All the names of the columns
+                        that you want to consider for dataset generation.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)threshold: amount of null values in a column
+                        that can be tolerated in percentage.
+                        e.)cat_threshold: The number of values after which every value
+                        will be considered under 'Others'
+    Result: A tuple with the list of columns main_dt_list gives, the fill values
+            fill_values gives for them and the categories top_categories gives.
+            The median of the numeric columns with a few null values is found with
+            fill_values, which is the only other query."""
+    catalog = schema_catalog.get_catalog(project_name, table_name)
+    numeric_columns = catalog.numeric_columns(column_list)
+    string_columns = catalog.string_columns(column_list)
+    structs = []
+    for i in column_list:
+        structs.append("STRUCT('{col_name}' AS name, CAST({col_name} AS STRING) AS value, "
+                       "{categorical} AS categorical)".format(
+                           col_name=i, categorical=str(i in string_columns).upper()))
+    #the null values are ranked apart so that the most frequent value is the mode
+    #of fill_values, and "not set" is always kept since filling can add to it.
+    query = """With table as(
+            SELECT f.name as name, f.value as value, f.categorical as categorical,
+            Count(*) as Count
+            FROM {project_name}.{table_name}, UNNEST([{structs}]) as f
+            Group by name, value, categorical),
+            table_2 as(
+            SELECT *, Count*100/SUM(Count) OVER (PARTITION BY name) as Coverage,
+            COUNT(value) OVER (PARTITION BY name) as distinct_values,
+            RANK() OVER (PARTITION BY name, value IS NULL ORDER BY Count DESC) as rank
+            FROM table)
+            Select name, value, Count, Coverage, distinct_values, rank from table_2
+            WHERE value IS NULL OR rank=1 OR (categorical AND (rank<={cat_threshold}
+            OR value="not set"));""".format(
+                structs=",\n            ".join(structs), cat_threshold=str(cat_threshold),
+                project_name=project_name, table_name=table_name)
+    data = main_func(query)
+    col_list = []
+    for i in column_list:
+        column = data[data['name'] == i]
+        #a column is kept when none of its values has coverage over the threshold.
+        if not (column['Coverage'] > threshold).any() or i == "label":
+            col_list.append(i)
+    #visitStartTime is only used for the time columns, so it is not filled.
+    fill_columns = [i for i in col_list if i != 'visitStartTime' and
+                    (i in numeric_columns or i in string_columns)]
+    values, categories, median_columns = {}, {}, []
+    for i in fill_columns:
+        column = data[data['name'] == i]
+        null_coverage_ = column.loc[column['value'].isna(), 'Coverage'].sum()
+        if null_coverage_ == 0:
+            values[i] = None
+        elif i in numeric_columns:
+            values[i] = -9999999999
+            if null_coverage_ <= 10:
+                median_columns.append(i)
+        elif null_coverage_ <= 10:
+            values[i] = column.loc[column['value'].notna()].sort_values(
+                'rank')['value'].iloc[0]
+        else:
+            values[i] = "not set"
+        if i in string_columns:
+            categories[i] = _kept_values(column, values[i], cat_threshold)
+    if median_columns:
+        values.update(fill_values(median_columns, project_name, table_name))
+    return col_list, values, categories
+def _kept_values(column, value, cat_threshold):
+    """Gives the values top_categories keeps for a column from the counts of its
+    most frequent values, after the null values are filled with value."""
+    import pandas as pd
+    counts = dict(zip(column.loc[column['value'].notna(), 'value'],
+                      column.loc[column['value'].notna(), 'Count']))
+    distinct_values = int(column['distinct_values'].iloc[0]) if len(column) else 0
+    if value is not None:
+        if value not in counts:
+            distinct_values += 1
+        counts[value] = counts.get(value, 0)+int(column.loc[column['value'].isna(), 'Count'].sum())
+    #the same RANK as top_categories, the values tied at the threshold are kept.
+    ranks = pd.Series(counts, dtype='float64').rank(method='min', ascending=False)
+    kept = sorted(ranks[ranks <= cat_threshold].index)
+    if distinct_values > len(kept):
+        kept = sorted(kept+["Others"])
+    return kept
+def _string_literal(value):
+    """Writes a python string as a bigquery string literal."""
+    return '"{value}"'.format(value=value.replace('\\', '\\\\').replace('"', '\\"'))
 def null_fill(column_list, project_name, table_name, threshold):
     """This function is used to administer the process of
-    filling null values after findind whether a column
-    is string or numeric and directs them to their particular
-    null fill functions.
+    filling null values of the columns kept by main_dt_list,
+    using the median or mode for numeric or string columns
+    the same way as numeric_na_fill and categorical_na_fill.
     Parameters required:a)column_list:All the names of the columns
                         that you want to consider for dataset generation.
                         b.)project_name: The project name in which the table is located
@@ -99,32 +374,14 @@ def null_fill(column_list, project_name, table_name, threshold):
     Result: A dataframe with all the columns asked alongwith additional time columns
             with no null values."""
     col_list = main_dt_list(column_list, project_name, table_name, threshold)
-    # creation of an empty dataframe with all
-    #the final column list values.
-    result = pd.DataFrame(columns=col_list)
-    for i in col_list:
-        #query to check the column datatype.
-        query = """WITH column_numeric as(
-                    SELECT DATA_TYPE,COLUMN_NAME FROM {project_name}.INFORMATION_SCHEMA.COLUMNS 
-                    WHERE table_name="{table_name}")
-                    Select DATA_TYPE FROM column_numeric 
-                    WHERE COLUMN_NAME='{col_name}'""".format(
-                        project_name=project_name, table_name=table_name, col_name=i)
-        data = main_func(query)
-        #checks whether the datatype is string or Integer or float.
-        if (data.iloc[0, 0] == "INT64") or (data.iloc[0, 0] == "FLOAT64"):
-            data = numeric_na_fill(i, project_name, table_name)
-        elif (data.iloc[0, 0] == "STRING"):
-            data = categorical_na_fill(i, project_name, table_name)
-        #inserts the data after filling of null values
-        #in the same column_value in the empty dataframe
-        #that we formed earlier in this function.a
-        result[i] = data[i]
+    #the fill values of all the columns are found together and the columns
+    #are extracted with a single query so that their rows stay aligned.
+    result = build_dataset(col_list, project_name, table_name)
     # passes to time_data function for breaking down utc format
     # to hours,months,day of week, week of year.
     final_result = time_data(result, project_name, table_name)
     return final_result
-def time_data(data, project_name, table_name):
+def time_data(data, project_name, table_name, timezone=None, calendar=False):
     """This function checks the presence of visitStartTime column
     and if it is present, it divides the column into hour, week_day,
     week_year and day_month, else just returns the passed value if the
@@ -134,30 +391,19 @@ def time_data(data, project_name, table_name):
                         b.)project_name: The project name in which
                         the table is located
                         c.)table_name: Name of the table.
+                        d.)timezone: The timezone the time columns are given in, UTC
+                        if not passed.
+                        e.)calendar: Whether to add the month, is_weekend and
+                        part_day columns too.
     Result: Data with added time columns if visitStartTime was there in the passed dataset."""
+    import pandas as pd
+    import features
     #checks whether the visitStartTime column is present in the dataset.
     if 'visitStartTime' in data.columns:
-        query = """SELECT
-                    FORMAT_TIMESTAMP('%A',dt_format) AS week_day,
-                    FORMAT_TIMESTAMP('%H',dt_format) AS hour,
-                    FORMAT_TIMESTAMP('%W',dt_format) AS week_year,
-                    FORMAT_TIMESTAMP('%e',dt_format) AS day_month
-                    FROM (
-                        SELECT
-                            TIMESTAMP_SECONDS(visitStartTime) AS dt_format
-                        FROM
-                            {project_name}.{table_name})
-                    """.format(project_name=project_name, table_name=table_name)
-        data_dt = main_func(query)
-        data_dt[["hour", "week_year", "day_month"]] = data_dt[["hour", "week_year", "day_month"]].apply(
-            pd.to_numeric)
-        #since the new generated columns may have null values
-        #as they were formed after the null_value filling process
-        #so these steps are used to fill the null values .
-        #the new generated columns are combined with the
-        #passed dataset.
+        #the time columns are made from the visitStartTime already downloaded
+        #instead of scanning the table again, so the rows are aligned as well.
+        data_dt = features.time_features(data['visitStartTime'], timezone, calendar)
         data = data.reset_index(drop=True)
-        data_dt = data_dt.reset_index(drop=True)
         final_data = pd.concat([data, data_dt], axis=1)
         #to avoid redundancy we drop the visitStartTime column.
         final_data = final_data.drop(["visitStartTime"], axis=1)
@@ -249,21 +495,21 @@ def categorical_na_fill(column_name, project_name, table_name):
         result = main_func(query_final)
     #in case of null value of less than 10% coverage.
     else:
-        if data['Coverage'].iloc[0].values[0] <= 10:
+        if data['Coverage'].iloc[0] <= 10:
             query_final = """Select IFNULL({col_name},"{value}") {col_name}
             FROM (SELECT {col_name} FROM {project_name}.{table_name})""".format(
-                col_name=column_name, value=str(col_data.mode().values[0]),
+                col_name=column_name, value=str(col_data[column_name].mode()[0]),
                 project_name=project_name, table_name=table_name)
             result = main_func(query_final)
         #in case of null value of more than 10% coverage.
-        if data['Coverage'].iloc[0].values[0] > 10:
+        if data['Coverage'].iloc[0] > 10:
             query_final = """Select IFNULL({col_name},"{value}") {col_name}
             FROM (SELECT {col_name} FROM {project_name}.{table_name})""".format(
                 col_name=column_name, value="not set",
                 project_name=project_name, table_name=table_name)
             result = main_func(query_final)
     return result
-def grouping(columns, project_name, table_name, threshold, cat_threshold):
+def grouping(columns, project_name, table_name, threshold, cat_threshold, sparse=False):
     """This function takes all the categorical columns and checks
     whether the number of unique values in that column are more than
     a certain threshold,if it is more,then it categorizes all the values
@@ -274,35 +520,97 @@ def grouping(columns, project_name, table_name, threshold, cat_threshold):
                         c.)table_name: Name of the table.
                         d.)cat_threshold: The number of values after which every value
                         will be considered under 'Others
+                        e.)sparse: Whether to give the one hot encoded data as a
+                        scipy CSR matrix instead of a dataframe.
     Result: A multi columnar dataframe with all categorical columns with max (threshold+1)
-            unique values."""
+            unique values, or if sparse is set, the tuple given by sparse_matrix."""
+    import pandas as pd
     #formation of dataset with null value filling.
     answer = null_fill(columns, project_name, table_name, threshold)
-    for i in columns:
-        query = """WITH column_numeric as(
-                    SELECT DATA_TYPE,COLUMN_NAME FROM {project_name}.INFORMATION_SCHEMA.COLUMNS 
-                    WHERE table_name="{table_name}")
-                    Select DATA_TYPE FROM column_numeric 
-                    WHERE COLUMN_NAME='{col_name}'""".format(
-                        project_name=project_name, table_name=table_name, col_name=i)
-        data = main_func(query)
-        #checks whether any passed column is of categorical type.
-        if (data.iloc[0, 0] == "STRING"):
-            #checks whether the number of unique columns in a
-            # categorical column is more than the threshold.
-            if answer[i].nunique() > cat_threshold:
-                #takes the count of for the threshold value.
-                count = answer[i].value_counts()[0:cat_threshold].to_frame().reset_index(drop=True).iloc[-1, :].values[0]
-                #all the counts for different values of the column.
-                column_count = answer[i].value_counts()
-                #column values whose count is lesser than the threshold value count.
-                column_values = answer[i].isin(column_count.index[column_count < count])
-                #replaces the values whose count is lesser than a certain limit.
-                answer.loc[column_values, i] = "Others"
+    with tracing.stage('grouping', rows=len(answer)):
+        answer = _group_categories(answer, columns, project_name, table_name, cat_threshold)
+    if sparse:
+        with tracing.stage('sparse_matrix', rows=len(answer)):
+            return sparse_matrix(answer)
     #one-hot encoding of the dataset.
-    result = pd.get_dummies(answer)
+    with tracing.stage('get_dummies', rows=len(answer)):
+        result = pd.get_dummies(answer)
     return result
-def decision_tree(column_list, project_name, table_name, threshold=80, cat_threshold=10):
+def _group_categories(answer, columns, project_name, table_name, cat_threshold):
+    """Groups the values past cat_threshold of the categorical columns into Others."""
+    import numpy as np
+    import pandas as pd
+    catalog = schema_catalog.get_catalog(project_name, table_name)
+    #only the categorical columns left in the dataset are grouped.
+    for i in catalog.string_columns([j for j in columns if j in answer.columns]):
+        #the categories are sorted the same way pd.get_dummies sorts the values.
+        column = answer[i].astype('category')
+        codes = column.cat.codes.to_numpy()
+        #checks whether the number of unique columns in a
+        # categorical column is more than the threshold.
+        if len(column.cat.categories) > cat_threshold:
+            #counts of every category from the integer codes.
+            counts = np.bincount(codes[codes >= 0], minlength=len(column.cat.categories))
+            #takes the count of for the threshold value.
+            count = np.sort(counts)[::-1][cat_threshold-1]
+            kept = column.cat.categories[counts >= count]
+            if len(kept) < len(column.cat.categories):
+                #categories whose count is lesser than the threshold value count
+                #are mapped to the code of Others instead of replacing the strings.
+                categories = sorted(set(kept) | {"Others"})
+                lookup = np.array([categories.index(j) if j in kept else categories.index("Others")
+                                   for j in column.cat.categories])
+                codes = np.where(codes >= 0, lookup[codes], -1)
+                column = pd.Categorical.from_codes(codes, categories=categories)
+        answer[i] = column
+    if 'week_day' in answer.columns:
+        answer['week_day'] = answer['week_day'].astype('category')
+    return answer
+def sparse_matrix(data, label='label'):
+    """This function one hot encodes the categorical columns of the dataset
+    straight into a scipy CSR matrix from their category codes.
+    Parameters required:a.)data: The dataset with the categorical columns as
+                        pandas Categorical and the other columns numeric.
+                        b.)label: Name of the label column, which is kept out of the matrix.
+    Result: A tuple with the CSR matrix, the label values(None if the label is not
+            present), the feature names in the same order as pd.get_dummies gives
+            them, and a dictionary with the categories of every categorical column."""
+    import numpy as np
+    import pandas as pd
+    from scipy.sparse import csr_matrix
+    numeric = [i for i in data.columns
+               if i != label and not isinstance(data[i].dtype, pd.CategoricalDtype)]
+    encoded = [i for i in data.columns if isinstance(data[i].dtype, pd.CategoricalDtype)]
+    rows, cols, values = [], [], []
+    for position, i in enumerate(numeric):
+        column = data[i].to_numpy(dtype='float64', na_value=np.nan)
+        nonzero = np.flatnonzero(column != 0)
+        rows.append(nonzero)
+        cols.append(np.full(len(nonzero), position))
+        values.append(column[nonzero])
+    position = len(numeric)
+    names = list(numeric)
+    categories = {}
+    for i in encoded:
+        codes = data[i].cat.codes.to_numpy()
+        present = np.flatnonzero(codes >= 0)
+        rows.append(present)
+        cols.append(position+codes[present])
+        values.append(np.ones(len(present)))
+        categories[i] = list(data[i].cat.categories)
+        names.extend("{col_name}_{value}".format(col_name=i, value=j) for j in categories[i])
+        position += len(categories[i])
+    matrix = csr_matrix(
+        (np.concatenate(values) if values else np.zeros(0),
+         (np.concatenate(rows) if rows else np.zeros(0, dtype=int),
+          np.concatenate(cols) if cols else np.zeros(0, dtype=int))),
+        shape=(len(data), position), dtype=np.float32)
+    labels = data[label].to_numpy() if label in data.columns else None
+    return matrix, labels, names, categories
+def decision_tree(column_list, project_name, table_name, threshold=80, cat_threshold=10,
+                  sparse=True, param_grid=None, search_strategy='grid', n_jobs=-1,
+                  model_directory='finalized_model', feature_directory=None, encoding='pandas',
+                  bins=None, batch_size=100000, timezone=None, calendar=False):
     """This function helps in generation of the decision tree
     automatically and provides the user with values like precision,
     accuracy,recall,f1-score.
@@ -314,22 +622,103 @@ def decision_tree(column_list, project_name, table_name, threshold=80, cat_thres
                         tolerated in percentage.
                         e.) cat_threshold: number of values above which any value
                         in the categorical column will be considered as "Others"
+                        f.)sparse: Whether to train on the sparse one hot encoded matrix.
+                        g.)param_grid: The hyperparameters to search,
+                        model_search.PARAM_GRID if not passed.
+                        h.)search_strategy: 'grid' or 'halving', see model_search.search.
+                        i.)n_jobs: The number of worker processes used by the search.
+                        j.)model_directory: The directory the best tree is exported to
+                        with its preprocessing state, see scoring.load_model.
+                        k.)feature_directory: The directory of the manifests of the
+                        materialized feature tables, when passed the features are built
+                        in bigquery once and reused by the runs with the same table
+                        version and parameters, see feature_store.materialize.
+                        l.)encoding: 'pandas' to one hot encode the extracted strings,
+                        'sql' to screen the columns with one scan and download the
+                        matrix encoded inside bigquery, see build_matrix, or 'stream'
+                        to encode the rows batch by batch into the matrix, see
+                        streaming.extract_matrix.
+                        m.)bins: The number of quantile bins, at most 256, every
+                        feature is cut into before the search, which is then run on
+                        the uint8 bin codes, see binning.bin_matrix. None trains on
+                        the raw values.
+                        n.)batch_size: The number of rows encoded at a time with the
+                        'stream' encoding.
+                        o.)timezone: The timezone the time columns are made in, UTC
+                        if not passed, saved with the model for scoring.
+                        p.)calendar: Whether to add the month, is_weekend and part_day
+                        time columns too.
     Result:Accuracy rate,classification repor and confusion matrix will be formed
-            on the basis of the decision tree generated."""
-    data = grouping(column_list, project_name, table_name, threshold, cat_threshold)
-    train = data.drop(['label'], axis=1)
-    train_label = data['label']
+            on the basis of the decision tree generated, and returned alongwith the
+            best parameters, best score and model directory as a dictionary."""
+    import binning
+    import feature_store
+    import preprocessing
+    import scoring
+    #the dataset is encoded with a fitted preprocessing state, the same columns as
+    #grouping gives, so that the state can be saved with the model for scoring.
+    if encoding not in ('pandas', 'sql', 'stream'):
+        raise ValueError("Unknown encoding {encoding}".format(encoding=encoding))
+    if encoding == 'sql' and feature_directory is None:
+        with tracing.stage('preprocessing.fit'):
+            state = preprocessing.fit(column_list, project_name, table_name, threshold,
+                                      cat_threshold, single_pass=True, timezone=timezone,
+                                      calendar=calendar)
+        with tracing.stage('build_matrix', sparse=sparse):
+            train, train_label = build_matrix(state, project_name, table_name, sparse)
+    elif encoding == 'stream' and feature_directory is None:
+        import streaming
+        with tracing.stage('preprocessing.fit'):
+            state = preprocessing.fit(column_list, project_name, table_name, threshold,
+                                      cat_threshold, single_pass=True, timezone=timezone,
+                                      calendar=calendar)
+        #the memory used by the extraction depends on batch_size, not on the table.
+        with tracing.stage('extract_matrix', batch_size=batch_size, sparse=sparse):
+            train, train_label, _ = streaming.extract_matrix(state, project_name, table_name,
+                                                             batch_size)
+            if sparse:
+                from scipy.sparse import csr_matrix
+                train = csr_matrix(train)
+    else:
+        if feature_directory is not None:
+            with tracing.stage('feature_store.materialize'):
+                data, state = feature_store.materialize(
+                    column_list, project_name, table_name, threshold, cat_threshold,
+                    feature_directory, timezone=timezone, calendar=calendar)
+        else:
+            with tracing.stage('preprocessing.fit'):
+                state = preprocessing.fit(column_list, project_name, table_name, threshold,
+                                          cat_threshold, timezone=timezone, calendar=calendar)
+            with tracing.stage('build_dataset'):
+                data = build_dataset(state['columns'], project_name, table_name,
+                                     state['fill_values'])
+        with tracing.stage('transform', rows=len(data), sparse=sparse):
+            if sparse:
+                train, train_label = preprocessing.transform_sparse(data, state)
+            else:
+                train, train_label = preprocessing.transform(data, state)
+    bin_edges = None
+    if bins is not None:
+        #the edges of all the features are found with one scan of the table.
+        with tracing.stage('binning', bins=bins):
+            bin_edges = binning.fit_edges(state, project_name, table_name, bins)
+            train = binning.bin_matrix(train, bin_edges)
+    #scikit-learn is only imported once the matrix is there, so the first queries
+    #of a run are not kept waiting for it.
+    from sklearn import metrics
+    from sklearn.metrics import classification_report
+    from sklearn.metrics import confusion_matrix
+    from sklearn.model_selection import train_test_split
+    import model_search
     x_train, x_test, y_train, y_test = train_test_split(
         train, train_label, test_size=0.3, random_state=0)
-    param_dist = {
-        'max_depth':[5, 20],
-        'min_samples_leaf':[5, 20]
-    }
-    tree = DecisionTreeClassifier()
-    tree_cv = GridSearchCV(tree, param_dist, cv=2)
-    tree_cv.fit(x_train, y_train)
+    #candidates and folds are fitted in parallel by the search.
+    tree_cv = model_search.search(x_train, y_train, param_grid, strategy=search_strategy,
+                                  cv=2, n_jobs=n_jobs)
     print('Tuned Decision Tree Parameters:{}'.format(tree_cv.best_params_))
     print('Best Score:{}'.format(tree_cv.best_score_))
+    #fit time of every candidate for tuning the search budget.
+    print(model_search.search_report(tree_cv))
     y_pred_class = tree_cv.predict(x_test)
     accuracy = metrics.accuracy_score(y_test, y_pred_class)
     print('Accuracy: {0:0.2f}'.format(
@@ -337,5 +726,9 @@ def decision_tree(column_list, project_name, table_name, threshold=80, cat_thres
     print(confusion_matrix(y_test, y_pred_class))
     classification_report_ = classification_report(y_test, y_pred_class, zero_division=1)
     print(classification_report_)
-    filename = 'finalized_model.sav'
-    pickle.dump(tree_cv, open(filename, 'wb'))
+    #only the best tree is kept, as node arrays that can be scored without scikit-learn.
+    scoring.export_model(tree_cv.best_estimator_, state, model_directory, tree_cv.best_params_,
+                         bin_edges)
+    return {'best_params': tree_cv.best_params_, 'best_score': float(tree_cv.best_score_),
+            'accuracy': float(accuracy), 'rows': int(train.shape[0]),
+            'features': int(train.shape[1]), 'model_directory': model_directory}
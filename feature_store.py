@@ -0,0 +1,214 @@
+"""This module contains the materialized feature table of decision_tree.
+The whole feature engineering, the screening of the columns, the null filling, the
+time columns and the grouping into 'Others', is written once into a table with a
+single CREATE TABLE AS SELECT, or into a parquet file with the local backend, keyed
+on a fingerprint of the version of the source table and the preprocessing
+parameters. A later run with the same fingerprint reads the ready features with
+one bulk download, or from the local copy of an earlier download without any
+query, alongwith the preprocessing state saved in the manifest."""
+import datetime
+import hashlib
+import json
+import os
+import pandas as pd
+import preprocessing
+import query_cache
+import query_executor
+import scoring
+import tree_sql
+#the version of the layout of the feature tables, a change makes new fingerprints.
+FEATURE_VERSION = 1
+def fingerprint(table_version, column_list, threshold, cat_threshold, timezone=None,
+                calendar=False):
+    """This function gives the fingerprint of a feature table.
+    Parameters required:a.)table_version: The version of the source table.
+                        b.)column_list: The columns asked for.
+                        c.)threshold: The null threshold of the screening.
+                        d.)cat_threshold: The number of values kept before 'Others'.
+                        e.)timezone: The timezone of the time columns.
+                        f.)calendar: Whether the calendar time columns are made.
+    Result: The fingerprint as a hex string."""
+    parameters = {'version': FEATURE_VERSION, 'table': table_version,
+                  'columns': list(column_list), 'threshold': threshold,
+                  'cat_threshold': cat_threshold}
+    #the time options are only added when they are set, so the tables built before
+    #they were there keep their fingerprints.
+    if timezone is not None or calendar:
+        parameters.update(timezone=timezone, calendar=bool(calendar))
+    text = json.dumps(parameters, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+def feature_query(state, project_name, table_name):
+    """This function writes the query giving the feature table of a preprocessing
+    state, the null values filled, the values not kept grouped into 'Others' and
+    the time columns made from visitStartTime.
+    Parameters required:a.)state: The preprocessing state.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+    Result: The query as a string."""
+    select = []
+    for i in state['columns']:
+        if i == 'visitStartTime':
+            continue
+        if i == 'label':
+            #the label keeps its own type, as in decision_tree.encoded_query, so the
+            #classes of the model are the same as without the feature table.
+            column = 'label' if state['fill_values'].get('label') is None else \
+                tree_sql._column_sql('label', state)
+        else:
+            column = tree_sql._column_sql(i, state)
+        categories = state['categories'].get(i, [])
+        if "Others" in categories:
+            kept = ", ".join(tree_sql._string_literal(str(j)) for j in categories
+                             if j != "Others")
+            column = 'IF(IFNULL({column} IN ({kept}), FALSE), {column}, "Others")'.format(
+                column=column, kept=kept)
+        select.append("{column} as {col_name}".format(column=column, col_name=i))
+    if state['time']:
+        select.extend("{column} as {col_name}".format(column=tree_sql._column_sql(i, state),
+                                                      col_name=i)
+                      for i in preprocessing.time_columns(state))
+    query = """SELECT {select}
+            FROM {project_name}.{table_name}""".format(
+                select=",\n            ".join(select), project_name=project_name,
+                table_name=table_name)
+    return query
+def _manifest_path(directory, key):
+    """Gives the manifest file of a fingerprint."""
+    return os.path.join(directory, key+".json")
+def _data_path(directory, key):
+    """Gives the local copy of the features of a fingerprint."""
+    return os.path.join(directory, key+".parquet")
+def _read_manifest(directory, key):
+    """Reads the manifest of a fingerprint, None if there is none."""
+    path = _manifest_path(directory, key)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+def _write_manifest(directory, key, manifest):
+    """Writes the manifest of a fingerprint, replacing the file at once."""
+    path = _manifest_path(directory, key)
+    with open(path+".tmp", 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, default=scoring._json_value)
+    os.replace(path+".tmp", path)
+def materialize(column_list, project_name, table_name, threshold=80, cat_threshold=10,
+                directory=".features", dataset=None, keep_local=True, expiration_days=None,
+                timezone=None, calendar=False):
+    """This function gives the feature table of decision_tree, building it in
+    bigquery only when no table with the same fingerprint was built before.
+    Parameters required:a)column_list:All the names of the columns
+                        that you want to consider for dataset generation.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)threshold: amount of null values in a column that can be
+                        tolerated in percentage.
+                        e.)cat_threshold: The number of values after which every value
+                        will be considered under 'Others'
+                        f.)directory: The directory of the manifests and local copies.
+                        g.)dataset: The dataset the feature table is written to,
+                        project_name if not passed.
+                        h.)keep_local: Whether to keep a parquet copy of the download,
+                        so the next run with the same fingerprint makes no query.
+                        i.)expiration_days: Days after which bigquery deletes the
+                        feature table, it is kept if not passed.
+                        j.)timezone: The timezone the time columns are made in.
+                        k.)calendar: Whether the calendar time columns are made too.
+    Result: A tuple with the feature dataframe and the preprocessing state."""
+    os.makedirs(directory, exist_ok=True)
+    source = "{project_name}.{table_name}".format(project_name=project_name,
+                                                  table_name=table_name)
+    version = query_cache.table_fingerprint(query_executor.get_executor().client, source)
+    key = fingerprint(version, column_list, threshold, cat_threshold, timezone, calendar)
+    manifest = _read_manifest(directory, key)
+    if manifest is not None and os.path.isfile(_data_path(directory, key)):
+        return pd.read_parquet(_data_path(directory, key)), manifest['state']
+    if manifest is not None:
+        from google.api_core import exceptions
+        try:
+            return _download(manifest, directory, keep_local), manifest['state']
+        except exceptions.NotFound:
+            #the feature table expired or was deleted while its manifest was kept,
+            #so it is built again.
+            os.remove(_manifest_path(directory, key))
+    state = preprocessing.fit(column_list, project_name, table_name, threshold,
+                              cat_threshold, timezone=timezone, calendar=calendar)
+    destination = "{dataset}.{table_name}_features_{key}".format(
+        dataset=dataset or project_name, table_name=table_name, key=key)
+    options = ""
+    if expiration_days is not None:
+        options = (" OPTIONS(expiration_timestamp=TIMESTAMP_ADD(CURRENT_TIMESTAMP(), "
+                   "INTERVAL {days} DAY))").format(days=int(expiration_days))
+    #the table is always built by the backend, never answered from the result cache.
+    query_executor.run_query("CREATE OR REPLACE TABLE {destination}{options} AS\n{query}".format(
+        destination=destination, options=options,
+        query=feature_query(state, project_name, table_name)), cache=False)
+    manifest = {'version': FEATURE_VERSION, 'key': key, 'source': source,
+                'table_version': version, 'columns': list(column_list),
+                'threshold': threshold, 'cat_threshold': cat_threshold,
+                'destination': destination, 'state': state,
+                'created': datetime.datetime.now(datetime.timezone.utc).isoformat()}
+    _write_manifest(directory, key, manifest)
+    return _download(manifest, directory, keep_local), manifest['state']
+def _download(manifest, directory, keep_local):
+    """Downloads the feature table of a manifest, keeping a local copy if asked to."""
+    #the ready features are downloaded with one query, the strings dictionary encoded.
+    data = query_executor.arrow_frame(query_executor.run_arrow(
+        "SELECT * FROM {destination}".format(destination=manifest['destination'])))
+    if keep_local:
+        data.to_parquet(_data_path(directory, manifest['key']))
+    return data
+def _local_version(project_name, table_name):
+    """Gives the version of a table of the local backend, from the file or the data."""
+    import local_backend
+    table = local_backend._table(project_name, table_name)
+    if 'parent' in table:
+        return "{parent}/{rows}".format(
+            parent=_local_version(*table['parent']),
+            rows=hashlib.sha256(table['rows'].tobytes()).hexdigest()[:16])
+    source = table['source']
+    if isinstance(source, pd.DataFrame):
+        return str(pd.util.hash_pandas_object(source, index=False).sum())
+    status = os.stat(source)
+    return "{modified}/{size}".format(modified=status.st_mtime_ns, size=status.st_size)
+def local_materialize(column_list, project_name, table_name, threshold=80, cat_threshold=10,
+                      directory=".features", timezone=None, calendar=False):
+    """This function gives the feature table of decision_tree for a table of the local
+    backend, writing it to a parquet file keyed on the same kind of fingerprint as
+    materialize, which is read back by the later runs.
+    Parameters required:a)column_list:All the names of the columns
+                        that you want to consider for dataset generation.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)threshold: amount of null values in a column that can be
+                        tolerated in percentage.
+                        e.)cat_threshold: The number of values after which every value
+                        will be considered under 'Others'
+                        f.)directory: The directory of the manifests and feature files.
+                        g.)timezone: The timezone the time columns are made in.
+                        h.)calendar: Whether the calendar time columns are made too.
+    Result: A tuple with the feature dataframe and the preprocessing state."""
+    import local_backend
+    os.makedirs(directory, exist_ok=True)
+    version = _local_version(project_name, table_name)
+    key = fingerprint(version, column_list, threshold, cat_threshold, timezone, calendar)
+    manifest = _read_manifest(directory, key)
+    path = _data_path(directory, key)
+    if manifest is not None and os.path.isfile(path):
+        return pd.read_parquet(path), manifest['state']
+    state = preprocessing.fit(column_list, project_name, table_name, threshold,
+                              cat_threshold, backend=local_backend, timezone=timezone,
+                              calendar=calendar)
+    data = local_backend.read_columns(state['columns'], project_name, table_name)
+    data = preprocessing.apply(data, state)
+    #the categories are written as plain strings, the same as the bigquery table.
+    data = data.astype({i: object for i in data.columns
+                        if isinstance(data[i].dtype, pd.CategoricalDtype)})
+    data.to_parquet(path)
+    _write_manifest(directory, key, {
+        'version': FEATURE_VERSION, 'key': key,
+        'source': "{project_name}.{table_name}".format(project_name=project_name,
+                                                       table_name=table_name),
+        'table_version': version, 'columns': list(column_list), 'threshold': threshold,
+        'cat_threshold': cat_threshold, 'destination': path, 'state': state,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat()})
+    return data, state
@@ -0,0 +1,51 @@
+"""This module contains the time features of the decision tree dataset.
+It only needs numpy and pandas, so that the scoring of new data can make the
+same columns as the training without importing scikit-learn or bigquery."""
+import pandas as pd
+#week days in the order their one hot columns are made, which is sorted by name.
+WEEK_DAYS = ["Friday", "Monday", "Saturday", "Sunday", "Thursday", "Tuesday", "Wednesday"]
+#the parts of the day of part_day, six hours each starting from midnight.
+PARTS_OF_DAY = ["night", "morning", "afternoon", "evening"]
+#the columns made from visitStartTime.
+TIME_COLUMNS = ["week_day", "hour", "week_year", "day_month"]
+#the columns added with calendar=True.
+CALENDAR_COLUMNS = ["month", "is_weekend", "part_day"]
+def time_columns(calendar=False):
+    """This function gives the names of the columns time_features makes.
+    Parameters required:a.)calendar: Whether the calendar columns are made.
+    Result: A list with the column names, in the order time_features gives them."""
+    return TIME_COLUMNS+CALENDAR_COLUMNS if calendar else list(TIME_COLUMNS)
+def time_features(seconds, timezone=None, calendar=False):
+    """This function divides epoch seconds into week_day, hour, week_year and
+    day_month the same way as FORMAT_TIMESTAMP with %A, %H, %W and %e.
+    Parameters required:a.)seconds: The visitStartTime values.
+                        b.)timezone: The timezone the columns are given in, UTC
+                        if not passed.
+                        c.)calendar: Whether to add the month, is_weekend and
+                        part_day columns too.
+    Result: A dataframe with week_day and part_day as pandas Categorical and
+            the other columns as int8, or float32 if visitStartTime has nulls.
+    Note:week_day and part_day have all their categories even when some of them are
+        not in the data, so pd.get_dummies always makes 7 week_day columns and 4
+        part_day columns, the same columns for every batch and the scored data."""
+    seconds = pd.to_numeric(pd.Series(seconds), errors='coerce').reset_index(drop=True)
+    stamp = pd.to_datetime(seconds, unit='s', utc=timezone is not None)
+    if timezone is not None:
+        stamp = stamp.dt.tz_convert(timezone)
+    day = stamp.dt.dayofweek
+    hour = stamp.dt.hour
+    result = {
+        'week_day': pd.Categorical(stamp.dt.day_name(), categories=WEEK_DAYS),
+        'hour': hour,
+        #%W counts the weeks starting from the first monday of the year.
+        'week_year': (stamp.dt.dayofyear-1+7-day)//7,
+        'day_month': stamp.dt.day}
+    if calendar:
+        result['month'] = stamp.dt.month
+        result['is_weekend'] = (day >= 5).where(day.notna())
+        result['part_day'] = pd.Categorical.from_codes(
+            (hour//6).fillna(-1).astype('int8'), categories=PARTS_OF_DAY)
+    for i, column in result.items():
+        if not isinstance(column, pd.Categorical):
+            result[i] = column.astype('float32' if column.isna().any() else 'int8')
+    return pd.DataFrame(result)
@@ -0,0 +1,426 @@
+"""This module contains the local execution backend which carries out the
+univariate analysis and the dataset preprocessing directly on a dataframe,
+parquet or feather file instead of running the queries on bigquery.
+Every function has the same name and parameters as its bigquery counterpart in
+univariate or decision_tree, so the two can be swapped without changing the caller.
+The project_name and table_name either refer to a table registered with
+register_table, or to the file {project_name}/{table_name}.parquet(or .feather)."""
+import os
+import numpy as np
+import pandas as pd
+import decision_tree
+import univariate
+#tables registered or read so far, along with the columns already loaded from them.
+_TABLES = {}
+def register_table(project_name, table_name, data):
+    """This function makes a dataframe or a file available to the local backend
+    under the given project and table name.
+    Parameters required:a.)project_name: The project name to register the table under.
+                        b.)table_name: Name of the table.
+                        c.)data: A dataframe or the path of a parquet, feather or csv file.
+    Result: The columns of the table will be read from data from now on."""
+    _TABLES[(project_name, table_name)] = {'source': data, 'columns': {}}
+def _table(project_name, table_name):
+    """Finds the registered table, or the file of the table in the project directory."""
+    key = (project_name, table_name)
+    if key not in _TABLES:
+        path = os.path.join(project_name, table_name)
+        for i in ('', '.parquet', '.feather', '.csv'):
+            if os.path.isfile(path+i):
+                register_table(project_name, table_name, path+i)
+                break
+        else:
+            raise FileNotFoundError("No local table found for {project_name}.{table_name}".format(
+                project_name=project_name, table_name=table_name))
+    return _TABLES[key]
+def read_columns(column_list, project_name, table_name):
+    """This function reads only the columns asked for from the table,
+    each column is read once and kept for the later calls.
+    Parameters required:a.)column_list: Names of the columns to be read.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+    Result: A dataframe with the asked columns."""
+    table = _table(project_name, table_name)
+    source, columns = table['source'], table['columns']
+    missing = [i for i in column_list if i not in columns]
+    if missing:
+        if 'parent' in table:
+            #a sampled table takes its rows from the columns of the whole table.
+            data = read_columns(missing, *table['parent']).iloc[table['rows']]
+        elif isinstance(source, pd.DataFrame):
+            data = source[missing]
+        elif source.endswith('.feather'):
+            data = pd.read_feather(source, columns=missing)
+        elif source.endswith('.csv'):
+            data = pd.read_csv(source, usecols=missing)
+        else:
+            data = pd.read_parquet(source, columns=missing)
+        for i in missing:
+            columns[i] = data[i].reset_index(drop=True)
+    return pd.DataFrame({i: columns[i] for i in column_list})
+def row_count(project_name, table_name):
+    """This function gives the number of rows of the table.
+    Parameters required:a.)project_name: The project name in which the table is located
+                        b.)table_name: Name of the table.
+    Result: The number of rows."""
+    table = _table(project_name, table_name)
+    source, columns = table['source'], table['columns']
+    if 'parent' in table:
+        return len(table['rows'])
+    if columns:
+        return len(next(iter(columns.values())))
+    if isinstance(source, pd.DataFrame):
+        return len(source)
+    if source.endswith('.csv'):
+        return len(pd.read_csv(source, usecols=[0]))
+    if source.endswith('.feather'):
+        import pyarrow.feather
+        return pyarrow.feather.read_table(source, memory_map=True).num_rows
+    #the parquet footer has the number of rows, so no column is read.
+    import pyarrow.parquet
+    return pyarrow.parquet.read_metadata(source).num_rows
+def sample_table(project_name, table_name, percent, seed=0):
+    """This function registers a random sample of the rows of a table as a table
+    of its own, on which every function of this module can be run.
+    Parameters required:a.)project_name: The project name in which the table is located
+                        b.)table_name: Name of the table.
+                        c.)percent: The percentage of rows to keep.
+                        d.)seed: The seed of the sample, the samples with the same seed
+                        are nested, every row of a smaller sample being in the larger ones.
+    Result: The table name of the sample, in the same project."""
+    rows = np.random.default_rng(seed).random(row_count(project_name, table_name))
+    sample_name = "{table_name}@{percent}%{seed}".format(
+        table_name=table_name, percent=percent, seed=seed)
+    _TABLES[(project_name, sample_name)] = {
+        'source': _table(project_name, table_name)['source'], 'columns': {},
+        'parent': (project_name, table_name),
+        'rows': np.flatnonzero(rows < percent/100)}
+    return sample_name
+def _column(column_name, project_name, table_name):
+    """Reads a single column from the table."""
+    return read_columns([column_name], project_name, table_name)[column_name]
+def _numeric(column_name, project_name, table_name):
+    """Reads a column as float64 with the values that cannot be converted as NaN,
+    the same as SAFE_CAST(column AS FLOAT64)."""
+    return pd.to_numeric(_column(column_name, project_name, table_name),
+                         errors='coerce').astype('float64')
+def _data_type(values):
+    """Gives the bigquery datatype name of a pandas column."""
+    if pd.api.types.is_bool_dtype(values):
+        return "BOOL"
+    if pd.api.types.is_integer_dtype(values):
+        return "INT64"
+    if pd.api.types.is_float_dtype(values):
+        return "FLOAT64"
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return "TIMESTAMP"
+    return "STRING"
+def column_info(column_name, project_name, table_name):
+    """ This function gives the datatype of a column the same way as
+    univariate.column_info.
+    Result: A dataframe with the DATA_TYPE of the column."""
+    values = _column(column_name, project_name, table_name)
+    return pd.DataFrame({'DATA_TYPE': [_data_type(values)]})
+def _bucket_stats(column_name, project_name, table_name):
+    """Computes the Mean,St_deviation,min and max used by dynamic_bucket as a
+    singular column dataframe, the same as the transposed bigquery result."""
+    values = _numeric(column_name, project_name, table_name).to_numpy()
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        stats = [np.nan]*4
+    else:
+        std = values.std(ddof=1) if values.size > 1 else np.nan
+        stats = [values.mean(), std, values.min(), values.max()]
+    return pd.DataFrame([[i] for i in stats])
+def dynamic_bucket(column_name, project_name, table_name, buckets=10):
+    """This function makes the same CASE conditions for the dynamic buckets as
+    univariate.dynamic_bucket.
+    Result: A string with dynamic buckets will be made."""
+    data = _bucket_stats(column_name, project_name, table_name)
+    return univariate.bucket_case(column_name, data, buckets)
+def _bucket_labels(column_name, project_name, table_name, buckets):
+    """Puts every value of a numeric column in its bucket, giving the same
+    result as the CASE conditions of dynamic_bucket in a vectorized way.
+    Result: An array with the bucket label of every row, None where no bucket applies."""
+    data = _bucket_stats(column_name, project_name, table_name)
+    values = _numeric(column_name, project_name, table_name).to_numpy()
+    return univariate.bucket_labels(values, data, buckets)
+def numeric_data_overview(column_name, project_name, table_name):
+    """ This function provides the basic overview for a numeric column
+    the same way as univariate.numeric_data_overview.
+    Result: You will get a singular column matrix with the values Mean,Standard_deviation,
+            quantiles(25,50,75),Min,Max."""
+    values = _numeric(column_name, project_name, table_name).to_numpy()
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        overview = [np.nan]*7
+    else:
+        #the quantiles are taken from the values present in the column
+        #like the APPROX_QUANTILES of bigquery.
+        quantiles = np.quantile(values, [0, 0.25, 0.5, 0.75, 1], method='inverted_cdf')
+        std = values.std(ddof=1) if values.size > 1 else np.nan
+        overview = [values.mean(), std] + list(quantiles)
+    return pd.DataFrame({column_name: overview},
+                        index=['Mean', 'St_deviation', 'min', 'quantile_25',
+                               'quantile_50', 'quantile_75', 'max'])
+def _value_counts(values, label=None):
+    """Counts every distinct value(null included) with factorized codes,
+    and the counts for label 0 and 1 when the label is passed.
+    Result: A dataframe with value,Count and count_0,count_1."""
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    result = pd.DataFrame({'value': uniques,
+                           'Count': np.bincount(codes, minlength=len(uniques))})
+    if label is not None:
+        label = label.to_numpy()
+        for i in (0, 1):
+            result['count_'+str(i)] = np.bincount(codes[label == i], minlength=len(uniques))
+    return result
+def categorical_overview(column_name, project_name, table_name):
+    """ This function provides the basic overview for a categorical column
+    the same way as univariate.categorical_overview.
+    Result: You will get a three column matrix with the values distinct values(null not
+     included),null_count and total count."""
+    values = _column(column_name, project_name, table_name)
+    count_null = int(values.isna().sum())
+    return pd.DataFrame({'distinct': [values.nunique()],
+                         'count_null': [count_null if count_null else None],
+                         'total_count': [int(values.notna().sum())]})
+def count_coverage_categorical(column_name, project_name, table_name, terms=10):
+    """This function calculates count and coverage for a categorical column
+    the same way as univariate.count_coverage_categorical.
+    Result: A 3-columnar dataframe with the terms(arranged in descending
+            order on the value of counts),count and coverage."""
+    result = _value_counts(_column(column_name, project_name, table_name))
+    result['Coverage'] = result['Count']*100/result['Count'].sum()
+    result = result.sort_values('Coverage', ascending=False, kind='stable').head(terms)
+    return result.rename(columns={'value': column_name}).reset_index(drop=True)
+def count_coverage_numeric(column_name, project_name, table_name, buckets=10):
+    """This function gives the count and coverage of the dynamic buckets of a numeric
+    column the same way as univariate.count_coverage_numeric.
+    Result: A 3-columnar dataframe with buckets,count and their coverage."""
+    labels = _bucket_labels(column_name, project_name, table_name, buckets)
+    result = _value_counts(labels).rename(columns={'value': 'Buckets'})
+    result['Coverage'] = result['Count']*100/result['Count'].sum()
+    result = result.sort_values('Coverage', ascending=False, kind='stable')
+    return result.reset_index(drop=True)
+def compare_leads_numeric(column_name, project_name, table_name, buckets=10):
+    """This function compares the converted and non-converted coverage of the buckets
+    of a numeric column the same way as univariate.compare_leads_numeric.
+    Result: A 3-columnar dataframe with buckets,converted coverage and non-converted coverage."""
+    labels = _bucket_labels(column_name, project_name, table_name, buckets)
+    label = _column('label', project_name, table_name)
+    data = pd.DataFrame({'Buckets': labels, 'label': label, 'Count': 1})
+    #the ones are counted by the same helper that table_profile uses.
+    data = data.groupby(['Buckets', 'label'], dropna=False, sort=False)['Count'].sum()
+    return univariate._compare_from_label_counts(data.reset_index())
+def compare_leads_categorical(column_name, project_name, table_name, terms=10):
+    """This function compares the converted and non-converted coverage of the top terms
+    of a categorical column the same way as univariate.compare_leads_categorical.
+    Result: A 3-columnar dataframe with converted coverage,terms ,non-converted coverage"""
+    label = _column('label', project_name, table_name)
+    data = _value_counts(_column(column_name, project_name, table_name), label)
+    data = data.rename(columns={'value': column_name})
+    data['total_0'] = data['count_0'].sum()
+    data['total_1'] = data['count_1'].sum()
+    both = (data['count_0'] > 0) & (data['count_1'] > 0) & data[column_name].notna()
+    for i in ('0', '1'):
+        data['rank_'+i] = data['count_'+i].where(both, -1).rank(method='first', ascending=False)
+    return univariate._compare_leads_terms(data, column_name, terms)
+def _segment_counts(values, segment, terms=None):
+    """Counts every value in every segment alongwith the total of the segment the same
+    way as the query of univariate._segment_query, keeping the top terms of every segment."""
+    data = pd.DataFrame({'value': values, 'segment': segment})
+    data = data[data['segment'].notna()].astype({'segment': str})
+    data = data.groupby(['value', 'segment'], dropna=False, sort=False).size()
+    data = data.rename('Count').reset_index()
+    data['segment_total'] = data.groupby('segment')['Count'].transform('sum')
+    if terms is not None:
+        data = data.sort_values(['Count', 'value'], ascending=[False, True],
+                                na_position='first', kind='stable')
+        rank = data.groupby('segment').cumcount()+1
+        best = rank.groupby(data['value'], dropna=False).transform('min')
+        data = data[best <= terms]
+    return data.reset_index(drop=True)
+def compare_segments_numeric(column_name, project_name, table_name, segment='label',
+                             buckets=10, baseline=None):
+    """This function compares the coverage of the buckets of a numeric column across
+    the values of a segment column the same way as univariate.compare_segments_numeric.
+    Result: A dataframe with Buckets,Count,Coverage and the count_<segment>,
+            coverage_<segment> and lift_<segment> of every segment."""
+    labels = _bucket_labels(column_name, project_name, table_name, buckets)
+    data = _segment_counts(labels, _column(segment, project_name, table_name))
+    return univariate._segment_table(data, 'Buckets', baseline)
+def compare_segments_categorical(column_name, project_name, table_name, segment='label',
+                                 terms=10, baseline=None):
+    """This function compares the coverage of the values of a categorical column across
+    the values of a segment column the same way as univariate.compare_segments_categorical.
+    Result: A dataframe with the values,Count,Coverage and the count_<segment>,
+            coverage_<segment> and lift_<segment> of every segment."""
+    data = _segment_counts(_column(column_name, project_name, table_name),
+                           _column(segment, project_name, table_name), terms)
+    return univariate._segment_table(data, column_name, baseline)
+def table_profile(column_list, project_name, table_name, terms=10, buckets=10):
+    """This function profiles all the columns of a table into the same dictionary
+    as univariate.table_profile.
+    Result: A dictionary with the column names as keys, each holding a dictionary with
+            the dataframes(and bucket string) of the single column functions, keyed on
+            the name of that function, alongwith the data_type of the column."""
+    profile = {}
+    for i in column_list:
+        data_type = column_info(i, project_name, table_name)['DATA_TYPE'].iloc[0]
+        profile[i] = {'data_type': data_type}
+        if data_type in ("INT64", "FLOAT64"):
+            functions = (dynamic_bucket, count_coverage_numeric, compare_leads_numeric)
+            profile[i]['numeric_data_overview'] = numeric_data_overview(
+                i, project_name, table_name)
+            for j in functions:
+                profile[i][j.__name__] = j(i, project_name, table_name, buckets)
+        elif data_type == "STRING":
+            profile[i]['categorical_overview'] = categorical_overview(
+                i, project_name, table_name)
+            for j in (count_coverage_categorical, compare_leads_categorical):
+                profile[i][j.__name__] = j(i, project_name, table_name, terms)
+    return profile
+def count_coverage(column_name, project_name, table_name, threshold):
+    """This function gives the values of a column whose coverage is greater than
+    the threshold the same way as decision_tree.count_coverage.
+    Result: A 3-columnar dataframe with the terms(arranged in descending
+            order on the value of counts),count and coverage."""
+    result = _value_counts(_column(column_name, project_name, table_name))
+    result['Coverage'] = result['Count']*100/result['Count'].sum()
+    result = result[result['Coverage'] > threshold]
+    result = result.sort_values('Coverage', ascending=False, kind='stable')
+    return result.rename(columns={'value': column_name}).reset_index(drop=True)
+def main_dt_list(column_list, project_name, table_name, threshold):
+    """This function generates the list of columns that are to be considered for
+    dataset generation the same way as decision_tree.main_dt_list.
+    Result: A list with names of columns that has coverage for none
+            of its values greater than the threshold."""
+    return [i for i in column_list
+            if i == "label" or count_coverage(i, project_name, table_name, threshold).empty]
+def null_coverage(column_name, project_name, table_name):
+    """This function calculates the percentage of null values of a column
+    the same way as decision_tree.null_coverage.
+    Result: A 1x1 dataframe with null coverage value, empty if there are no nulls."""
+    values = _column(column_name, project_name, table_name)
+    count_null = int(values.isna().sum())
+    coverage = [count_null*100/len(values)] if count_null else []
+    return pd.DataFrame({'Coverage': coverage}, dtype='float64')
+def numeric_na_fill(column_name, project_name, table_name):
+    """ This function fills the null values of a numeric column with the median or an
+    extreme value the same way as decision_tree.numeric_na_fill.
+    Result: A singular column dataframe with the column data generated
+            after filling the null values for the specified column name."""
+    data = null_coverage(column_name, project_name, table_name)
+    values = _column(column_name, project_name, table_name)
+    if data.empty:
+        return values.to_frame()
+    values = _numeric(column_name, project_name, table_name)
+    if data['Coverage'].iloc[0] <= 10:
+        value = _column(column_name, project_name, table_name).median()
+    else:
+        value = -9999999999
+    return values.fillna(value).to_frame()
+def categorical_na_fill(column_name, project_name, table_name):
+    """ This function fills the null values of a categorical column with the mode or
+    "not set" the same way as decision_tree.categorical_na_fill.
+    Result: A singular column dataframe with the column data generated
+            after filling the null values for the specified column name."""
+    data = null_coverage(column_name, project_name, table_name)
+    values = _column(column_name, project_name, table_name)
+    if data.empty:
+        return values.to_frame()
+    if data['Coverage'].iloc[0] <= 10:
+        value = values.mode()[0]
+    else:
+        value = "not set"
+    return values.fillna(value).to_frame()
+def time_data(data, project_name, table_name, timezone=None, calendar=False):
+    """This function divides visitStartTime into week_day, hour, week_year and
+    day_month the same way as decision_tree.time_data, which does not query the table.
+    Result: Data with added time columns if visitStartTime was there in the passed dataset."""
+    return decision_tree.time_data(data, project_name, table_name, timezone, calendar)
+def fill_values(column_list, project_name, table_name):
+    """This function finds the value with which the null values of every column
+    are to be filled the same way as decision_tree.fill_values.
+    Result: A dictionary with the column names and their fill values, None for the
+            columns with no null values."""
+    result = {}
+    for i in column_list:
+        data_type = column_info(i, project_name, table_name).iloc[0, 0]
+        values = _column(i, project_name, table_name)
+        coverage = null_coverage(i, project_name, table_name)
+        if data_type not in ("INT64", "FLOAT64", "STRING"):
+            continue
+        if coverage.empty:
+            result[i] = None
+        elif coverage['Coverage'].iloc[0] <= 10:
+            result[i] = float(values.median()) if data_type != "STRING" else values.mode()[0]
+        else:
+            result[i] = -9999999999 if data_type != "STRING" else "not set"
+    return result
+def top_categories(column_list, project_name, table_name, cat_threshold, values=None):
+    """This function finds the values kept for every categorical column after the
+    null values are filled the same way as decision_tree.top_categories.
+    Result: A dictionary with the categorical column names and the sorted list of
+            their values, with 'Others' added for the columns that are grouped."""
+    string_columns = [i for i in column_list
+                      if column_info(i, project_name, table_name).iloc[0, 0] == "STRING"]
+    if values is None:
+        values = fill_values(string_columns, project_name, table_name)
+    result = {}
+    for i in string_columns:
+        column = _column(i, project_name, table_name)
+        if values.get(i) is not None:
+            column = column.fillna(values[i])
+        counts = _value_counts(column)
+        #ties with the value at the threshold are kept, the same as RANK.
+        rank = counts['Count'].rank(method='min', ascending=False)
+        kept = sorted(counts.loc[rank <= cat_threshold, 'value'].dropna())
+        if len(counts) > len(kept):
+            kept = sorted(kept+["Others"])
+        result[i] = kept
+    return result
+def build_dataset(column_list, project_name, table_name, values=None):
+    """This function gives all the columns with their null values filled
+    the same way as decision_tree.build_dataset.
+    Result: A dataframe with all the columns asked with no null values."""
+    if values is None:
+        values = fill_values(column_list, project_name, table_name)
+    result = {}
+    for i in column_list:
+        value = values.get(i)
+        if value is None:
+            result[i] = _column(i, project_name, table_name)
+        elif isinstance(value, str):
+            result[i] = _column(i, project_name, table_name).fillna(value)
+        else:
+            result[i] = _numeric(i, project_name, table_name).fillna(value)
+    return pd.DataFrame(result)
+def null_fill(column_list, project_name, table_name, threshold):
+    """This function forms the dataset with the null values filled
+    the same way as decision_tree.null_fill.
+    Result: A dataframe with all the columns asked alongwith additional time columns
+            with no null values."""
+    col_list = main_dt_list(column_list, project_name, table_name, threshold)
+    result = build_dataset(col_list, project_name, table_name)
+    return time_data(result, project_name, table_name)
+def grouping(columns, project_name, table_name, threshold, cat_threshold):
+    """This function groups the values of the categorical columns beyond the
+    cat_threshold most frequent ones into 'Others' the same way as
+    decision_tree.grouping, using factorized codes instead of value_counts.
+    Result: A one hot encoded dataframe with all categorical columns with max (threshold+1)
+            unique values."""
+    answer = null_fill(columns, project_name, table_name, threshold)
+    for i in columns:
+        if i not in answer.columns:
+            continue
+        if column_info(i, project_name, table_name).iloc[0, 0] == "STRING":
+            codes, uniques = pd.factorize(answer[i])
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            if len(uniques) > cat_threshold:
+                #values counted less than the value at the threshold are grouped.
+                count = np.sort(counts)[::-1][cat_threshold-1]
+                names = np.where(counts < count, "Others", uniques.astype(object))
+                answer[i] = np.where(codes >= 0, names[codes], None)
+    return pd.get_dummies(answer)
@@ -0,0 +1,274 @@
+"""This module contains a local stand-in for the bigquery client which runs the
+queries of univariate and decision_tree on DuckDB, so whole workflows can be run,
+timed and compared without a google cloud project.
+The standard SQL written by the other modules is translated to the DuckDB dialect,
+tables are registered from dataframes or parquet files under a project name, and
+the client counts the queries it runs and the rows and bytes it hands back, the way
+bigquery bills and downloads them. It is passed to query_executor.QueryExecutor as
+the client_factory."""
+import datetime
+import re
+import threading
+import types
+import pandas as pd
+#the bigquery names of the DuckDB column types, as INFORMATION_SCHEMA gives them.
+_DATA_TYPES = {'BIGINT': 'INT64', 'INTEGER': 'INT64', 'SMALLINT': 'INT64', 'TINYINT': 'INT64',
+               'HUGEINT': 'INT64', 'DOUBLE': 'FLOAT64', 'FLOAT': 'FLOAT64',
+               'VARCHAR': 'STRING', 'BOOLEAN': 'BOOL', 'DATE': 'DATE',
+               'TIMESTAMP': 'DATETIME', 'TIMESTAMP WITH TIME ZONE': 'TIMESTAMP'}
+_STRING_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'')
+_SCHEMA_PATTERN = re.compile(r'(\w+)\.INFORMATION_SCHEMA\.COLUMNS', re.I)
+_UNNAMED_PATTERN = re.compile(r'^[A-Za-z_]\w*$')
+def _mask_strings(query):
+    """Swaps the string literals of the query for placeholders so the translation
+    never touches them, and gives them back as DuckDB literals."""
+    strings = []
+    def keep(match):
+        value = match.group(0)[1:-1]
+        value = re.sub(r'\\(.)', r'\1', value).replace("'", "''")
+        strings.append("'"+value+"'")
+        return "\x00{position}\x00".format(position=len(strings)-1)
+    return _STRING_PATTERN.sub(keep, query), strings
+def _unmask_strings(query, strings):
+    """Puts the string literals back in the translated query."""
+    return re.sub("\x00(\\d+)\x00", lambda match: strings[int(match.group(1))], query)
+def _closing(query, start):
+    """Gives the position of the parenthesis closing the one at start."""
+    depth = 0
+    for position in range(start, len(query)):
+        if query[position] == '(':
+            depth += 1
+        elif query[position] == ')':
+            depth -= 1
+            if depth == 0:
+                return position
+    raise ValueError("Unbalanced parentheses in the query")
+def _arguments(text):
+    """Splits the arguments of a function call at the top level commas."""
+    result, depth, start = [], 0, 0
+    for position, i in enumerate(text):
+        if i in '([':
+            depth += 1
+        elif i in ')]':
+            depth -= 1
+        elif i == ',' and depth == 0:
+            result.append(text[start:position].strip())
+            start = position+1
+    result.append(text[start:].strip())
+    return result
+def _replace_calls(query, name, replace):
+    """Rewrites every call of the function name with replace(arguments)."""
+    pattern = re.compile(r'\b{name}\s*\('.format(name=name), re.I)
+    match = pattern.search(query)
+    while match:
+        start = match.end()-1
+        end = _closing(query, start)
+        new = replace(_arguments(query[start+1:end]))
+        query = query[:match.start()]+new+query[end+1:]
+        match = pattern.search(query, match.start()+len(new))
+    return query
+def _quantiles(arguments):
+    """APPROX_QUANTILES(x, n) as the list of the n+1 quantiles of DuckDB."""
+    number = int(arguments[1])
+    points = ", ".join(repr(i/number) for i in range(number+1))
+    return "quantile_disc({value}, [{points}])".format(value=arguments[0], points=points)
+def _struct(arguments):
+    """STRUCT(x AS a, ...) as a DuckDB struct literal."""
+    fields = []
+    for i in arguments:
+        value, name = re.match(r'(.*)\s+AS\s+(\w+)$', i, re.S | re.I).groups()
+        fields.append("'{name}': {value}".format(name=name, value=value))
+    return "{"+", ".join(fields)+"}"
+def translate(query):
+    """This function translates a bigquery standard SQL query to DuckDB.
+    Parameters required:a.)query: The query written for bigquery.
+    Result: The query for DuckDB, the projects being DuckDB schemas."""
+    query, strings = _mask_strings(query)
+    query = _replace_calls(query, 'APPROX_QUANTILES', _quantiles)
+    query = _replace_calls(query, 'STRUCT', _struct)
+    query = _replace_calls(query, 'APPROX_TOP_COUNT', lambda arguments: (
+        "list_transform(approx_top_k({value}, {number}), x -> {{'value': x}})".format(
+            value=arguments[0], number=arguments[1])))
+    query = _replace_calls(query, 'FORMAT_TIMESTAMP', lambda arguments: (
+        "strftime({timestamp}{zone}, {format})".format(
+            timestamp=arguments[1], format=arguments[0],
+            zone=" AT TIME ZONE "+arguments[2] if len(arguments) > 2 else "")))
+    query = _replace_calls(query, 'FARM_FINGERPRINT', lambda arguments: (
+        "(hash({value}) >> 1)::BIGINT".format(value=arguments[0])))
+    #bigquery counts the offsets of an array from 0 and DuckDB from 1.
+    query = re.sub(r'\[\s*OFFSET\s*\(([^()\]]+)\)\s*\]', r'[(\1)+1]', query, flags=re.I)
+    query = re.sub(r'\[\s*ORDINAL\s*\(([^()\]]+)\)\s*\]', r'[\1]', query, flags=re.I)
+    query = re.sub(r'UNNEST\s*\(\s*GENERATE_ARRAY\s*\(([^,]+),([^)]+)\)\s*\)\s+as\s+(\w+)',
+                   r'(SELECT UNNEST(range(\1, \2+1)) AS \3)', query, flags=re.I)
+    query = re.sub(r'UNNEST\s*\((\[.*?\])\s*\)\s+as\s+(\w+)', r'(SELECT UNNEST(\1) AS \2)',
+                   query, flags=re.I | re.S)
+    query = re.sub(r'TABLESAMPLE\s+SYSTEM\s*\(([\d.]+)\s+PERCENT\)',
+                   r'TABLESAMPLE \1% (bernoulli)', query, flags=re.I)
+    replacements = [(r'\bSAFE_CAST\s*\(', 'TRY_CAST('), (r'\bCOUNTIF\s*\(', 'count_if('),
+                    (r'\bTIMESTAMP_SECONDS\s*\(', 'to_timestamp('),
+                    (r'\bTO_JSON_STRING\s*\(', 'to_json('), (r'\bFORMAT\s*\(', 'printf('),
+                    (r'\bFLOAT64\b', 'DOUBLE'), (r'\bINT64\b', 'BIGINT'),
+                    (r'\bAS\s+STRING\b', 'AS VARCHAR'),
+                    #table is a keyword of DuckDB but the name of many of the CTEs here,
+                    #the statements making tables are marked first to keep theirs.
+                    (r'\b((?:CREATE|DROP)\s+(?:OR\s+REPLACE\s+)?(?:TEMP\s+)?)TABLE\b', '\\1\x01'),
+                    (r'\btable\b', '"table"'), ('\x01', 'TABLE')]
+    for pattern, new in replacements:
+        query = re.sub(pattern, new, query, flags=re.I)
+    #added last, its type names are not to be translated.
+    query = _SCHEMA_PATTERN.sub(lambda match: _schema_columns(match.group(1)), query)
+    return _unmask_strings(query, strings)
+def _schema_columns(project_name):
+    """The INFORMATION_SCHEMA.COLUMNS of a project with the bigquery type names."""
+    types = " ".join("WHEN '{duckdb}' THEN '{bigquery}'".format(duckdb=i, bigquery=j)
+                     for i, j in _DATA_TYPES.items())
+    return ("(SELECT table_name, column_name AS COLUMN_NAME, CASE data_type {types} "
+            "ELSE data_type END AS DATA_TYPE FROM information_schema.columns "
+            "WHERE table_schema = '{project_name}')").format(types=types,
+                                                             project_name=project_name)
+def _bigquery_names(columns):
+    """Names the unnamed columns f0_, f1_, ... the way bigquery does."""
+    names, position = [], 0
+    for i in columns:
+        if _UNNAMED_PATTERN.match(str(i)):
+            names.append(i)
+        else:
+            names.append("f{position}_".format(position=position))
+            position += 1
+    return names
+class LocalJob:
+    """A query of the LocalClient, run when its result is asked for."""
+    def __init__(self, client, query):
+        self.client = client
+        self.query = query
+        self._data = None
+        self._page_size = None
+    def result(self, page_size=None):
+        """Runs the query, once, and waits for it, to_arrow_iterable giving its rows
+        page_size at a time, the same as the RowIterator of bigquery."""
+        if self._data is None:
+            self._data = self.client._execute(self.query)
+        self._page_size = page_size
+        return self
+    @property
+    def total_rows(self):
+        """The number of rows of the result."""
+        return self.result(self._page_size)._data.num_rows
+    def to_arrow_iterable(self, bqstorage_client=None, max_queue_size=None):
+        """Gives the result as pyarrow RecordBatches of at most page_size rows, the
+        storage client being ignored.
+        Result: An iterator over the RecordBatches."""
+        for batch in self.result(self._page_size)._data.to_batches(self._page_size):
+            self.client._handed(batch.nbytes)
+            yield batch
+    def to_dataframe(self):
+        """Runs the query and gives its result as a dataframe, converted from arrow
+        the way bigquery converts it."""
+        data = self.result()._data.to_pandas()
+        self.client._handed(int(data.memory_usage(deep=True).sum()))
+        return data
+    def to_arrow(self):
+        """Runs the query and gives its result as a pyarrow.Table."""
+        data = self.result()._data
+        self.client._handed(data.nbytes)
+        return data
+class LocalClient:
+    """Runs bigquery standard SQL on an in-memory DuckDB database.
+    Parameters required:a.)tables: A dictionary of {(project_name, table_name): data}
+                        with the dataframes or parquet file paths of the tables.
+    The queries, rows and bytes counters hold the number of queries run and the
+    rows and bytes of the dataframes, or pyarrow Tables, handed back."""
+    def __init__(self, tables=None):
+        import duckdb
+        self.connection = duckdb.connect()
+        self.connection.execute("SET TimeZone='UTC'")
+        self.connection.execute(
+            "CREATE MACRO SAFE_DIVIDE(a, b) AS CASE WHEN b = 0 THEN NULL ELSE a/b END")
+        self._lock = threading.Lock()
+        self._schemas = set()
+        self._modified = {}
+        self._created = datetime.datetime.now(datetime.timezone.utc)
+        self.queries = 0
+        self.rows = 0
+        self.bytes = 0
+        for (project_name, table_name), data in (tables or {}).items():
+            self.register_table(project_name, table_name, data)
+    def register_table(self, project_name, table_name, data):
+        """This function makes a dataframe or parquet file queryable as
+        {project_name}.{table_name}.
+        Parameters required:a.)project_name: The project name, made a DuckDB schema.
+                            b.)table_name: Name of the table.
+                            c.)data: A dataframe or the path of a parquet file."""
+        with self._lock:
+            if project_name not in self._schemas:
+                self.connection.execute("CREATE SCHEMA IF NOT EXISTS {project_name}".format(
+                    project_name=project_name))
+                self._schemas.add(project_name)
+            if isinstance(data, pd.DataFrame):
+                self.connection.register("_register", data)
+                source = "_register"
+            else:
+                source = "read_parquet('{path}')".format(path=str(data).replace("'", "''"))
+            self.connection.execute("CREATE OR REPLACE TABLE {project_name}.{table_name} AS "
+                                    "SELECT * FROM {source}".format(
+                                        project_name=project_name, table_name=table_name,
+                                        source=source))
+            if source == "_register":
+                self.connection.unregister("_register")
+            self._modified[(project_name, table_name)] = datetime.datetime.now(
+                datetime.timezone.utc)
+    def get_table(self, table_id):
+        """This function gives the metadata of a table, the last modified time and
+        the number of rows, the same fields as bigquery.Client.get_table gives.
+        Parameters required:a.)table_id: The table as project_name.table_name.
+        Result: An object with the table_id, full_table_id, modified and num_rows."""
+        project_name, table_name = table_id.split('.')[-2:]
+        cursor = self.connection.cursor()
+        try:
+            rows = cursor.execute("SELECT COUNT(*) FROM {project_name}.{table_name}".format(
+                project_name=project_name, table_name=table_name)).fetchone()[0]
+        finally:
+            cursor.close()
+        #the tables made by queries are taken as changed when the client was made.
+        modified = self._modified.get((project_name, table_name), self._created)
+        return types.SimpleNamespace(
+            table_id=table_id, modified=modified, num_rows=rows,
+            full_table_id="local:{project_name}.{table_name}".format(
+                project_name=project_name, table_name=table_name))
+    def query(self, query):
+        """Gives the job of the query, the same as bigquery.Client.query."""
+        return LocalJob(self, query)
+    def run(self, query, arrow=False):
+        """This function runs the query and counts what it hands back.
+        Parameters required:a.)query: The query written for bigquery.
+                            b.)arrow: Whether to give the result as a pyarrow.Table.
+        Result: The result of the query as a dataframe, or a pyarrow.Table."""
+        job = self.query(query)
+        return job.to_arrow() if arrow else job.to_dataframe()
+    def _execute(self, query):
+        """Runs the query and gives its result as a pyarrow.Table, counting the query
+        and its rows."""
+        #every thread needs its own cursor of the shared database.
+        import duckdb
+        cursor = self.connection.cursor()
+        try:
+            data = cursor.execute(translate(query)).to_arrow_table()
+        except duckdb.CatalogException as error:
+            #a table which is not there is NotFound, the same as bigquery raises.
+            from google.api_core import exceptions
+            raise exceptions.NotFound(str(error)) from error
+        finally:
+            cursor.close()
+        data = data.rename_columns(_bigquery_names(data.column_names))
+        with self._lock:
+            self.queries += 1
+            self.rows += len(data)
+        return data
+    def _handed(self, size):
+        """Counts the bytes of a result handed back as a dataframe or a table."""
+        with self._lock:
+            self.bytes += size
+    def counters(self):
+        """Gives the number of queries run and the rows and bytes handed back so far."""
+        with self._lock:
+            return {'queries': self.queries, 'rows': self.rows, 'bytes': self.bytes}
@@ -0,0 +1,80 @@
+"""This module contains the hyperparameter search used by decision_tree.
+The candidates and folds are fitted in parallel worker processes, the fold splits
+are made once and shared by every candidate, and the training matrix is handed to
+the workers as a memory mapped file instead of being pickled for each of them.
+Besides the full grid search, successive halving can be used, which fits every
+candidate on a small sample of rows first and only gives more rows to the best ones."""
+import joblib
+import pandas as pd
+from sklearn.model_selection import GridSearchCV
+from sklearn.model_selection import StratifiedKFold
+from sklearn.tree import DecisionTreeClassifier
+import tracing
+#the grid searched by decision_tree so far.
+PARAM_GRID = {
+    'max_depth': [5, 20],
+    'min_samples_leaf': [5, 20]
+}
+#a larger grid for when there is enough time or workers for it.
+EXTENDED_GRID = {
+    'criterion': ['gini', 'entropy'],
+    'max_depth': [5, 10, 20, None],
+    'min_samples_leaf': [5, 20, 100],
+    'max_features': [None, 'sqrt'],
+    'class_weight': [None, 'balanced'],
+    'min_impurity_decrease': [0.0, 0.0001],
+    'ccp_alpha': [0.0, 0.0001]
+}
+def search(x_train, y_train, param_grid=None, strategy='grid', cv=2, n_jobs=-1,
+           factor=3, min_resources='exhaust', scoring=None, random_state=0, max_nbytes='1M'):
+    """This function searches the best hyperparameters of the decision tree.
+    Parameters required:a.)x_train: The training matrix, dense or sparse.
+                        b.)y_train: The training labels.
+                        c.)param_grid: The hyperparameters to search, PARAM_GRID if not passed.
+                        d.)strategy: 'grid' to fit every candidate on all the rows,
+                        or 'halving' for successive halving on samples of rows.
+                        e.)cv: The number of folds.
+                        f.)n_jobs: The number of worker processes, -1 uses all the cpus.
+                        g.)factor: The share of candidates kept at every halving round
+                        is 1/factor, and the rows given to them grow by factor.
+                        h.)min_resources: The number of rows of the first halving round.
+                        i.)scoring: The scoring used to compare the candidates,
+                        accuracy if not passed.
+                        j.)random_state: The seed of the trees and of the halving samples.
+                        k.)max_nbytes: Arrays larger than this are memory mapped
+                        for the workers instead of being copied to each of them.
+    Result: The fitted search object, with the best tree refitted on all the rows."""
+    if param_grid is None:
+        param_grid = PARAM_GRID
+    tree = DecisionTreeClassifier(random_state=random_state)
+    #the folds are the ones GridSearchCV(cv=cv) makes, split once for every candidate.
+    folds = list(StratifiedKFold(n_splits=cv).split(x_train, y_train))
+    if strategy == 'grid':
+        tree_cv = GridSearchCV(tree, param_grid, cv=folds, n_jobs=n_jobs, scoring=scoring)
+    elif strategy == 'halving':
+        #the halving search is still experimental in scikit-learn.
+        from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+        from sklearn.model_selection import HalvingGridSearchCV
+        tree_cv = HalvingGridSearchCV(tree, param_grid, cv=folds, n_jobs=n_jobs,
+                                      scoring=scoring, factor=factor, resource='n_samples',
+                                      min_resources=min_resources, random_state=random_state)
+    else:
+        raise ValueError("strategy must be 'grid' or 'halving', not {strategy!r}".format(
+            strategy=strategy))
+    with joblib.parallel_config(backend='loky', max_nbytes=max_nbytes, mmap_mode='r'), \
+            tracing.stage(type(tree_cv).__name__+'.fit', rows=x_train.shape[0],
+                          features=x_train.shape[1], n_jobs=n_jobs):
+        tree_cv.fit(x_train, y_train)
+    return tree_cv
+def search_report(tree_cv):
+    """This function gives the fit time and score of every candidate of a search,
+    to help with choosing the size of the grid.
+    Parameters required:a.)tree_cv: The fitted search object.
+    Result: A dataframe with the parameters, mean and std fit time, mean score time,
+            mean and std test score and rank of every candidate, and for successive
+            halving the round and number of rows it was fitted on, ordered by rank."""
+    results = pd.DataFrame(tree_cv.cv_results_)
+    columns = ['params', 'mean_fit_time', 'std_fit_time', 'mean_score_time',
+               'mean_test_score', 'std_test_score', 'rank_test_score']
+    columns += [i for i in ('iter', 'n_resources') if i in results.columns]
+    return results[columns].sort_values(['rank_test_score', 'mean_fit_time']).reset_index(drop=True)
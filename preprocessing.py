@@ -0,0 +1,193 @@
+"""This module contains the fitted preprocessing state of the decision tree dataset
+and the functions which apply it to any batch of rows.
+The state holds everything grouping needs to know about the whole table, the fill
+values, the values kept for every categorical column and the order of the one hot
+encoded columns, so the same encoding can be applied batch by batch, or to new
+data when scoring, without looking at the whole table again."""
+import numpy as np
+import pandas as pd
+import features
+WEEK_DAYS = features.WEEK_DAYS
+TIME_COLUMNS = features.TIME_COLUMNS
+def fit(column_list, project_name, table_name, threshold=80, cat_threshold=10, backend=None,
+        single_pass=False, timezone=None, calendar=False):
+    """This function finds the preprocessing state of the dataset that grouping
+    would make for the columns, without extracting the dataset.
+    Parameters required:a)column_list:All the names of the columns
+                        that you want to consider for dataset generation.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)threshold: amount of null values in a column that can be
+                        tolerated in percentage.
+                        e.)cat_threshold: The number of values after which every value
+                        will be considered under 'Others'
+                        f.)backend: The module the table is read with, decision_tree
+                        if not passed, or local_backend.
+                        g.)single_pass: Whether to screen the columns and find the
+                        values kept with one scan of the table, see
+                        decision_tree.screen_columns, only with the decision_tree backend.
+                        h.)timezone: The timezone the time columns are made in, UTC
+                        if not passed, see features.time_features.
+                        i.)calendar: Whether the calendar time columns are made too.
+    Result: A dictionary with the columns, numeric and string columns, fill values,
+            categories, whether the time columns are made and their options, and the
+            feature names."""
+    #imported here since applying the state for scoring needs neither bigquery
+    #nor scikit-learn, which decision_tree imports.
+    import decision_tree
+    import schema_catalog
+    backend = backend or decision_tree
+    if single_pass:
+        col_list, values, categories = decision_tree.screen_columns(
+            column_list, project_name, table_name, threshold, cat_threshold)
+        fill_columns = [i for i in col_list if i != 'visitStartTime']
+    else:
+        col_list = backend.main_dt_list(column_list, project_name, table_name, threshold)
+        #visitStartTime is only used for the time columns, so it is not filled.
+        fill_columns = [i for i in col_list if i != 'visitStartTime']
+        values = backend.fill_values(fill_columns, project_name, table_name)
+        categories = backend.top_categories(
+            fill_columns, project_name, table_name, cat_threshold, values)
+    if backend is decision_tree:
+        catalog = schema_catalog.get_catalog(project_name, table_name)
+        numeric_columns = catalog.numeric_columns(fill_columns)
+        string_columns = catalog.string_columns(fill_columns)
+    else:
+        types = {i: backend.column_info(i, project_name, table_name).iloc[0, 0]
+                 for i in fill_columns}
+        numeric_columns = [i for i in fill_columns if types[i] in ("INT64", "FLOAT64")]
+        string_columns = [i for i in fill_columns if types[i] == "STRING"]
+    return make_state(col_list, numeric_columns, string_columns, values, categories,
+                      timezone, calendar)
+def make_state(col_list, numeric_columns, string_columns, values, categories, timezone=None,
+               calendar=False):
+    """This function puts the parts of the preprocessing state together.
+    Parameters required:a.)col_list: The columns of the dataset, label included.
+                        b.)numeric_columns: The numeric columns.
+                        c.)string_columns: The categorical columns.
+                        d.)values: The fill values of the columns.
+                        e.)categories: The sorted values kept for every categorical column.
+                        f.)timezone: The timezone the time columns are made in.
+                        g.)calendar: Whether the calendar time columns are made too.
+    Result: The preprocessing state dictionary."""
+    state = {'columns': list(col_list),
+             'numeric': list(numeric_columns),
+             'string': list(string_columns),
+             'fill_values': {i: values.get(i) for i in col_list if i in values},
+             'categories': {i: list(categories[i]) for i in string_columns},
+             'time': 'visitStartTime' in col_list,
+             'timezone': timezone, 'calendar': bool(calendar)}
+    if state['time']:
+        state['categories']['week_day'] = list(WEEK_DAYS)
+        if state['calendar']:
+            state['categories']['part_day'] = list(features.PARTS_OF_DAY)
+    state['feature_names'] = feature_names(state)
+    return state
+def _encoded_columns(state):
+    """Gives the columns of the dataset before one hot encoding, in the order
+    grouping has them, and which of them are one hot encoded."""
+    columns = [i for i in state['columns'] if i != 'visitStartTime']
+    if state['time']:
+        columns = columns+time_columns(state)
+    encoded = [i for i in columns if i in state['categories']]
+    return columns, encoded
+def time_columns(state):
+    """This function gives the time columns made for a state, the states saved
+    before the time options were kept have the default ones.
+    Parameters required:a.)state: The preprocessing state.
+    Result: A list with the names of the time columns."""
+    return features.time_columns(state.get('calendar', False))
+def feature_names(state):
+    """This function gives the names of the columns made by the one hot encoding,
+    in the same order as pd.get_dummies in grouping, the label left out.
+    Parameters required:a.)state: The preprocessing state.
+    Result: A list with the feature names."""
+    columns, encoded = _encoded_columns(state)
+    names = [i for i in columns if i not in encoded and i != 'label']
+    for i in encoded:
+        names.extend("{col_name}_{value}".format(col_name=i, value=j)
+                     for j in state['categories'][i])
+    return names
+def apply(data, state):
+    """This function fills the null values, makes the time columns and groups the
+    values not kept into 'Others' for a batch of rows.
+    Parameters required:a.)data: A dataframe with the columns of the state, as
+                        extracted from the table.
+                        b.)state: The preprocessing state.
+    Result: A dataframe with the categorical columns as pandas Categorical
+            with the categories of the state."""
+    data = data.reset_index(drop=True)
+    result = {}
+    for i in state['columns']:
+        #the label is not there in the data to be scored.
+        if i == 'visitStartTime' or (i == 'label' and i not in data.columns):
+            continue
+        column = data[i]
+        value = state['fill_values'].get(i)
+        if i in state['numeric'] and value is not None:
+            column = pd.to_numeric(column, errors='coerce').astype('float64').fillna(value)
+        elif value is not None:
+            if isinstance(column.dtype, pd.CategoricalDtype) and \
+                    value not in column.cat.categories:
+                #the strings downloaded as pandas Categorical only have their own values.
+                column = column.cat.add_categories([value])
+            column = column.fillna(value)
+        if i in state['string']:
+            categories = state['categories'][i]
+            #values outside the kept ones are made null when the categories are set.
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                column = column.cat.set_categories(categories)
+            else:
+                column = pd.Categorical(column.where(column.isin(categories)),
+                                        categories=categories)
+            if "Others" in categories:
+                #the values made null are the ones grouped into Others.
+                column = column.fillna("Others")
+        result[i] = column
+    if state['time'] and 'visitStartTime' in data.columns:
+        #the time columns are made in the timezone the model was trained with.
+        times = features.time_features(data['visitStartTime'], state.get('timezone'),
+                                       state.get('calendar', False))
+        for i in time_columns(state):
+            result[i] = times[i]
+    elif state['time']:
+        #a materialized feature table has the time columns made already.
+        for i in time_columns(state):
+            result[i] = data[i]
+            if i in state['categories']:
+                result[i] = pd.Categorical(data[i], categories=state['categories'][i])
+    return pd.DataFrame(result)
+def transform(data, state, dtype=np.float32):
+    """This function turns a batch of rows into the one hot encoded feature matrix.
+    Parameters required:a.)data: A dataframe with the columns of the state.
+                        b.)state: The preprocessing state.
+                        c.)dtype: The dtype of the matrix.
+    Result: A tuple with the feature matrix, in the order of state['feature_names'],
+            and the label values, None if the label is not in the data."""
+    data = apply(data, state)
+    columns, encoded = _encoded_columns(state)
+    matrix = np.zeros((len(data), len(state['feature_names'])), dtype=dtype)
+    position = 0
+    for i in columns:
+        if i in encoded or i == 'label':
+            continue
+        matrix[:, position] = data[i].to_numpy(dtype='float64', na_value=np.nan)
+        position += 1
+    for i in encoded:
+        codes = data[i].cat.codes.to_numpy()
+        rows = np.flatnonzero(codes >= 0)
+        matrix[rows, position+codes[rows]] = 1
+        position += len(state['categories'][i])
+    label = data['label'].to_numpy() if 'label' in data.columns else None
+    return matrix, label
+def transform_sparse(data, state):
+    """This function turns a batch of rows into the sparse one hot encoded matrix.
+    Parameters required:a.)data: A dataframe with the columns of the state.
+                        b.)state: The preprocessing state.
+    Result: A tuple with the CSR matrix, in the order of state['feature_names'],
+            and the label values, None if the label is not in the data."""
+    import decision_tree
+    data = apply(data, state)
+    columns, _ = _encoded_columns(state)
+    matrix, label, _, _ = decision_tree.sparse_matrix(data[[i for i in columns if i in data]])
+    return matrix, label
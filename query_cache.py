@@ -0,0 +1,231 @@
+"""This module contains the on-disk cache of query results used by the shared
+query executor, so that the same query on an unchanged table is not run on
+bigquery again, within a run or across runs.
+Results are stored as parquet files keyed on the normalized query and the full id,
+last modified time and row count of the tables it reads, and the least recently used
+results are removed once the cache grows beyond its byte budget. Only the read-only
+queries whose result is the same every time they are run are cached, not the DDL and
+DML statements nor the queries reading a TABLESAMPLE or calling RAND."""
+import hashlib
+import os
+import re
+import threading
+import time
+import pandas as pd
+import query_executor
+#tables read by a query, the name after FROM or JOIN with at least one dot in it.
+_TABLE_PATTERN = re.compile(r"\b(?:FROM|JOIN)\s+`?([\w-]+(?:\.[\w-]+)+)`?", re.IGNORECASE)
+_SCHEMA_TABLE_PATTERN = re.compile(r"table_name\s*=\s*[\"']([\w-]+)[\"']", re.IGNORECASE)
+#the parts of a query giving another result every time it is run.
+_NONDETERMINISTIC_PATTERN = re.compile(
+    r"\b(?:TABLESAMPLE|RAND|GENERATE_UUID|CURRENT_(?:DATE|DATETIME|TIME|TIMESTAMP)|"
+    r"SESSION_USER)\b", re.IGNORECASE)
+def normalize_query(query):
+    """This function removes the differences in whitespace and the trailing
+    semicolon, which do not change the result of a query.
+    Parameters required:a.)query: The query to be normalized.
+    Result: The normalized query."""
+    return " ".join(query.split()).rstrip("; ")
+def cacheable(query):
+    """This function checks whether the result of a query can be cached, only a
+    single SELECT, or WITH, statement whose result is the same every time it is run is.
+    Parameters required:a.)query: The query.
+    Result: True if the query can be cached."""
+    query = normalize_query(query)
+    if ";" in query or not re.match(r"(?:SELECT|WITH)\b", query, re.IGNORECASE):
+        return False
+    return _NONDETERMINISTIC_PATTERN.search(query) is None
+def query_tables(query):
+    """This function finds the tables a query reads, for INFORMATION_SCHEMA
+    queries the table whose columns are asked for is taken.
+    Parameters required:a.)query: The query.
+    Result: A sorted list with the table names."""
+    tables = set()
+    for i in _TABLE_PATTERN.findall(query):
+        if ".INFORMATION_SCHEMA." in i.upper():
+            dataset = i[:i.upper().index(".INFORMATION_SCHEMA.")]
+            tables.update(dataset+"."+j for j in _SCHEMA_TABLE_PATTERN.findall(query))
+        else:
+            tables.add(i)
+    return sorted(tables)
+def table_fingerprint(client, table_id):
+    """This function gives the version of a table from its metadata,
+    without running a query.
+    Parameters required:a.)client: The bigquery client.
+                        b.)table_id: Name of the table.
+    Result: A string with the full id, the last modified time and the number of rows
+            of the table, the full id telling apart the tables of the same name in the
+            default projects of different clients."""
+    table = client.get_table(table_id)
+    return "{full_table_id}/{modified}/{num_rows}".format(
+        full_table_id=table.full_table_id, modified=table.modified.isoformat(),
+        num_rows=table.num_rows)
+class QueryCache:
+    """Size bounded, least recently used cache of query results on disk.
+    Parameters required:a.)directory: The directory in which the results are stored.
+                        b.)max_bytes: The size the cache is not allowed to grow beyond.
+                        c.)fingerprint: The function giving the version of a table
+                        from the client and the table name, table_fingerprint by default.
+                        d.)fingerprint_ttl: Seconds for which the version of a table
+                        is trusted before it is looked up again."""
+    def __init__(self, directory, max_bytes=1 << 30, fingerprint=table_fingerprint,
+                 fingerprint_ttl=60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fingerprint = fingerprint
+        self.fingerprint_ttl = fingerprint_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+    def _table_version(self, client, table_id):
+        """Looks up the version of a table, reusing it for fingerprint_ttl seconds."""
+        now = time.monotonic()
+        with self._lock:
+            known = self._fingerprints.get(table_id)
+        if known is not None and now-known[0] < self.fingerprint_ttl:
+            return known[1]
+        version = self.fingerprint(client, table_id)
+        with self._lock:
+            self._fingerprints[table_id] = (now, version)
+        return version
+    def key(self, query, client):
+        """This function gives the cache key of a query.
+        Parameters required:a.)query: The query.
+                            b.)client: The client used to find the table versions.
+        Result: The key as a hex string, None if the query cannot be cached because
+                it is not a deterministic SELECT or the tables it reads could not be
+                found or looked up."""
+        if not cacheable(query):
+            return None
+        tables = query_tables(query)
+        if not tables:
+            return None
+        try:
+            versions = [i+"@"+self._table_version(client, i) for i in tables]
+        except Exception:
+            return None
+        text = normalize_query(query)+"\n"+"\n".join(versions)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    def _path(self, key):
+        """Gives the file in which the result of a key is stored."""
+        return os.path.join(self.directory, key+".parquet")
+    def get(self, query, client, arrow=False):
+        """This function gives the cached result of a query.
+        Parameters required:a.)query: The query.
+                            b.)client: The client used to find the table versions.
+                            c.)arrow: Whether to read the result as a pyarrow.Table.
+        Result: The dataframe, None if the result is not in the cache."""
+        if not cacheable(query):
+            #the queries which are never cached are not counted as misses.
+            return None
+        key = self.key(query, client)
+        path = None if key is None else self._path(key)
+        if path is None or not os.path.exists(path):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            if arrow:
+                import pyarrow.parquet as pq
+                data = pq.read_table(path)
+            else:
+                data = pd.read_parquet(path)
+            #the modified time of the file marks when it was last used.
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+    def put(self, query, client, data):
+        """This function stores the result of a query and removes the least
+        recently used results if the cache has grown beyond max_bytes.
+        Parameters required:a.)query: The query.
+                            b.)client: The client used to find the table versions.
+                            c.)data: The result of the query, a dataframe or pyarrow.Table.
+        Result: True if the result was stored."""
+        key = self.key(query, client)
+        if key is None:
+            return False
+        path = self._path(key)
+        temporary = "{path}.{pid}.{thread}.tmp".format(
+            path=path, pid=os.getpid(), thread=threading.get_ident())
+        try:
+            if isinstance(data, pd.DataFrame):
+                data.to_parquet(temporary)
+            else:
+                import pyarrow.parquet as pq
+                pq.write_table(data, temporary)
+            os.replace(temporary, path)
+        except Exception:
+            #results whose columns parquet cannot store are simply not cached.
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return False
+        self.evict()
+        return True
+    def _entries(self):
+        """Lists the last used time, size and file name of every stored result."""
+        entries = []
+        for i in os.listdir(self.directory):
+            if i.endswith(".parquet"):
+                try:
+                    status = os.stat(os.path.join(self.directory, i))
+                except OSError:
+                    continue
+                entries.append((status.st_mtime, status.st_size, i))
+        return entries
+    def size(self):
+        """This function gives the number of bytes stored in the cache."""
+        return sum(i[1] for i in self._entries())
+    def evict(self):
+        """This function removes the least recently used results until the cache
+        fits within max_bytes.
+        Result: The number of results removed."""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(i[1] for i in entries)
+            removed = 0
+            while entries and total > self.max_bytes:
+                _, size, name = entries.pop(0)
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+                total -= size
+                removed += 1
+            self.evictions += removed
+        return removed
+    def clear(self):
+        """This function removes every result from the cache."""
+        with self._lock:
+            for i in self._entries():
+                os.remove(os.path.join(self.directory, i[2]))
+            self._fingerprints.clear()
+    def stats(self):
+        """This function gives the hit and miss statistics of the cache.
+        Result: A dictionary with hits,misses,hit_rate,evictions,entries and bytes."""
+        entries = self._entries()
+        with self._lock:
+            lookups = self.hits+self.misses
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits/lookups if lookups else 0.0,
+                    'evictions': self.evictions, 'entries': len(entries),
+                    'bytes': sum(i[1] for i in entries)}
+def enable_cache(directory=".query_cache", max_bytes=1 << 30, **kwargs):
+    """This function puts a result cache behind the shared query executor, so
+    main_func of univariate and decision_tree use it.
+    Parameters required:a.)directory: The directory in which the results are stored.
+                        b.)max_bytes: The size the cache is not allowed to grow beyond.
+    Result: The QueryCache, whose stats can be checked after the run."""
+    cache = QueryCache(directory, max_bytes, **kwargs)
+    query_executor.get_executor().cache = cache
+    return cache
+def disable_cache():
+    """This function stops the shared query executor from using the result cache."""
+    query_executor.get_executor().cache = None
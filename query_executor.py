@@ -0,0 +1,333 @@
+"""This module contains the shared query executor which runs the queries of
+univariate and decision_tree on bigquery.
+One client, along with its connection pool, is kept for the whole process and
+reused by every thread and by both modules, and identical queries submitted at the
+same time, by either module, are run as a single job whose result is handed to all
+of the callers.
+The independent queries of a workflow can be dispatched together with submit,
+run_queries or map_columns, the number of jobs running at the same time is kept
+under a limit, and jobs failing on rate limits are retried with a backoff.
+While a tracing hook is added every query is recorded, see tracing.
+The bigquery client library is only imported when the first client is made, so the
+local stand-in of local_bigquery can be chosen at run time with use_backend
+without it."""
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+import tracing
+#reasons given by bigquery when too many jobs or requests are sent at the same time.
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "jobRateLimitExceeded")
+def rate_limited(error):
+    """This function tells whether a failed query can be retried after waiting,
+    which is the case for the rate limit errors of bigquery.
+    Parameters required:a.)error: The exception raised by the query.
+    Result: True if the error is a rate limit error."""
+    from google.api_core import exceptions
+    if isinstance(error, exceptions.TooManyRequests):
+        return True
+    if isinstance(error, exceptions.GoogleAPICallError):
+        return any(i.get('reason') in RATE_LIMIT_REASONS for i in error.errors or [])
+    return False
+def bigquery_client(pool_size=50):
+    """This function makes a bigquery client whose connection pool is large
+    enough to be shared by many threads.
+    Parameters required:a.)pool_size: The number of connections kept open.
+    Result: A bigquery client."""
+    import google.auth
+    from google.auth.transport.requests import AuthorizedSession
+    from google.cloud import bigquery
+    import requests
+    credentials, project = google.auth.default(scopes=bigquery.Client.SCOPE)
+    #the session is handed to the client through its _http argument, instead of
+    #changing the session the client makes for itself.
+    session = AuthorizedSession(credentials)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    return bigquery.Client(project=project, credentials=credentials, _http=session)
+class QueryExecutor:
+    """Runs queries through one shared client and coalesces identical queries
+    that are in flight at the same time.
+    Parameters required:a.)client_factory: A function returning the client, anything
+                        with a query(sql).to_dataframe() works, and to_arrow() for the
+                        arrow results, so a local stand-in
+                        can be passed for testing. bigquery_client is used by default.
+                        b.)cache: A query_cache.QueryCache to look the results up in
+                        before running the queries, no cache is used by default.
+                        c.)max_concurrency: The largest number of jobs running at
+                        the same time.
+                        d.)retries: The number of times a job failing on a rate limit
+                        is run again before the error is raised.
+                        e.)backoff: The seconds waited before the first retry, doubled
+                        at every retry up to max_backoff, with a random jitter."""
+    def __init__(self, client_factory=None, cache=None, max_concurrency=8, retries=5,
+                 backoff=1.0, max_backoff=60.0):
+        self.client_factory = client_factory or bigquery_client
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._pool = None
+        self._pool_pid = None
+        self._in_flight = {}
+        self.jobs = 0
+        self.coalesced = 0
+        self.retried = 0
+    @property
+    def client(self):
+        """The shared client, made on first use and again in a forked worker process
+        since the connections of the parent cannot be shared with it."""
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                self._client = self.client_factory()
+                self._pid = os.getpid()
+            return self._client
+    def run(self, query, where=None, arrow=False, cache=True):
+        """This function runs the query, or waits for the same query if it is
+        already running, and returns the result.
+        Parameters required:a.)query: The query which is to be run.
+                            b.)where: The function and column the query is run for,
+                            from tracing.caller, found from the stack if not passed.
+                            c.)arrow: Whether to give the result as the pyarrow.Table
+                            it is downloaded as, without converting it to a dataframe.
+                            d.)cache: Whether to look the result up in the cache, False
+                            for the DDL and DML statements which have to reach the backend.
+        Result:The table generated by the query converted to a dataframe, or the
+               pyarrow.Table."""
+        event = tracing.start_query(query, where)
+        try:
+            data = self._run(query, event, arrow, cache)
+        except BaseException as error:
+            tracing.finish_query(event, error=error)
+            raise
+        tracing.finish_query(event, data)
+        return data
+    def _run(self, query, event, arrow=False, cache=True):
+        """Looks the query up in the cache, or waits for the same query, or runs it."""
+        cache = self.cache if cache else None
+        if cache is not None:
+            data = cache.get(query, self.client, arrow)
+            if data is not None:
+                if event is not None:
+                    event['source'] = 'disk_cache'
+                return data
+        #the same query asked for as a dataframe and as a table is run for each.
+        key = (query, arrow)
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+                self.jobs += 1
+            else:
+                self.coalesced += 1
+        if not owner:
+            if event is not None:
+                event['source'] = 'coalesced'
+            #every caller gets its own copy since the callers change the dataframes,
+            #the tables cannot be changed and are shared.
+            return _copy(future.result())
+        try:
+            data = self._run_job(query, event, arrow)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(data)
+            if cache is not None:
+                cache.put(query, self.client, data)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return _copy(data)
+    def _run_job(self, query, event=None, arrow=False, page_size=None):
+        """Runs the job once a slot is free, and again after a backoff
+        as long as it fails on a rate limit, giving the rows of the job without
+        downloading them when page_size is passed."""
+        attempt = 0
+        waiting = time.perf_counter()
+        while True:
+            try:
+                with self._slots:
+                    if event is not None:
+                        event['queue_time'] += time.perf_counter()-waiting
+                    job = self.client.query(query)
+                    if page_size is not None:
+                        return job.result(page_size=page_size)
+                    return tracing.fetch(job, event, arrow)
+            except Exception as error:
+                if attempt >= self.retries or not rate_limited(error):
+                    raise
+            #the backoff counts as time the query waited, the same as waiting for a slot.
+            waiting = time.perf_counter()
+            delay = min(self.backoff*2**attempt, self.max_backoff)
+            attempt += 1
+            with self._lock:
+                self.retried += 1
+            if event is not None:
+                event['retries'] = attempt
+            #the jitter keeps the retried jobs from hitting the limit together again.
+            time.sleep(random.uniform(delay/2, delay))
+    def stream(self, query, batch_size=100000, bqstorage_client=None):
+        """This function runs the query and gives its result batch by batch instead of
+        downloading all of it, the job waiting for a slot and being retried the same
+        as with run, the result is never cached nor shared with the same query.
+        Parameters required:a.)query: The query which is to be run.
+                            b.)batch_size: The largest number of rows in a batch.
+                            c.)bqstorage_client: The BigQuery Storage Read API client
+                            the batches are read with, the pages of the job if None.
+        Result: A tuple with the total number of rows, and an iterator over
+                pyarrow RecordBatches of at most batch_size rows."""
+        event = tracing.start_query(query)
+        try:
+            rows = self._run_job(query, event, page_size=batch_size)
+        except BaseException as error:
+            tracing.finish_query(event, error=error)
+            raise
+        tracing.finish_query(event, rows=rows.total_rows)
+        def batches():
+            for batch in rows.to_arrow_iterable(bqstorage_client=bqstorage_client,
+                                                max_queue_size=1):
+                #the storage api decides its own batch sizes, so they are cut to batch_size.
+                for start in range(0, batch.num_rows, batch_size):
+                    yield batch.slice(start, batch_size)
+        return rows.total_rows, batches()
+    def submit(self, query, arrow=False):
+        """This function starts the query in the background.
+        Parameters required:a.)query: The query which is to be run.
+                            b.)arrow: Whether to give the result as a pyarrow.Table.
+        Result: A concurrent.futures.Future giving the dataframe of the query."""
+        with self._lock:
+            #the threads of the parent are not there in a forked worker process.
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(self.max_concurrency,
+                                                thread_name_prefix="query")
+                self._pool_pid = os.getpid()
+            pool = self._pool
+        #the worker thread cannot see the function submitting the query on its stack.
+        where = tracing.caller(2) if tracing.enabled() else None
+        return pool.submit(self.run, query, where, arrow)
+    def run_all(self, queries):
+        """This function runs the queries concurrently.
+        Parameters required:a.)queries: The queries which are to be run.
+        Result: A list with the dataframes of the queries, in the order of the queries."""
+        futures = [self.submit(i) for i in queries]
+        return [i.result() for i in futures]
+    def map_columns(self, func, column_list, *args, **kwargs):
+        """This function calls a per column function for all the columns concurrently,
+        func(column, *args, **kwargs), its queries sharing the concurrency limit.
+        Parameters required:a.)func: The function to call, like count_coverage.
+                            b.)column_list: The columns to call it for.
+        Result: A list with the results of the function, in the order of the columns."""
+        if len(column_list) <= 1:
+            return [func(i, *args, **kwargs) for i in column_list]
+        #a pool of its own, since func itself waits for queries run on the query pool.
+        with ThreadPoolExecutor(min(self.max_concurrency, len(column_list)),
+                                thread_name_prefix="column") as pool:
+            futures = [pool.submit(func, i, *args, **kwargs) for i in column_list]
+            return [i.result() for i in futures]
+def _copy(data):
+    """Copies a dataframe for a caller, the pyarrow Tables cannot be changed and are shared."""
+    import pandas as pd
+    return data.copy() if isinstance(data, pd.DataFrame) else data
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+def get_executor():
+    """This function gives the executor shared by the whole process.
+    Result: The QueryExecutor, made on first use."""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = QueryExecutor()
+        return _EXECUTOR
+def set_executor(executor):
+    """This function replaces the executor shared by the whole process,
+    for example with one using a local stand-in client.
+    Parameters required:a.)executor: The QueryExecutor to be used from now on.
+    Result: The executor that was being used before."""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        previous, _EXECUTOR = _EXECUTOR, executor
+    return previous
+def use_backend(backend="bigquery", tables=None, **kwargs):
+    """This function chooses the backend the queries of the whole process are run on.
+    Parameters required:a.)backend: 'bigquery', or 'duckdb' for the local stand-in
+                        of local_bigquery, which runs the same SQL on local tables.
+                        b.)tables: With 'duckdb', a dictionary of
+                        {(project_name, table_name): data} with the dataframes or
+                        parquet file paths of the tables, see local_bigquery.LocalClient.
+                        c.)kwargs: Passed to QueryExecutor, like cache or max_concurrency.
+    Result: The executor that was being used before."""
+    if backend == "bigquery":
+        client_factory = bigquery_client
+    elif backend == "duckdb":
+        def client_factory():
+            #DuckDB is imported and the tables registered when the client is first
+            #used, the same as the bigquery library.
+            import local_bigquery
+            return local_bigquery.LocalClient(tables)
+    else:
+        raise ValueError("Unknown backend {backend}, use bigquery or duckdb".format(
+            backend=backend))
+    return set_executor(QueryExecutor(client_factory, **kwargs))
+def run_query(query, cache=True):
+    """This function runs the query with the shared executor.
+    Parameters required:a.)query: The query which is to be run on bigquery.
+                        b.)cache: Whether to look the result up in the cache, False
+                        for the DDL and DML statements.
+    Result:The table generated by the query will be converted to a dataframe."""
+    return get_executor().run(query, cache=cache)
+def run_arrow(query):
+    """This function runs the query with the shared executor and gives its result as
+    the pyarrow.Table it is downloaded as, see arrow_frame.
+    Parameters required:a.)query: The query which is to be run on bigquery.
+    Result: The pyarrow.Table of the query."""
+    return get_executor().run(query, arrow=True)
+def arrow_frame(table):
+    """This function converts the pyarrow.Table of a query to a dataframe without
+    making python objects of its values, the string columns are dictionary encoded
+    into pandas Categorical, with their categories sorted the same way
+    astype('category') sorts them, and the numeric columns without null values are
+    handed to numpy without being copied.
+    Parameters required:a.)table: The pyarrow.Table.
+    Result: The dataframe."""
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    columns = [pc.dictionary_encode(i) if pa.types.is_string(i.type) or
+               pa.types.is_large_string(i.type) else i for i in table.columns]
+    data = pa.Table.from_arrays(columns, names=table.column_names).to_pandas(split_blocks=True)
+    for i in data.columns:
+        if isinstance(data[i].dtype, pd.CategoricalDtype):
+            #only the codes are changed, the strings are never copied.
+            data[i] = data[i].cat.reorder_categories(sorted(data[i].cat.categories))
+    return data
+def stream(query, batch_size=100000, bqstorage_client=None):
+    """This function runs the query with the shared executor and gives its result
+    batch by batch, see QueryExecutor.stream.
+    Result: A tuple with the total number of rows, and an iterator over
+            pyarrow RecordBatches of at most batch_size rows."""
+    return get_executor().stream(query, batch_size, bqstorage_client)
+def submit(query):
+    """This function starts the query in the background with the shared executor.
+    Parameters required:a.)query: The query which is to be run on bigquery.
+    Result: A concurrent.futures.Future giving the dataframe of the query."""
+    return get_executor().submit(query)
+def run_queries(queries):
+    """This function runs the queries concurrently with the shared executor.
+    Parameters required:a.)queries: The queries which are to be run on bigquery.
+    Result: A list with the dataframes of the queries, in the order of the queries."""
+    return get_executor().run_all(queries)
+def map_columns(func, column_list, *args, **kwargs):
+    """This function calls a per column function for all the columns concurrently
+    with the shared executor, see QueryExecutor.map_columns.
+    Result: A list with the results of the function, in the order of the columns."""
+    return get_executor().map_columns(func, column_list, *args, **kwargs)
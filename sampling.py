@@ -0,0 +1,265 @@
+"""This module contains the sampled fast profile of a table.
+The univariate profile is computed on a sample of the rows, drawn with TABLESAMPLE
+SYSTEM or a hash of the rows on bigquery, or with a random sample of the rows in
+the local backend, and the counts are scaled up to the whole table with confidence
+intervals for the coverages, the mean and the quantiles.
+Every query of a profile reads the same sample, the TABLESAMPLE SYSTEM sample being
+drawn once into a table of its own since every query drawing it would read other blocks.
+The profile can be refined step by step to larger samples, up to the exact one."""
+import math
+import uuid
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+import local_backend
+import query_executor
+import schema_catalog
+import univariate
+#the number of quantiles fetched for the confidence intervals of the quantiles.
+QUANTILE_GRID = 1000
+#the rows of numeric_data_overview which are quantiles, with their probabilities.
+_QUANTILE_ROWS = {'quantile_25': 0.25, 'quantile_50': 0.5, 'quantile_75': 0.75}
+def sample_source(project_name, table_name, percent, method='system', key=None):
+    """This function writes the table expression reading a sample of the table.
+    Parameters required:a.)project_name: The project name in which the table is located
+                        b.)table_name: Name of the table.
+                        c.)percent: The percentage of rows to read.
+                        d.)method: 'system' for TABLESAMPLE SYSTEM, which reads only
+                        the sampled blocks of the table and so costs less, or 'hash'
+                        for a sample of single rows by their hash, which reads the
+                        whole table but whose smaller samples are nested in the larger.
+                        e.)key: The expression hashed by the 'hash' method, the
+                        whole row if not passed.
+    Result: A string to be used after FROM in place of the table."""
+    if method == 'system':
+        return "{project_name}.{table_name} TABLESAMPLE SYSTEM ({percent} PERCENT)".format(
+            project_name=project_name, table_name=table_name, percent=percent)
+    if method == 'hash':
+        return """(SELECT * FROM {project_name}.{table_name} AS sampled
+            WHERE MOD(ABS(FARM_FINGERPRINT(CAST({key} AS STRING))), 1000000)<{limit})""".format(
+                project_name=project_name, table_name=table_name,
+                key=key or "TO_JSON_STRING(sampled)", limit=int(round(percent*10000)))
+    raise ValueError("method must be 'system' or 'hash', not {method!r}".format(method=method))
+def _sample_query(numeric_columns, source):
+    """Builds the query counting the rows and labels of the sample and finding the
+    quantile grid of every numeric column."""
+    select = ["COUNT(*) as sample_rows", "COUNTIF(label=0) as sample_rows_0",
+              "COUNTIF(label=1) as sample_rows_1"]
+    for i in numeric_columns:
+        select.append("""COUNT({col_name}) as {col_name}__count,
+            APPROX_QUANTILES(SAFE_CAST({col_name} AS FLOAT64), {grid})
+                as {col_name}__quantiles""".format(col_name=i, grid=QUANTILE_GRID))
+    query = """SELECT {select}
+            FROM {source}""".format(select=",\n            ".join(select), source=source)
+    return query
+def fast_profile(column_list, project_name, table_name, percent=1, method='system', key=None,
+                 terms=10, buckets=10, confidence=0.95):
+    """This function profiles the columns on a sample of the table with bigquery.
+    Parameters required:a.)column_list:Name of all columns for which univariate
+                            analysis is to be carried out.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)percent: The percentage of rows to sample, 100 or more
+                        profiles the whole table.
+                        e.)method: The sampling method, see sample_source.
+                        f.)key: The expression hashed by the 'hash' method.
+                        g.)terms: number of top terms for the categorical columns.
+                        h.)buckets: The number of buckets for the numeric columns.
+                        i.)confidence: The confidence level of the intervals.
+    Result: The dictionary of univariate.table_profile with the counts scaled to the
+            whole table and the interval columns added, see with_bounds.
+    Note:The intervals treat the sample as independent rows, TABLESAMPLE SYSTEM samples
+        blocks of rows so its intervals are too narrow for columns clustered by block."""
+    if percent >= 100:
+        profile = univariate.table_profile(column_list, project_name, table_name, terms, buckets)
+        return with_bounds(profile, None, confidence)
+    source = sample_source(project_name, table_name, percent, method, key)
+    numeric_columns = schema_catalog.get_catalog(project_name, table_name).numeric_columns(
+        column_list)
+    if method != 'system':
+        #the hash of a row is the same for every query, so they all read the same rows.
+        return _sample_profile(column_list, project_name, table_name, source, numeric_columns,
+                               percent, method, terms, buckets, confidence)
+    #the sampled blocks are read once, the profile being made on the table they are put in.
+    sample_name = "{table_name}_sample_{suffix}".format(table_name=table_name,
+                                                        suffix=uuid.uuid4().hex[:12])
+    query_executor.run_query(
+        "CREATE TABLE {project_name}.{sample_name} AS SELECT * FROM {source}".format(
+            project_name=project_name, sample_name=sample_name, source=source), cache=False)
+    try:
+        return _sample_profile(column_list, project_name, table_name,
+                               "{project_name}.{sample_name}".format(
+                                   project_name=project_name, sample_name=sample_name),
+                               numeric_columns, percent, method, terms, buckets, confidence)
+    finally:
+        query_executor.run_query("DROP TABLE {project_name}.{sample_name}".format(
+            project_name=project_name, sample_name=sample_name), cache=False)
+def _sample_profile(column_list, project_name, table_name, source, numeric_columns, percent,
+                    method, terms, buckets, confidence):
+    """Profiles the columns on the rows of source, the sample of the table."""
+    #the sample statistics and the row count of the table run with the profile.
+    sample_data = query_executor.submit(_sample_query(numeric_columns, source))
+    #a count of all the rows is answered from the table metadata without a scan.
+    total_data = query_executor.submit(
+        "SELECT COUNT(*) as total_rows FROM {project_name}.{table_name}".format(
+            project_name=project_name, table_name=table_name))
+    profile = univariate.table_profile(column_list, project_name, table_name, terms, buckets,
+                                       sample=source)
+    sample = sample_data.result().iloc[0]
+    info = {'percent': percent, 'method': method,
+            'total_rows': int(total_data.result()['total_rows'].iloc[0]),
+            'rows': int(sample['sample_rows']), 'rows_0': int(sample['sample_rows_0']),
+            'rows_1': int(sample['sample_rows_1']),
+            'count': {i: int(sample[i+'__count']) for i in numeric_columns},
+            'quantiles': {i: np.asarray(sample[i+'__quantiles'], dtype='float64')
+                          for i in numeric_columns}}
+    return with_bounds(profile, info, confidence)
+def local_fast_profile(column_list, project_name, table_name, percent=1, seed=0,
+                       terms=10, buckets=10, confidence=0.95):
+    """This function profiles the columns on a random sample of the rows of a table
+    of the local backend, the same way as fast_profile.
+    Parameters required:a.)column_list:Name of all columns to be profiled.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)percent: The percentage of rows to sample, 100 or more
+                        profiles the whole table.
+                        e.)seed: The seed of the sample, see local_backend.sample_table.
+                        f.)terms: number of top terms for the categorical columns.
+                        g.)buckets: The number of buckets for the numeric columns.
+                        h.)confidence: The confidence level of the intervals.
+    Result: The same dictionary as fast_profile."""
+    if percent >= 100:
+        profile = local_backend.table_profile(column_list, project_name, table_name,
+                                              terms, buckets)
+        return with_bounds(profile, None, confidence)
+    sample_name = local_backend.sample_table(project_name, table_name, percent, seed)
+    profile = local_backend.table_profile(column_list, project_name, sample_name,
+                                          terms, buckets)
+    label = local_backend.read_columns(['label'], project_name, sample_name)['label']
+    info = {'percent': percent, 'method': 'random',
+            'total_rows': local_backend.row_count(project_name, table_name),
+            'rows': len(label), 'rows_0': int((label == 0).sum()),
+            'rows_1': int((label == 1).sum()), 'count': {}, 'quantiles': {}}
+    grid = np.linspace(0, 1, QUANTILE_GRID+1)
+    for i in column_list:
+        if 'numeric_data_overview' in profile[i]:
+            values = local_backend.read_columns([i], project_name, sample_name)[i]
+            values = pd.to_numeric(values, errors='coerce').dropna().to_numpy(dtype='float64')
+            info['count'][i] = len(values)
+            info['quantiles'][i] = np.quantile(values, grid, method='inverted_cdf') \
+                if len(values) else np.full(len(grid), np.nan)
+    return with_bounds(profile, info, confidence)
+def progressive_profile(column_list, project_name, table_name, percents=(1, 10, 100),
+                        tolerance=None, profile_func=fast_profile, **kwargs):
+    """This function profiles the columns on larger and larger samples, so a rough
+    profile is ready in seconds and can be refined while it is being looked at.
+    Parameters required:a.)column_list:Name of all columns to be profiled.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)percents: The sample percentages in increasing order, 100
+                        being the exact profile.
+                        e.)tolerance: Stop once every coverage interval is narrower than
+                        this many percentage points on both sides, never if not passed.
+                        f.)profile_func: fast_profile for bigquery or local_fast_profile
+                        for the local backend, the other parameters are passed to it.
+    Result: A generator giving the profile of every sample in turn."""
+    for i in percents:
+        profile = profile_func(column_list, project_name, table_name, percent=i, **kwargs)
+        yield profile
+        if tolerance is not None and margin(profile) <= tolerance:
+            return
+def margin(profile):
+    """This function gives the widest half width of the coverage intervals of a profile.
+    Parameters required:a.)profile: A profile made by fast_profile.
+    Result: The margin in percentage points, 0 for the exact profile."""
+    widest = 0.0
+    for i in profile.values():
+        for j in ('count_coverage_numeric', 'count_coverage_categorical'):
+            if j in i and len(i[j]):
+                width = (i[j]['Coverage_upper']-i[j]['Coverage_lower']).max()/2
+                widest = max(widest, float(width))
+    return widest
+def _proportion_bounds(count, rows, z):
+    """Gives the Wilson interval of the proportions count/rows in percentages."""
+    count = np.asarray(count, dtype='float64')
+    if rows == 0:
+        return np.full(count.shape, np.nan), np.full(count.shape, np.nan)
+    share = count/rows
+    factor = 1+z*z/rows
+    centre = (share+z*z/(2*rows))/factor
+    width = z*np.sqrt(share*(1-share)/rows+z*z/(4*rows*rows))/factor
+    return (centre-width)*100, (centre+width)*100
+def _quantile_bounds(grid, share, count, z):
+    """Gives the interval of a quantile from the order statistics around it."""
+    if count == 0 or np.isnan(grid).all():
+        return np.nan, np.nan
+    width = z*math.sqrt(share*(1-share)/count)
+    last = len(grid)-1
+    lower = grid[max(0, int(math.floor((share-width)*last)))]
+    upper = grid[min(last, int(math.ceil((share+width)*last)))]
+    return lower, upper
+def _coverage_bounds(data, coverage, rows, z, scale=None):
+    """Adds the interval columns of a coverage column, and scales its counts."""
+    data = data.copy()
+    if z == 0:
+        lower = upper = data[coverage]
+    else:
+        lower, upper = _proportion_bounds(data[coverage]*rows/100, rows, z)
+    data[coverage+'_lower'] = lower
+    data[coverage+'_upper'] = upper
+    if scale is not None:
+        data['Count'] = data['Count']*scale
+    return data
+def with_bounds(profile, info, confidence=0.95):
+    """This function scales the counts of a profile made on a sample to the whole
+    table and adds the confidence intervals.
+    Parameters required:a.)profile: The dictionary of a table_profile made on the sample.
+                        b.)info: The sample sizes found by fast_profile, None if the
+                        profile is exact.
+                        c.)confidence: The confidence level of the intervals.
+    Result: The profile where every column has a 'sample' dictionary with the percent,
+            rows and total_rows, numeric_data_overview has lower and upper columns,
+            the coverages have _lower and _upper columns, the Count columns and the
+            count_null and total_count of categorical_overview are scaled to the
+            whole table, while distinct is the number of distinct values in the sample."""
+    if info is None:
+        #the exact profile gets intervals of zero width.
+        z, scale, exact = 0.0, None, True
+        info = {'percent': 100, 'method': None, 'total_rows': None, 'rows': None}
+    else:
+        z, exact = NormalDist().inv_cdf((1+confidence)/2), False
+        scale = info['total_rows']/info['rows'] if info['rows'] else np.nan
+    sample = {'percent': info['percent'], 'method': info['method'], 'rows': info['rows'],
+              'total_rows': info['total_rows'], 'confidence': confidence, 'exact': exact}
+    rows, rows_0, rows_1 = (info.get(i) or 0 for i in ('rows', 'rows_0', 'rows_1'))
+    for column_name, result in profile.items():
+        result['sample'] = sample
+        if 'numeric_data_overview' in result:
+            overview = result['numeric_data_overview'].copy()
+            overview['lower'] = overview['upper'] = np.nan
+            if exact:
+                overview['lower'] = overview['upper'] = overview[column_name]
+            else:
+                count = info['count'][column_name]
+                mean, deviation = overview.at['Mean', column_name], overview.at[
+                    'St_deviation', column_name]
+                if count > 1:
+                    overview.loc['Mean', ['lower', 'upper']] = [
+                        mean-z*deviation/math.sqrt(count), mean+z*deviation/math.sqrt(count)]
+                for i, share in _QUANTILE_ROWS.items():
+                    overview.loc[i, ['lower', 'upper']] = _quantile_bounds(
+                        info['quantiles'][column_name], share, count, z)
+            result['numeric_data_overview'] = overview
+        for i in ('count_coverage_numeric', 'count_coverage_categorical'):
+            if i in result:
+                result[i] = _coverage_bounds(result[i], 'Coverage', rows, z, scale)
+        for i in ('compare_leads_numeric', 'compare_leads_categorical'):
+            if i in result:
+                data = _coverage_bounds(result[i], 'non_converted_coverage', rows_0, z)
+                result[i] = _coverage_bounds(data, 'converted_coverage', rows_1, z)
+        if 'categorical_overview' in result and scale is not None:
+            overview = result['categorical_overview'].copy()
+            overview[['count_null', 'total_count']] = overview[
+                ['count_null', 'total_count']].astype('float64')*scale
+            result['categorical_overview'] = overview
+    return profile
@@ -0,0 +1,73 @@
+"""This module contains the schema catalog which gets the datatypes of all the
+columns of a table with a single INFORMATION_SCHEMA.COLUMNS query and keeps them
+for the session, so univariate and decision_tree do not have to query the
+datatype of every column one by one."""
+import threading
+import query_executor
+#datatypes treated as numeric, string and timestamp columns by univariate and decision_tree.
+NUMERIC_TYPES = ("INT64", "FLOAT64")
+STRING_TYPES = ("STRING",)
+TIMESTAMP_TYPES = ("TIMESTAMP", "DATETIME", "DATE", "TIME")
+class SchemaCatalog:
+    """The datatypes of the columns of a table.
+    Parameters required:a.)project_name: The project name in which the table is located
+                        b.)table_name: Name of the table.
+                        c.)types: A dictionary with the column names and their datatypes."""
+    def __init__(self, project_name, table_name, types):
+        self.project_name = project_name
+        self.table_name = table_name
+        self.types = dict(types)
+    def data_type(self, column_name):
+        """This function gives the datatype of a column, None if it is not in the table."""
+        return self.types.get(column_name)
+    def columns_of_type(self, data_types, column_list=None):
+        """This function gives the columns having one of the datatypes.
+        Parameters required:a.)data_types: The datatypes asked for.
+                            b.)column_list: The columns to choose from, in their
+                            order, all the columns of the table if not passed.
+        Result: A list with the names of the columns."""
+        if column_list is None:
+            column_list = list(self.types)
+        return [i for i in column_list if self.types.get(i) in data_types]
+    def numeric_columns(self, column_list=None):
+        """This function gives the INT64 and FLOAT64 columns."""
+        return self.columns_of_type(NUMERIC_TYPES, column_list)
+    def string_columns(self, column_list=None):
+        """This function gives the STRING columns."""
+        return self.columns_of_type(STRING_TYPES, column_list)
+    def timestamp_columns(self, column_list=None):
+        """This function gives the TIMESTAMP, DATETIME, DATE and TIME columns."""
+        return self.columns_of_type(TIMESTAMP_TYPES, column_list)
+    def groups(self, column_list=None):
+        """This function splits the columns into the numeric, string and timestamp groups.
+        Parameters required:a.)column_list: The columns to split, all the columns if not passed.
+        Result: A dictionary with the keys numeric, string and timestamp."""
+        return {'numeric': self.numeric_columns(column_list),
+                'string': self.string_columns(column_list),
+                'timestamp': self.timestamp_columns(column_list)}
+_CATALOGS = {}
+_CATALOGS_LOCK = threading.Lock()
+def get_catalog(project_name, table_name):
+    """This function gives the schema catalog of a table, the datatypes are
+    queried only the first time the table is asked for in the session.
+    Parameters required:a.)project_name: The project name in which the table is located
+                        b.)table_name: Name of the table.
+    Result: The SchemaCatalog of the table."""
+    key = (project_name, table_name)
+    with _CATALOGS_LOCK:
+        catalog = _CATALOGS.get(key)
+    if catalog is None:
+        query = """SELECT COLUMN_NAME, DATA_TYPE FROM {project_name}.INFORMATION_SCHEMA.COLUMNS
+                WHERE table_name="{table_name}";""".format(
+                    project_name=project_name, table_name=table_name)
+        data = query_executor.run_query(query)
+        catalog = SchemaCatalog(project_name, table_name,
+                                zip(data['COLUMN_NAME'], data['DATA_TYPE']))
+        with _CATALOGS_LOCK:
+            catalog = _CATALOGS.setdefault(key, catalog)
+    return catalog
+def clear_catalogs():
+    """This function forgets the datatypes of every table, for example after
+    the schema of a table has been changed."""
+    with _CATALOGS_LOCK:
+        _CATALOGS.clear()
@@ -0,0 +1,177 @@
+"""This module contains the exported decision tree model and its batch scorer.
+The fitted tree is saved as flat numpy arrays, one .npy file for each of the split
+feature, threshold, children and class probabilities of the nodes, which are memory
+mapped when the model is loaded, alongwith a model.json holding the preprocessing
+state. Scoring applies the preprocessing and walks all the rows down the tree
+together one level at a time, chunk by chunk, without scikit-learn."""
+import json
+import os
+import numpy as np
+import pandas as pd
+import preprocessing
+#the version of the layout of the exported model.
+MODEL_VERSION = 1
+#the node arrays saved from the fitted tree.
+_NODE_ARRAYS = ('feature', 'threshold', 'children_left', 'children_right', 'value')
+def export_model(tree, state, directory, params=None, bin_edges=None):
+    """This function saves a fitted decision tree with its preprocessing state.
+    Parameters required:a.)tree: The fitted DecisionTreeClassifier.
+                        b.)state: The preprocessing state the tree was trained with.
+                        c.)directory: The directory the model is written to.
+                        d.)params: The hyperparameters to be recorded with the model.
+                        e.)bin_edges: The edges of the bins of every feature when the
+                        tree was fitted on the bin codes of binning.bin_matrix, its
+                        thresholds are saved as raw values so it scores the raw rows.
+    Result: The directory of the model."""
+    os.makedirs(directory, exist_ok=True)
+    nodes = tree.tree_
+    value = nodes.value[:, 0, :].astype('float64')
+    #the counts or fractions of every class are kept as the probabilities.
+    value = value/np.maximum(value.sum(axis=1, keepdims=True), np.finfo('float64').tiny)
+    arrays = {'feature': nodes.feature.astype('int32'),
+              'threshold': nodes.threshold.astype('float64'),
+              'children_left': nodes.children_left.astype('int32'),
+              'children_right': nodes.children_right.astype('int32'),
+              'value': value}
+    missing = getattr(nodes, 'missing_go_to_left', None)
+    if bin_edges is not None:
+        import binning
+        arrays['threshold'] = binning.raw_thresholds(nodes.feature, nodes.threshold, bin_edges)
+        #the bin codes had no missing values, the nulls had the last code and went right.
+        missing = None
+        if os.path.isfile(os.path.join(directory, 'missing_go_to_left.npy')):
+            os.remove(os.path.join(directory, 'missing_go_to_left.npy'))
+        np.savez(os.path.join(directory, 'bin_edges.npz'),
+                 **{"f{position}".format(position=i): j for i, j in enumerate(bin_edges)})
+    if missing is not None:
+        arrays['missing_go_to_left'] = np.asarray(missing, dtype='uint8')
+    for i, array in arrays.items():
+        np.save(os.path.join(directory, i+'.npy'), array)
+    model = {'version': MODEL_VERSION, 'classes': np.asarray(tree.classes_).tolist(),
+             'max_depth': int(nodes.max_depth), 'n_features': int(nodes.n_features),
+             'params': params or {}, 'state': state, 'binned': bin_edges is not None}
+    if model['n_features'] != len(state['feature_names']):
+        raise ValueError("The tree has {n} features but the state has {m}".format(
+            n=model['n_features'], m=len(state['feature_names'])))
+    with open(os.path.join(directory, 'model.json'), 'w') as model_file:
+        json.dump(model, model_file, indent=1, default=_json_value)
+    return directory
+def _json_value(value):
+    """Converts the numpy scalars of the state for json."""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("{value!r} cannot be saved in model.json".format(value=value))
+def load_model(directory, mmap_mode='r'):
+    """This function loads a model saved by export_model.
+    Parameters required:a.)directory: The directory of the model.
+                        b.)mmap_mode: How the node arrays are memory mapped, None to
+                        read them into memory.
+    Result: The TreeModel."""
+    with open(os.path.join(directory, 'model.json')) as model_file:
+        model = json.load(model_file)
+    if model.get('version') != MODEL_VERSION:
+        raise ValueError("Model version {version} cannot be read, {expected} expected".format(
+            version=model.get('version'), expected=MODEL_VERSION))
+    arrays = {i: np.load(os.path.join(directory, i+'.npy'), mmap_mode=mmap_mode)
+              for i in _NODE_ARRAYS}
+    path = os.path.join(directory, 'missing_go_to_left.npy')
+    if os.path.isfile(path):
+        arrays['missing_go_to_left'] = np.load(path, mmap_mode=mmap_mode)
+    return TreeModel(arrays, model['classes'], model['max_depth'], model['state'])
+class TreeModel:
+    """A decision tree as flat node arrays alongwith its preprocessing state.
+    Parameters required:a.)arrays: A dictionary with the node arrays.
+                        b.)classes: The classes of the tree.
+                        c.)max_depth: The depth of the tree.
+                        d.)state: The preprocessing state."""
+    def __init__(self, arrays, classes, max_depth, state):
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.children_left = arrays['children_left']
+        self.children_right = arrays['children_right']
+        self.value = arrays['value']
+        self.missing_go_to_left = arrays.get('missing_go_to_left')
+        self.classes = np.asarray(classes)
+        self.max_depth = max_depth
+        self.state = state
+    def apply(self, matrix):
+        """This function finds the leaf of every row of the feature matrix.
+        Parameters required:a.)matrix: The float32 feature matrix.
+        Result: An array with the node number of the leaf of every row."""
+        node = np.zeros(len(matrix), dtype='int32')
+        rows = np.arange(len(matrix))
+        for _ in range(self.max_depth):
+            left = self.children_left[node]
+            #the leaves have no children, their rows are done.
+            active = np.flatnonzero(left >= 0)
+            if not len(active):
+                break
+            split = node[active]
+            values = matrix[rows[active], self.feature[split]]
+            #the thresholds are compared with float32 values the way scikit-learn does.
+            go_left = values <= self.threshold[split]
+            if self.missing_go_to_left is not None:
+                missing = np.isnan(values)
+                go_left[missing] = self.missing_go_to_left[split[missing]].astype(bool)
+            node[active] = np.where(go_left, left[active], self.children_right[split])
+        return node
+    def predict_proba_matrix(self, matrix):
+        """This function gives the class probabilities of the rows of a feature matrix."""
+        return np.asarray(self.value[self.apply(matrix)])
+    def predict_proba(self, data, chunk_size=100000):
+        """This function scores the rows as extracted from the table.
+        Parameters required:a.)data: A dataframe with the columns of the state.
+                            b.)chunk_size: The number of rows preprocessed at a time.
+        Result: An array with the probability of every class for every row."""
+        return np.concatenate([i for i in self.score_batches(
+            data.iloc[j:j+chunk_size] for j in range(0, len(data), chunk_size))]
+                              or [np.empty((0, len(self.classes)))])
+    def predict(self, data, chunk_size=100000):
+        """This function gives the predicted class of the rows as extracted from the table."""
+        return self.classes[self.predict_proba(data, chunk_size).argmax(axis=1)]
+    def score_batches(self, batches):
+        """This function scores a stream of batches.
+        Parameters required:a.)batches: An iterable of dataframes or pyarrow RecordBatches
+                            with the columns of the state.
+        Result: A generator giving the class probabilities of every batch."""
+        for batch in batches:
+            if not isinstance(batch, pd.DataFrame):
+                batch = batch.to_pandas()
+            matrix, _ = preprocessing.transform(batch, self.state, np.float32)
+            yield self.predict_proba_matrix(matrix)
+def score_parquet(model, input_path, output_path, batch_size=100000, keep_columns=()):
+    """This function scores a parquet file batch by batch into another parquet file.
+    Parameters required:a.)model: The TreeModel, or the directory of the model.
+                        b.)input_path: The parquet file with the columns of the state.
+                        c.)output_path: The parquet file to be written.
+                        d.)batch_size: The number of rows scored at a time.
+                        e.)keep_columns: Columns of the input, like the ids of the
+                        sessions, copied to the output.
+    Result: The number of rows scored."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if not isinstance(model, TreeModel):
+        model = load_model(model)
+    source = pq.ParquetFile(input_path)
+    names = source.schema_arrow.names
+    columns = [i for i in model.state['columns'] if i in names]
+    read = list(dict.fromkeys(columns+list(keep_columns)))
+    written = 0
+    writer = None
+    try:
+        for batch in source.iter_batches(batch_size=batch_size, columns=read):
+            data = batch.to_pandas()
+            probability = next(model.score_batches([data]))
+            result = {i: data[i] for i in keep_columns}
+            result['prediction'] = model.classes[probability.argmax(axis=1)]
+            for position, i in enumerate(model.classes):
+                result['probability_'+str(i)] = probability[:, position]
+            table = pa.Table.from_pandas(pd.DataFrame(result), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table)
+            written += len(data)
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
@@ -0,0 +1,508 @@
+"""This module contains the mergeable profile sketches of a partitioned table.
+For every partition of the table(a daily table of a GA export, or a partition of a
+partitioned table) a small summary of every column is computed on bigquery and kept
+in a local sketch store, so refreshing the profile only scans the partitions added
+since the last refresh and merges their summaries with the stored ones.
+The summaries are the count, mean, sum of squared deviations, min and max of the
+numeric columns along with a quantile digest, and the counts of the most frequent
+values along with the HyperLogLog registers of the categorical columns, all of them
+split by label, from which the univariate outputs are rebuilt without bigquery.
+The store is a directory with a manifest.json and a numpy .npz file per partition."""
+import json
+import os
+import numpy as np
+import pandas as pd
+import query_executor
+import schema_catalog
+import univariate
+#the version of the layout of the store, stores of another version are rebuilt.
+SKETCH_VERSION = 2
+#the label groups every summary is split by, the last one for any other label.
+LABEL_GROUPS = (0, 1, -1)
+_NUMERIC_ARRAYS = ('moments', 'nulls', 'digest', 'weights')
+_COUNT_COLUMNS = ['Count', 'count_0', 'count_1']
+class TableSketch:
+    """The merged summaries of the partitions of a table.
+    Parameters required:a.)rows: The number of rows of every label group.
+                        b.)numeric: A dictionary with the numeric columns and their
+                        moments, nulls and digest of every label group.
+                        c.)categorical: A dictionary with the categorical columns and
+                        their value counts, nulls, rest and HyperLogLog registers.
+                        d.)partitions: The partitions merged in the sketch.
+                        e.)types: A dictionary with the datatype of every column."""
+    def __init__(self, rows, numeric, categorical, partitions, types=None):
+        self.rows = np.asarray(rows, dtype='int64')
+        self.numeric = numeric
+        self.categorical = categorical
+        self.partitions = list(partitions)
+        self.types = dict(types or {})
+    @classmethod
+    def load(cls, path):
+        """This function reads the sketch of a partition from its .npz file."""
+        with np.load(path, allow_pickle=False) as data:
+            arrays = dict(data)
+        numeric, categorical = {}, {}
+        for i in json.loads(str(arrays['numeric_columns'])):
+            numeric[i] = {j: arrays[i+'__'+j] for j in _NUMERIC_ARRAYS}
+        for i in json.loads(str(arrays['categorical_columns'])):
+            categorical[i] = {
+                'counts': pd.DataFrame(arrays[i+'__counts'], columns=_COUNT_COLUMNS,
+                                       index=pd.Index(arrays[i+'__values'], dtype=object)),
+                'nulls': arrays[i+'__nulls'], 'rest': arrays[i+'__rest'],
+                'registers': arrays[i+'__registers']}
+        return cls(arrays['rows'], numeric, categorical, [str(arrays['partition'])],
+                   json.loads(str(arrays['types'])))
+    def save(self, path):
+        """This function writes the sketch of a single partition to an .npz file."""
+        arrays = {'rows': self.rows, 'partition': np.array(self.partitions[0]),
+                  'numeric_columns': np.array(json.dumps(list(self.numeric))),
+                  'categorical_columns': np.array(json.dumps(list(self.categorical))),
+                  'types': np.array(json.dumps(self.types))}
+        for i, sketch in self.numeric.items():
+            for j in _NUMERIC_ARRAYS:
+                arrays[i+'__'+j] = sketch[j]
+        for i, sketch in self.categorical.items():
+            arrays[i+'__values'] = np.array(sketch['counts'].index, dtype=str)
+            arrays[i+'__counts'] = sketch['counts'].to_numpy(dtype='int64')
+            for j in ('nulls', 'rest', 'registers'):
+                arrays[i+'__'+j] = sketch[j]
+        #written to a temporary file first so a broken refresh leaves no partial sketch.
+        temporary = path+'.tmp.npz'
+        np.savez_compressed(temporary, **arrays)
+        os.replace(temporary, path)
+    def merge(self, other, digest_size=200):
+        """This function merges the summaries of two sketches.
+        Parameters required:a.)other: The TableSketch to merge with.
+                            b.)digest_size: The quantile digests larger than 8 times
+                            this are compressed.
+        Result: A new TableSketch with the columns of both."""
+        numeric = dict(self.numeric)
+        for i, sketch in other.numeric.items():
+            numeric[i] = _merge_numeric(numeric[i], sketch, digest_size) \
+                if i in numeric else sketch
+        categorical = dict(self.categorical)
+        for i, sketch in other.categorical.items():
+            categorical[i] = _merge_categorical(categorical[i], sketch) \
+                if i in categorical else sketch
+        return TableSketch(self.rows+other.rows, numeric, categorical,
+                           self.partitions+other.partitions, {**self.types, **other.types})
+    def _digest(self, column_name, groups=LABEL_GROUPS):
+        """Gives the points and weights of the quantile digest of the label groups."""
+        sketch = self.numeric[column_name]
+        index = [LABEL_GROUPS.index(i) for i in groups]
+        points, weights = sketch['digest'][index].ravel(), sketch['weights'][index].ravel()
+        present = weights > 0
+        return points[present], weights[present]
+    def _moments(self, column_name):
+        """Gives the count, mean, sum of squared deviations, min and max of all the rows."""
+        moments = self.numeric[column_name]['moments']
+        return _combine_moments(moments)
+    def _bucket_stats(self, column_name):
+        """Gives the Mean,St_deviation,min and max used by bucket_case."""
+        count, mean, squares, minimum, maximum = self._moments(column_name)
+        deviation = np.sqrt(squares/(count-1)) if count > 1 else np.nan
+        return pd.DataFrame([[mean], [deviation], [minimum], [maximum]])
+    def numeric_data_overview(self, column_name):
+        """This function gives the output of univariate.numeric_data_overview, with the
+        mean, standard deviation, min and max exact and the quantiles from the digest."""
+        count, mean, squares, minimum, maximum = self._moments(column_name)
+        deviation = np.sqrt(squares/(count-1)) if count > 1 else np.nan
+        points, weights = self._digest(column_name)
+        quantiles = [_weighted_quantile(points, weights, i) for i in (0.25, 0.5, 0.75)]
+        return pd.DataFrame({column_name: [mean, deviation, minimum]+quantiles+[maximum]},
+                            index=['Mean', 'St_deviation', 'min', 'quantile_25',
+                                   'quantile_50', 'quantile_75', 'max'])
+    def dynamic_bucket(self, column_name, buckets=10):
+        """This function gives the CASE conditions of univariate.dynamic_bucket."""
+        return univariate.bucket_case(column_name, self._bucket_stats(column_name), buckets)
+    def _bucket_counts(self, column_name, buckets, group):
+        """Gives the estimated count of every bucket of a label group, nulls included."""
+        points, weights = self._digest(column_name, [group])
+        labels = univariate.bucket_labels(points, self._bucket_stats(column_name), buckets)
+        data = pd.DataFrame({'Buckets': labels, 'Count': weights})
+        nulls = self.numeric[column_name]['nulls'][LABEL_GROUPS.index(group)]
+        if nulls:
+            data.loc[len(data)] = [None, nulls]
+        data = data.groupby('Buckets', dropna=False, sort=False)['Count'].sum().reset_index()
+        data['Count'] = np.rint(data['Count']).astype('int64')
+        return data
+    def count_coverage_numeric(self, column_name, buckets=10):
+        """This function gives the output of univariate.count_coverage_numeric, with the
+        counts of the buckets estimated from the digest."""
+        data = pd.concat([self._bucket_counts(column_name, buckets, i) for i in LABEL_GROUPS])
+        return univariate._coverage_from_counts(data, 'Buckets', 'Count')
+    def compare_leads_numeric(self, column_name, buckets=10):
+        """This function gives the output of univariate.compare_leads_numeric, with the
+        counts of the buckets estimated from the digest."""
+        data = pd.concat([self._bucket_counts(column_name, buckets, i).assign(label=i)
+                          for i in (0, 1)])
+        return univariate._compare_from_label_counts(data)
+    def _value_counts(self, column_name):
+        """Gives the counts of the kept values with the null row added."""
+        sketch = self.categorical[column_name]
+        counts = sketch['counts'].rename_axis('value').reset_index()
+        if sketch['nulls'][0]:
+            counts.loc[len(counts)] = [None]+list(sketch['nulls'])
+        return counts.astype(dict.fromkeys(_COUNT_COLUMNS, 'int64'))
+    def categorical_overview(self, column_name):
+        """This function gives the output of univariate.categorical_overview, with the
+        number of distinct values estimated by HyperLogLog."""
+        sketch = self.categorical[column_name]
+        count_null = int(sketch['nulls'][0])
+        return pd.DataFrame({'distinct': [_hll_estimate(sketch['registers'])],
+                             'count_null': [count_null if count_null else None],
+                             'total_count': [int(self.rows.sum())-count_null]})
+    def count_coverage_categorical(self, column_name, terms=10):
+        """This function gives the output of univariate.count_coverage_categorical, the
+        counts of values not kept in every partition being lower bounds."""
+        result = self._value_counts(column_name)
+        result['Coverage'] = result['Count']*100/self.rows.sum()
+        result = result.sort_values('Coverage', ascending=False, kind='stable').head(terms)
+        result = result[['value', 'Count', 'Coverage']].rename(columns={'value': column_name})
+        return result.reset_index(drop=True)
+    def compare_leads_categorical(self, column_name, terms=10):
+        """This function gives the output of univariate.compare_leads_categorical."""
+        data = self._value_counts(column_name).rename(columns={'value': column_name})
+        data['total_0'] = self.rows[0]
+        data['total_1'] = self.rows[1]
+        both = (data['count_0'] > 0) & (data['count_1'] > 0) & data[column_name].notna()
+        for i in ('0', '1'):
+            data['rank_'+i] = data['count_'+i].where(both, -1).rank(method='first', ascending=False)
+        return univariate._compare_leads_terms(data, column_name, terms)
+    def profile(self, column_list, terms=10, buckets=10):
+        """This function gives the same dictionary as univariate.table_profile.
+        Parameters required:a.)column_list: The columns to be profiled.
+                            b.)terms: number of top terms for the categorical columns.
+                            c.)buckets: The number of buckets for the numeric columns.
+        Result: A dictionary with the column names as keys, each holding a dictionary
+                with the outputs keyed on the name of the function."""
+        profile = {}
+        for i in column_list:
+            profile[i] = {}
+            if i in self.numeric:
+                profile[i]['data_type'] = self.types.get(i, "FLOAT64")
+                profile[i]['dynamic_bucket'] = self.dynamic_bucket(i, buckets)
+                profile[i]['numeric_data_overview'] = self.numeric_data_overview(i)
+                profile[i]['count_coverage_numeric'] = self.count_coverage_numeric(i, buckets)
+                profile[i]['compare_leads_numeric'] = self.compare_leads_numeric(i, buckets)
+            elif i in self.categorical:
+                profile[i]['data_type'] = self.types.get(i, "STRING")
+                profile[i]['categorical_overview'] = self.categorical_overview(i)
+                profile[i]['count_coverage_categorical'] = self.count_coverage_categorical(
+                    i, terms)
+                profile[i]['compare_leads_categorical'] = self.compare_leads_categorical(
+                    i, terms)
+        return profile
+def _combine_moments(moments):
+    """Combines the count, mean, sum of squared deviations, min and max of groups of rows."""
+    count, mean, squares = 0, 0.0, 0.0
+    minimum, maximum = np.nan, np.nan
+    for i in moments:
+        if not i[0]:
+            continue
+        total = count+i[0]
+        delta = i[1]-mean
+        mean = mean+delta*i[0]/total
+        squares = squares+i[2]+delta*delta*count*i[0]/total
+        count = total
+        minimum = np.fmin(minimum, i[3])
+        maximum = np.fmax(maximum, i[4])
+    return count, (mean if count else np.nan), squares, minimum, maximum
+def _merge_numeric(first, second, digest_size):
+    """Merges the numeric summaries of two sketches, group by group."""
+    moments = np.array([_combine_moments([i, j]) for i, j in
+                        zip(first['moments'], second['moments'])], dtype='float64')
+    digest, weights = [], []
+    for i in range(len(LABEL_GROUPS)):
+        points = np.concatenate([first['digest'][i], second['digest'][i]])
+        weight = np.concatenate([first['weights'][i], second['weights'][i]])
+        points, weight = _compress(points, weight, digest_size*8)
+        digest.append(points)
+        weights.append(weight)
+    #the groups are padded to the same length with points of weight zero.
+    width = max(len(i) for i in digest)
+    digest = np.array([np.pad(i, (0, width-len(i))) for i in digest])
+    weights = np.array([np.pad(i, (0, width-len(i))) for i in weights])
+    return {'moments': moments, 'nulls': first['nulls']+second['nulls'],
+            'digest': digest, 'weights': weights}
+def _compress(points, weights, size):
+    """Replaces the weighted points by size points of equal weight at the same
+    quantiles, when there are more than size of them."""
+    present = weights > 0
+    points, weights = points[present], weights[present]
+    if len(points) <= size:
+        return points, weights
+    order = np.argsort(points, kind='stable')
+    points, weights = points[order], weights[order]
+    cumulative = np.cumsum(weights)
+    total = cumulative[-1]
+    #the midpoint of every new point's share of the weight.
+    ranks = (np.arange(size)+0.5)*total/size
+    return points[np.searchsorted(cumulative, ranks)], np.full(size, total/size)
+def _merge_categorical(first, second):
+    """Merges the categorical summaries of two sketches."""
+    counts = first['counts'].add(second['counts'], fill_value=0).astype('int64')
+    return {'counts': counts, 'nulls': first['nulls']+second['nulls'],
+            'rest': first['rest']+second['rest'],
+            'registers': np.maximum(first['registers'], second['registers'])}
+def _weighted_quantile(points, weights, share):
+    """Gives the quantile of the weighted points, the same as the inverted cdf."""
+    if len(points) == 0:
+        return np.nan
+    order = np.argsort(points, kind='stable')
+    cumulative = np.cumsum(weights[order])
+    position = np.searchsorted(cumulative, share*cumulative[-1], side='left')
+    return points[order][min(position, len(points)-1)]
+def _hll_estimate(registers):
+    """Estimates the number of distinct values from the HyperLogLog registers."""
+    size = len(registers)
+    alpha = 0.7213/(1+1.079/size)
+    estimate = alpha*size*size/np.sum(np.exp2(-registers.astype('float64')))
+    zeros = int(np.sum(registers == 0))
+    #linear counting is more accurate while many registers are still empty.
+    if estimate <= 2.5*size and zeros:
+        estimate = size*np.log(size/zeros)
+    return int(round(estimate))
+class SketchStore:
+    """A local directory of the per partition sketches of tables.
+    Parameters required:a.)directory: The directory the sketches are kept in.
+                        b.)digest_size: The number of quantiles of the digest of
+                        every numeric column, label group and partition.
+                        c.)capacity: The number of most frequent values kept for
+                        every categorical column and partition.
+                        d.)precision: The HyperLogLog precision, with 2**precision registers."""
+    def __init__(self, directory=".sketches", digest_size=200, capacity=1000, precision=12):
+        self.directory = directory
+        self.digest_size = digest_size
+        self.capacity = capacity
+        self.precision = precision
+    def _path(self, project_name, table_name):
+        return os.path.join(self.directory, "{project_name}.{table_name}".format(
+            project_name=project_name, table_name=table_name.replace('*', '_')))
+    def manifest(self, project_name, table_name):
+        """This function reads the manifest of a table, None if it has no sketches or
+        they were made with another version or other settings."""
+        path = os.path.join(self._path(project_name, table_name), 'manifest.json')
+        if not os.path.isfile(path):
+            return None
+        with open(path) as file:
+            manifest = json.load(file)
+        settings = {'version': SKETCH_VERSION, 'digest_size': self.digest_size,
+                    'capacity': self.capacity, 'precision': self.precision}
+        if any(manifest.get(i) != j for i, j in settings.items()):
+            return None
+        return manifest
+    def _write_manifest(self, project_name, table_name, manifest):
+        path = os.path.join(self._path(project_name, table_name), 'manifest.json')
+        with open(path+'.tmp', 'w') as file:
+            json.dump(manifest, file, indent=2, sort_keys=True)
+        os.replace(path+'.tmp', path)
+    def load(self, project_name, table_name, partitions=None):
+        """This function merges the stored sketches of a table without any query.
+        Parameters required:a.)project_name: The project name in which the table is located
+                            b.)table_name: Name of the table.
+                            c.)partitions: The partitions to merge, all of them if not passed.
+        Result: The merged TableSketch, None if no partition is stored."""
+        manifest = self.manifest(project_name, table_name)
+        if manifest is None:
+            return None
+        if partitions is None:
+            partitions = manifest['partitions']
+        path = self._path(project_name, table_name)
+        merged = None
+        for i in sorted(partitions):
+            sketch = TableSketch.load(os.path.join(path, i+'.npz'))
+            merged = sketch if merged is None else merged.merge(sketch, self.digest_size)
+        return merged
+    def refresh(self, column_list, project_name, table_name, partition_column='_TABLE_SUFFIX'):
+        """This function computes the sketches of the partitions not stored yet and
+        merges them with the stored ones.
+        Parameters required:a.)column_list: The columns to be profiled.
+                            b.)project_name: The project name in which the table is located
+                            c.)table_name: Name of the table, like ga_sessions_* for the
+                            daily tables of a GA export.
+                            d.)partition_column: The column or pseudo column telling the
+                            partition of a row, like _TABLE_SUFFIX or DATE(_PARTITIONTIME).
+        Result: The TableSketch of all the partitions."""
+        manifest = self.manifest(project_name, table_name)
+        columns = sorted(set(column_list) | set(manifest['columns'] if manifest else []))
+        if manifest is None or manifest['columns'] != columns or \
+                manifest['partition_column'] != partition_column:
+            #sketches of other columns cannot be merged with the new ones, so all are redone.
+            manifest = {'version': SKETCH_VERSION, 'digest_size': self.digest_size,
+                        'capacity': self.capacity, 'precision': self.precision,
+                        'partition_column': partition_column, 'columns': columns,
+                        'partitions': []}
+        query = """SELECT DISTINCT CAST({partition_column} AS STRING) as partition_id
+                FROM {project_name}.{table_name}""".format(
+                    partition_column=partition_column, project_name=project_name,
+                    table_name=table_name)
+        partitions = sorted(str(i) for i in query_executor.run_query(query)['partition_id'])
+        new = [i for i in partitions if i not in manifest['partitions']]
+        if new:
+            path = self._path(project_name, table_name)
+            os.makedirs(path, exist_ok=True)
+            for sketch in partition_sketches(columns, project_name, table_name, new,
+                                             partition_column, self.digest_size,
+                                             self.capacity, self.precision):
+                sketch.save(os.path.join(path, sketch.partitions[0]+'.npz'))
+            manifest['partitions'] = sorted(manifest['partitions']+new)
+            self._write_manifest(project_name, table_name, manifest)
+        return self.load(project_name, table_name)
+def _partition_filter(partitions, partition_column):
+    """Writes the condition keeping the rows of the partitions."""
+    #compared as strings, the same as the partitions are listed, so integer range
+    #partitions match as well as _TABLE_SUFFIX and dates.
+    return "CAST({partition_column} AS STRING) IN ({values})".format(
+        partition_column=partition_column,
+        values=", ".join('"{value}"'.format(value=i) for i in partitions))
+def _numeric_query(numeric_columns, source, condition, partition_column, digest_size):
+    """Builds the query of the moments and quantile digests of every partition and label group."""
+    select = []
+    for i in numeric_columns:
+        select.append("""COUNT({col_name}) as {col_name}__count,
+            AVG(SAFE_CAST({col_name} AS FLOAT64)) as {col_name}__mean,
+            IFNULL(VAR_POP(SAFE_CAST({col_name} AS FLOAT64)), 0)*COUNT({col_name}) as {col_name}__squares,
+            MIN(SAFE_CAST({col_name} AS FLOAT64)) as {col_name}__min,
+            MAX(SAFE_CAST({col_name} AS FLOAT64)) as {col_name}__max,
+            APPROX_QUANTILES(SAFE_CAST({col_name} AS FLOAT64), {size}) as {col_name}__digest""".format(
+                col_name=i, size=digest_size))
+    query = """SELECT CAST({partition_column} AS STRING) as partition_id,
+            CASE WHEN label IN (0, 1) THEN label ELSE -1 END as label_group,
+            COUNT(*) as rows_count{select}
+            FROM {source}
+            WHERE {condition}
+            Group by partition_id, label_group""".format(
+                partition_column=partition_column,
+                select="".join(",\n            "+i for i in select),
+                source=source, condition=condition)
+    return query
+def _values_query(string_columns, source, condition, partition_column, capacity):
+    """Builds the query of the counts of the most frequent values of every partition,
+    with the null value always kept and the other values summed into a rest row."""
+    structs = ["STRUCT('{col_name}' AS name, CAST({col_name} AS STRING) AS value)".format(
+        col_name=i) for i in string_columns]
+    query = """With table as(
+            SELECT CAST({partition_column} AS STRING) as partition_id, f.name as name,
+            f.value as value, Count(*) as Count,
+            COUNTIF(label=0) as count_0, COUNTIF(label=1) as count_1
+            FROM {source}, UNNEST([{structs}]) as f
+            WHERE {condition}
+            Group by partition_id, name, value),
+            table_2 as(
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY partition_id, name
+                ORDER BY IF(value IS NULL, 1, 0) DESC, Count DESC) as rank_all
+            FROM table)
+            SELECT partition_id, name, value, Count, count_0, count_1, 1 as kept
+            FROM table_2 WHERE rank_all<={capacity}
+            UNION ALL
+            SELECT partition_id, name, NULL as value, SUM(Count) as Count,
+            SUM(count_0) as count_0, SUM(count_1) as count_1, 0 as kept
+            FROM table_2 WHERE rank_all>{capacity}
+            Group by partition_id, name""".format(
+                partition_column=partition_column, source=source, condition=condition,
+                structs=",\n            ".join(structs), capacity=str(capacity))
+    return query
+def _registers_query(string_columns, source, condition, partition_column, precision):
+    """Builds the query of the HyperLogLog registers of every partition, the register
+    of a value being the low bits of its fingerprint and its rank one more than the
+    number of trailing zeros of the other bits."""
+    structs = ["STRUCT('{col_name}' AS name, CAST({col_name} AS STRING) AS value)".format(
+        col_name=i) for i in string_columns]
+    query = """With table as(
+            SELECT CAST({partition_column} AS STRING) as partition_id, f.name as name,
+            FARM_FINGERPRINT(f.value) as fingerprint
+            FROM {source}, UNNEST([{structs}]) as f
+            WHERE {condition} AND f.value IS NOT NULL),
+            table_2 as(
+            SELECT partition_id, name, fingerprint & {mask} as register,
+            fingerprint >> {precision} as rest
+            FROM table)
+            SELECT partition_id, name, register,
+            MAX(LEAST(BIT_COUNT((rest & -rest)-1), {limit})+1) as rank
+            FROM table_2
+            Group by partition_id, name, register""".format(
+                partition_column=partition_column, source=source, condition=condition,
+                structs=",\n            ".join(structs), mask=str(2**precision-1),
+                precision=str(precision), limit=str(64-precision))
+    return query
+def partition_sketches(column_list, project_name, table_name, partitions,
+                       partition_column='_TABLE_SUFFIX', digest_size=200, capacity=1000,
+                       precision=12):
+    """This function computes the sketches of partitions of a table with three queries,
+    whatever the number of partitions and columns is.
+    Parameters required:a.)column_list: The columns to be profiled.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)partitions: The partitions to compute.
+                        e.)partition_column: The column telling the partition of a row.
+                        f.)digest_size, capacity, precision: see SketchStore.
+    Result: A list with a TableSketch for every partition."""
+    catalog = schema_catalog.get_catalog(project_name, table_name)
+    numeric_columns = catalog.numeric_columns(column_list)
+    string_columns = catalog.string_columns(column_list)
+    types = {i: catalog.data_type(i) for i in numeric_columns+string_columns}
+    source = "{project_name}.{table_name}".format(project_name=project_name, table_name=table_name)
+    condition = _partition_filter(partitions, partition_column)
+    queries = [_numeric_query(numeric_columns, source, condition, partition_column, digest_size)]
+    if string_columns:
+        queries.append(_values_query(string_columns, source, condition, partition_column,
+                                     capacity))
+        queries.append(_registers_query(string_columns, source, condition, partition_column,
+                                        precision))
+    results = query_executor.run_queries(queries)
+    moments, values, registers = (results+[None, None])[:3]
+    sketches = []
+    for i in partitions:
+        data = moments[moments['partition_id'] == i]
+        groups = [data[data['label_group'] == j] for j in LABEL_GROUPS]
+        rows = [int(j['rows_count'].iloc[0]) if len(j) else 0 for j in groups]
+        numeric = {j: _numeric_sketch(groups, j, digest_size) for j in numeric_columns}
+        categorical = {}
+        for j in string_columns:
+            part = values[(values['partition_id'] == i) & (values['name'] == j)]
+            part_registers = registers[(registers['partition_id'] == i) &
+                                       (registers['name'] == j)]
+            categorical[j] = _categorical_sketch(part, part_registers, precision)
+        sketches.append(TableSketch(rows, numeric, categorical, [i], types))
+    return sketches
+def _numeric_sketch(groups, column_name, digest_size):
+    """Builds the numeric summary of a column from the rows of the label groups."""
+    moments = np.zeros((len(LABEL_GROUPS), 5))
+    nulls = np.zeros(len(LABEL_GROUPS), dtype='int64')
+    digest = np.zeros((len(LABEL_GROUPS), digest_size+1))
+    weights = np.zeros((len(LABEL_GROUPS), digest_size+1))
+    for position, data in enumerate(groups):
+        if not len(data):
+            continue
+        row = data.iloc[0]
+        count = int(row[column_name+'__count'])
+        nulls[position] = int(row['rows_count'])-count
+        if count:
+            moments[position] = [count, row[column_name+'__mean'],
+                                 row[column_name+'__squares'], row[column_name+'__min'],
+                                 row[column_name+'__max']]
+            points = np.asarray(row[column_name+'__digest'], dtype='float64')
+            #every quantile stands for the rows half way to its neighbours,
+            #so the min and max stand for half as many as the others.
+            share = np.full(len(points), count/max(len(points)-1, 1))
+            share[[0, -1]] = share[[0, -1]]/2 if len(points) > 1 else count
+            digest[position, :len(points)] = points
+            weights[position, :len(points)] = share
+    return {'moments': moments, 'nulls': nulls, 'digest': digest, 'weights': weights}
+def _categorical_sketch(values, registers, precision):
+    """Builds the categorical summary of a column from its value counts and registers."""
+    columns = _COUNT_COLUMNS
+    kept = values[values['kept'] == 1]
+    nulls = kept[kept['value'].isna()]
+    kept = kept[kept['value'].notna()]
+    rest = values[values['kept'] == 0]
+    counts = pd.DataFrame(kept[columns].to_numpy(dtype='int64'), columns=columns,
+                          index=pd.Index(kept['value'].astype(str), dtype=object))
+    result = np.zeros(2**precision, dtype='uint8')
+    result[registers['register'].to_numpy(dtype='int64')] = registers['rank'].to_numpy(
+        dtype='uint8')
+    return {'counts': counts,
+            'nulls': nulls[columns].to_numpy(dtype='int64').sum(axis=0),
+            'rest': rest[columns].to_numpy(dtype='int64').sum(axis=0),
+            'registers': result}
@@ -0,0 +1,86 @@
+"""This module contains the streaming extraction of the decision tree dataset.
+Instead of converting the whole result of the query to a dataframe, the rows are
+read as arrow record batches, through the BigQuery Storage Read API when it is
+installed, and every batch is filled, grouped and one hot encoded on its own and
+written into a preallocated training matrix or a parquet file, so the memory used
+depends on the batch size and not on the size of the table. The queries are run by
+the shared executor, decision_tree trains on the extracted matrix with the 'stream'
+encoding."""
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import decision_tree
+import preprocessing
+import query_executor
+def _storage_client():
+    """Makes a BigQuery Storage Read API client, None if the package is not installed."""
+    try:
+        from google.cloud import bigquery_storage
+    except ImportError:
+        return None
+    return bigquery_storage.BigQueryReadClient()
+def iter_batches(query, batch_size=100000, use_storage_api=True):
+    """This function runs the query with the shared executor and gives its result
+    batch by batch.
+    Parameters required:a.)query: The query which is to be run on bigquery.
+                        b.)batch_size: The largest number of rows in a batch.
+                        c.)use_storage_api: Whether to read the result through the
+                        BigQuery Storage Read API when it is installed.
+    Result: A tuple with the total number of rows, and an iterator over
+            pyarrow RecordBatches of at most batch_size rows."""
+    storage = _storage_client() if use_storage_api else None
+    return query_executor.stream(query, batch_size, storage)
+def extraction_query(state, project_name, table_name):
+    """This function writes the query extracting the columns of a preprocessing state,
+    with the null values filled inside bigquery and visitStartTime left as it is."""
+    return decision_tree.dataset_query(state['columns'], project_name, table_name,
+                                       state['fill_values'])
+def extract_matrix(state, project_name, table_name, batch_size=100000, dtype=np.float32):
+    """This function extracts the training matrix of the dataset batch by batch
+    into a preallocated array.
+    Parameters required:a.)state: The preprocessing state from preprocessing.fit.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)batch_size: The number of rows processed at a time.
+                        e.)dtype: The dtype of the matrix.
+    Result: A tuple with the feature matrix, the label array, None if the state has
+            no label, and the feature names."""
+    total_rows, batches = iter_batches(
+        extraction_query(state, project_name, table_name), batch_size)
+    matrix = np.empty((total_rows, len(state['feature_names'])), dtype=dtype)
+    label = np.empty(total_rows, dtype=np.int64) if 'label' in state['columns'] else None
+    position = 0
+    for batch in batches:
+        features, labels = preprocessing.transform(batch.to_pandas(), state, dtype)
+        matrix[position:position+len(features)] = features
+        if label is not None:
+            label[position:position+len(features)] = labels
+        position += len(features)
+    if label is not None:
+        label = label[:position]
+    return matrix[:position], label, state['feature_names']
+def extract_parquet(state, project_name, table_name, path, batch_size=100000):
+    """This function writes the one hot encoded dataset to a local parquet file
+    batch by batch.
+    Parameters required:a.)state: The preprocessing state from preprocessing.fit.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)path: The parquet file to be written.
+                        e.)batch_size: The number of rows processed at a time.
+    Result: The number of rows written."""
+    names = state['feature_names']
+    fields = [(i, pa.float32()) for i in names]
+    if 'label' in state['columns']:
+        fields.append(('label', pa.int64()))
+    schema = pa.schema(fields)
+    _, batches = iter_batches(extraction_query(state, project_name, table_name), batch_size)
+    written = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in batches:
+            features, labels = preprocessing.transform(batch.to_pandas(), state)
+            arrays = [pa.array(features[:, i]) for i in range(len(names))]
+            if labels is not None:
+                arrays.append(pa.array(labels.astype(np.int64)))
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            written += len(features)
+    return written
@@ -0,0 +1,24 @@
+"""Fixtures of the tests, which run the workflows on the local DuckDB stand-in of
+local_bigquery with the synthetic tables of benchmark instead of bigquery."""
+import os
+import sys
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import benchmark
+import local_bigquery
+import query_executor
+import schema_catalog
+@pytest.fixture
+def table():
+    """The synthetic table, three numeric and three categorical columns."""
+    return benchmark.synthetic_table(5000, 3, 3, cardinality=30, null_rate=0.05,
+                                     positive_rate=0.2)
+@pytest.fixture
+def client(table):
+    """A LocalClient with the table as tests.sessions, used by the shared executor."""
+    client = local_bigquery.LocalClient({('tests', 'sessions'): table})
+    previous = query_executor.set_executor(query_executor.QueryExecutor(lambda: client))
+    schema_catalog.clear_catalogs()
+    yield client
+    query_executor.set_executor(previous)
+    schema_catalog.clear_catalogs()
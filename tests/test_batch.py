@@ -0,0 +1,43 @@
+"""Tests of the checkpoints and the resume of the batch runner."""
+import os
+import pandas as pd
+import batch
+import univariate
+COLUMNS = ['totals_hits', 'totals_pageviews', 'device_browser']
+def _manifest():
+    return [{'project': 'tests', 'table': 'sessions', 'columns': COLUMNS},
+            {'project': 'tests', 'table': 'missing'}]
+def test_batch_writes_results_and_statuses(client, tmp_path):
+    output = str(tmp_path/'batch')
+    status = batch.run_batch(_manifest(), output, workers=2, chunk_size=2)
+    assert list(status['state']) == ['done', 'failed']
+    assert status.loc[0, 'profiled'] == len(COLUMNS)
+    columns = pd.read_parquet(os.path.join(output, 'univariate', 'columns.parquet'))
+    assert list(columns['column_name']) == COLUMNS
+    overview = pd.read_parquet(os.path.join(output, 'univariate',
+                                            'numeric_data_overview.parquet'))
+    assert set(overview['column_name']) == {'totals_hits', 'totals_pageviews'}
+    assert os.path.isfile(os.path.join(output, 'status.parquet'))
+def test_batch_resumes_from_the_checkpoints(client, tmp_path, monkeypatch):
+    output = str(tmp_path/'batch')
+    calls = []
+    profile = univariate.table_profile
+    def stopping(column_list, *args, **kwargs):
+        calls.append(list(column_list))
+        if len(calls) == 2:
+            raise RuntimeError("stopped")
+        return profile(column_list, *args, **kwargs)
+    monkeypatch.setattr(univariate, 'table_profile', stopping)
+    status = batch.run_batch(_manifest()[:1], output, chunk_size=2)
+    assert status.loc[0, 'state'] == 'failed'
+    #the first chunk was saved, only the column of the second chunk is run again.
+    status = batch.run_batch(_manifest()[:1], output, chunk_size=2)
+    assert status.loc[0, 'state'] == 'done' and status.loc[0, 'profiled'] == 1
+    assert calls == [COLUMNS[:2], COLUMNS[2:], COLUMNS[2:]]
+    status = batch.run_batch(_manifest()[:1], output, chunk_size=2)
+    assert status.loc[0, 'profiled'] == 0 and len(calls) == 3
+def test_job_ids_are_kept_across_runs():
+    first, second = batch.read_manifest(_manifest()), batch.read_manifest(_manifest())
+    assert [i['id'] for i in first] == [i['id'] for i in second]
+    changed = batch.read_manifest([dict(_manifest()[0], params={'terms': 5})])
+    assert changed[0]['id'] != first[0]['id']
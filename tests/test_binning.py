@@ -0,0 +1,47 @@
+"""Tests of the quantile pre-binning and of scoring the trees fitted on bin codes."""
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from sklearn.tree import DecisionTreeClassifier
+import binning
+import decision_tree
+import preprocessing
+import scoring
+import tree_sql
+@pytest.fixture
+def binned(client, table, tmp_path):
+    """A tree fitted on the bin codes of the table, exported for scoring."""
+    state = preprocessing.fit(list(table.columns), 'tests', 'sessions', 80, 5,
+                              single_pass=True)
+    matrix, label = decision_tree.build_matrix(state, 'tests', 'sessions')
+    edges = binning.fit_edges(state, 'tests', 'sessions', 64)
+    codes = binning.bin_matrix(matrix, edges)
+    tree = DecisionTreeClassifier(min_samples_leaf=5, random_state=0).fit(codes, label)
+    directory = str(tmp_path/'model')
+    scoring.export_model(tree, state, directory, {}, edges)
+    return state, tree, codes, directory
+def test_raw_thresholds_score_like_the_binned_tree(binned):
+    state, tree, codes, directory = binned
+    model = scoring.load_model(directory)
+    data = decision_tree.build_dataset(state['columns'], 'tests', 'sessions',
+                                       state['fill_values'])
+    np.testing.assert_allclose(model.predict_proba(data), tree.predict_proba(codes))
+def test_check_predictions_of_a_binned_tree(binned):
+    _, _, _, directory = binned
+    assert tree_sql.check_predictions(directory, 'tests', 'sessions')['mismatches'] == 0
+def test_sparse_bins_match_dense_bins():
+    generator = np.random.default_rng(0)
+    matrix = generator.poisson(2, (2000, 6)).astype(np.float32)
+    #a column with negative values, whose zero is not in the first bin.
+    matrix[:, 1] -= 1
+    matrix[generator.random(matrix.shape) < 0.05] = np.nan
+    matrix[:, 4:] = generator.random((2000, 2)) < 0.1
+    edges = binning.matrix_edges(matrix, 32)
+    dense = binning.bin_matrix(matrix, edges)
+    sparse = binning.bin_matrix(csr_matrix(matrix), edges)
+    assert dense.dtype == np.uint8 and sparse.dtype == np.uint8
+    assert sparse.format == 'csr'
+    np.testing.assert_array_equal(sparse.toarray(), dense)
+def test_bins_are_checked():
+    with pytest.raises(ValueError):
+        binning.matrix_edges(np.zeros((10, 1)), 257)
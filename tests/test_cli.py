@@ -0,0 +1,29 @@
+"""Tests of the command line and of the imports it waits for."""
+import json
+import os
+import subprocess
+import sys
+def test_workflow_modules_import_without_pandas():
+    code = ("import sys, batch, decision_tree, univariate; "
+            "print(sorted({'pandas', 'numpy', 'sklearn'} & set(sys.modules)))")
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert output.stdout.strip() == "[]"
+def test_profile_on_the_local_backend_gives_the_cold_start(table, tmp_path, capsys):
+    import cli
+    import query_executor
+    import schema_catalog
+    path = str(tmp_path/'sessions.parquet')
+    table.to_parquet(path)
+    previous = query_executor.get_executor()
+    try:
+        cli.main(['--backend', 'duckdb', '--table', 'tests.sessions='+path, '--timing',
+                  'profile', 'tests', 'sessions', '--columns', 'totals_hits'])
+    finally:
+        query_executor.set_executor(previous)
+        schema_catalog.clear_catalogs()
+    error = capsys.readouterr().err
+    timing = json.loads(error.split("cold start: ", 1)[1])
+    assert timing['command'] == 'profile' and timing['backend'] == 'duckdb'
+    assert 0 <= timing['imports'] <= timing['first_query']
@@ -0,0 +1,25 @@
+"""Tests of the feature tables materialized by feature_store."""
+import pandas as pd
+import feature_store
+import query_cache
+import query_executor
+def test_dropped_feature_table_is_built_again(client, table, tmp_path):
+    columns = list(table.columns)
+    query_executor.get_executor().cache = query_cache.QueryCache(
+        str(tmp_path/'cache'), fingerprint_ttl=0)
+    try:
+        directory = str(tmp_path/'features')
+        first, state = feature_store.materialize(columns, 'tests', 'sessions',
+                                                 directory=directory, keep_local=False)
+        assert first['label'].dtype == 'int64'
+        manifest = feature_store._read_manifest(directory, feature_store.fingerprint(
+            query_cache.table_fingerprint(client, 'tests.sessions'), columns, 80, 10))
+        client.connection.execute("DROP TABLE "+manifest['destination'])
+        second, second_state = feature_store.materialize(
+            columns, 'tests', 'sessions', directory=directory, keep_local=False)
+        assert second_state == state
+        pd.testing.assert_frame_equal(second, first)
+        #the table is there again for the next run.
+        client.connection.execute("SELECT COUNT(*) FROM "+manifest['destination'])
+    finally:
+        query_executor.get_executor().cache = None
@@ -0,0 +1,39 @@
+"""Tests of the time columns and of their options saved in the preprocessing state."""
+import contextlib
+import io
+import numpy as np
+import pandas as pd
+import decision_tree
+import features
+import preprocessing
+import tree_sql
+def test_week_day_always_has_seven_columns():
+    #two mondays, the other days still get their one hot columns.
+    times = features.time_features([1_600_041_600, 1_600_045_200], calendar=True)
+    dummies = pd.get_dummies(times[['week_day', 'part_day']])
+    assert list(dummies.columns) == (["week_day_"+i for i in features.WEEK_DAYS] +
+                                     ["part_day_"+i for i in features.PARTS_OF_DAY])
+    assert dummies['week_day_Monday'].all()
+def test_timezone_changes_the_time_columns():
+    times = features.time_features([1_600_041_600], timezone='Asia/Kolkata', calendar=True)
+    assert times.loc[0, 'hour'] == 5 and times.loc[0, 'part_day'] == 'night'
+def test_time_options_are_kept_in_the_state(client, table):
+    state = preprocessing.fit(list(table.columns), 'tests', 'sessions', 80, 10,
+                              single_pass=True, timezone='Asia/Kolkata', calendar=True)
+    assert state['timezone'] == 'Asia/Kolkata' and state['calendar']
+    data = decision_tree.build_dataset(state['columns'], 'tests', 'sessions',
+                                       state['fill_values'])
+    expected, _ = preprocessing.transform(data, state)
+    utc, _ = preprocessing.transform(data, dict(state, timezone=None))
+    assert not np.array_equal(expected, utc)
+    #the time columns written in SQL are the ones made in pandas.
+    matrix, _ = decision_tree.build_matrix(state, 'tests', 'sessions')
+    np.testing.assert_array_equal(matrix, expected)
+def test_scored_in_sql_with_the_time_options(client, table, tmp_path):
+    directory = str(tmp_path/'model')
+    with contextlib.redirect_stdout(io.StringIO()):
+        decision_tree.decision_tree(list(table.columns), 'tests', 'sessions', n_jobs=1,
+                                    model_directory=directory, timezone='Asia/Kolkata',
+                                    calendar=True)
+    check = tree_sql.check_predictions(directory, 'tests', 'sessions')
+    assert check['rows'] == len(table) and check['mismatches'] == 0
@@ -0,0 +1,30 @@
+"""Tests of the local backend against the queries of univariate and decision_tree."""
+import pandas as pd
+import pytest
+import local_backend
+import preprocessing
+import univariate
+from test_univariate import COLUMNS
+from test_univariate import _comparable
+@pytest.fixture
+def local(table):
+    local_backend.register_table('tests', 'local', table)
+    yield
+    local_backend._TABLES.pop(('tests', 'local'), None)
+def test_table_profile_matches_the_queries(client, local):
+    expected = univariate.table_profile(COLUMNS, 'tests', 'sessions')
+    profile = local_backend.table_profile(COLUMNS, 'tests', 'local')
+    for column_name in COLUMNS:
+        assert profile[column_name].keys() == expected[column_name].keys()
+        for name, value in profile[column_name].items():
+            if isinstance(value, pd.DataFrame):
+                pd.testing.assert_frame_equal(_comparable(value),
+                                              _comparable(expected[column_name][name]),
+                                              check_dtype=False, check_exact=False)
+            else:
+                assert value == expected[column_name][name]
+def test_preprocessing_state_matches_the_queries(client, local, table):
+    state = preprocessing.fit(list(table.columns), 'tests', 'sessions', 80, 10)
+    local_state = preprocessing.fit(list(table.columns), 'tests', 'local', 80, 10,
+                                    backend=local_backend)
+    assert local_state == state
@@ -0,0 +1,34 @@
+"""Tests of the parallel and successive halving searches of model_search."""
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from sklearn.model_selection import GridSearchCV
+from sklearn.tree import DecisionTreeClassifier
+import model_search
+@pytest.fixture
+def data():
+    generator = np.random.default_rng(0)
+    x = generator.normal(size=(3000, 6)).astype(np.float32)
+    y = (x[:, 0]+x[:, 1]*x[:, 2]+generator.normal(scale=0.5, size=3000) > 0).astype(int)
+    return x, y
+def test_parallel_grid_matches_the_plain_grid_search(data):
+    x, y = data
+    expected = GridSearchCV(DecisionTreeClassifier(random_state=0), model_search.PARAM_GRID,
+                            cv=2).fit(x, y)
+    tree_cv = model_search.search(x, y, n_jobs=2, max_nbytes=1)
+    assert tree_cv.best_params_ == expected.best_params_
+    np.testing.assert_allclose(tree_cv.cv_results_['mean_test_score'],
+                               expected.cv_results_['mean_test_score'])
+    #the sparse matrix is searched the same way.
+    assert model_search.search(csr_matrix(x), y, n_jobs=1).best_params_ == expected.best_params_
+def test_halving_search_reports_its_rounds(data):
+    x, y = data
+    grid = {'max_depth': [2, 5, 10, None], 'min_samples_leaf': [1, 5, 20]}
+    tree_cv = model_search.search(x, y, grid, strategy='halving', n_jobs=1)
+    report = model_search.search_report(tree_cv)
+    assert {'iter', 'n_resources'} <= set(report.columns)
+    assert report['n_resources'].max() > report['n_resources'].min()
+    assert report.loc[0, 'rank_test_score'] == 1
+def test_unknown_strategy_is_refused(data):
+    with pytest.raises(ValueError):
+        model_search.search(*data, strategy='random')
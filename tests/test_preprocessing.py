@@ -0,0 +1,45 @@
+"""Tests of the fitted preprocessing state against the encodings of decision_tree."""
+import numpy as np
+import decision_tree
+import preprocessing
+def _columns(table):
+    return list(table.columns)
+def test_transform_matches_grouping(client, table):
+    columns = _columns(table)
+    state = preprocessing.fit(columns, 'tests', 'sessions', 80, 10)
+    data = decision_tree.build_dataset(state['columns'], 'tests', 'sessions',
+                                       state['fill_values'])
+    matrix, label = preprocessing.transform(data, state)
+    expected = decision_tree.grouping(columns, 'tests', 'sessions', 80, 10)
+    assert list(expected.drop(columns='label').columns) == state['feature_names']
+    np.testing.assert_array_equal(
+        matrix, expected[state['feature_names']].to_numpy(dtype=np.float32))
+    np.testing.assert_array_equal(label, expected['label'].to_numpy())
+def test_transform_sparse_matches_sparse_matrix(client, table):
+    columns = _columns(table)
+    state = preprocessing.fit(columns, 'tests', 'sessions', 80, 10)
+    data = decision_tree.build_dataset(state['columns'], 'tests', 'sessions',
+                                       state['fill_values'])
+    matrix, label = preprocessing.transform_sparse(data, state)
+    expected, expected_label, names, _ = decision_tree.grouping(
+        columns, 'tests', 'sessions', 80, 10, sparse=True)
+    assert names == state['feature_names']
+    np.testing.assert_array_equal(matrix.toarray(), expected.toarray())
+    np.testing.assert_array_equal(label, expected_label)
+    dense, _ = preprocessing.transform(data, state)
+    np.testing.assert_array_equal(matrix.toarray(), dense)
+def test_single_pass_state_matches_fit(client, table):
+    columns = _columns(table)
+    for cat_threshold in (3, 10, 50):
+        state = preprocessing.fit(columns, 'tests', 'sessions', 80, cat_threshold)
+        single = preprocessing.fit(columns, 'tests', 'sessions', 80, cat_threshold,
+                                   single_pass=True)
+        assert single == state
+def test_build_matrix_matches_transform(client, table):
+    state = preprocessing.fit(_columns(table), 'tests', 'sessions', 80, 5, single_pass=True)
+    data = decision_tree.build_dataset(state['columns'], 'tests', 'sessions',
+                                       state['fill_values'])
+    expected, expected_label = preprocessing.transform(data, state)
+    matrix, label = decision_tree.build_matrix(state, 'tests', 'sessions')
+    np.testing.assert_array_equal(matrix, expected)
+    np.testing.assert_array_equal(label, expected_label)
@@ -0,0 +1,130 @@
+"""Tests of the coalescing, retries, concurrency, caching and arrow results of the shared
+query executor."""
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pytest
+import query_cache
+import query_executor
+class _Job:
+    def __init__(self, query):
+        self.query = query
+    def to_dataframe(self):
+        #slow enough for the callers to ask for the query while it runs.
+        time.sleep(0.2)
+        return pd.DataFrame({'query': [self.query]})
+class _Client:
+    def __init__(self):
+        self.queries = []
+    def query(self, query):
+        self.queries.append(query)
+        return _Job(query)
+def test_identical_queries_are_coalesced():
+    client = _Client()
+    executor = query_executor.QueryExecutor(lambda: client)
+    results = [None]*8
+    def run(position):
+        results[position] = executor.run("SELECT 1")
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(8)]
+    for i in threads:
+        i.start()
+    for i in threads:
+        i.join()
+    assert client.queries == ["SELECT 1"]
+    assert executor.jobs == 1 and executor.coalesced == 7
+    #every caller gets a copy of its own.
+    assert len({id(i) for i in results}) == 8
+    results[0].loc[0, 'query'] = "changed"
+    assert all(i.loc[0, 'query'] == "SELECT 1" for i in results[1:])
+def test_different_queries_are_run_separately():
+    client = _Client()
+    executor = query_executor.QueryExecutor(lambda: client)
+    assert executor.run_all(["SELECT 1", "SELECT 2"])[1].loc[0, 'query'] == "SELECT 2"
+    assert sorted(client.queries) == ["SELECT 1", "SELECT 2"]
+def test_cache_hits_and_misses(client, tmp_path):
+    cache = query_cache.QueryCache(str(tmp_path))
+    executor = query_executor.QueryExecutor(lambda: client, cache=cache)
+    query = "SELECT COUNT(*) as n FROM tests.sessions"
+    first = executor.run(query)
+    queries = client.queries
+    second = executor.run(query)
+    assert client.queries == queries
+    pd.testing.assert_frame_equal(first, second)
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+    executor.run("SELECT COUNT(*) as n FROM tests.sessions WHERE label = 1")
+    assert cache.stats()['misses'] == 2
+def test_cache_misses_after_the_table_changes(client, table, tmp_path):
+    cache = query_cache.QueryCache(str(tmp_path), fingerprint_ttl=0)
+    executor = query_executor.QueryExecutor(lambda: client, cache=cache)
+    query = "SELECT COUNT(*) as n FROM tests.sessions"
+    assert executor.run(query)['n'][0] == len(table)
+    client.register_table('tests', 'sessions', table.head(10))
+    assert executor.run(query)['n'][0] == 10
+    assert cache.stats()['hits'] == 0
+def test_only_deterministic_selects_are_cached(client, tmp_path):
+    for query in ("CREATE OR REPLACE TABLE tests.copy AS SELECT * FROM tests.sessions",
+                  "DROP TABLE tests.copy",
+                  "INSERT INTO tests.copy SELECT * FROM tests.sessions",
+                  "SELECT * FROM tests.sessions TABLESAMPLE SYSTEM (10 PERCENT)",
+                  "SELECT RAND() as r FROM tests.sessions"):
+        assert not query_cache.cacheable(query)
+    assert query_cache.cacheable("WITH t as (SELECT label FROM tests.sessions) SELECT * FROM t")
+    cache = query_cache.QueryCache(str(tmp_path))
+    executor = query_executor.QueryExecutor(lambda: client, cache=cache)
+    query = "SELECT COUNT(*) as n FROM tests.sessions TABLESAMPLE SYSTEM (50 PERCENT)"
+    executor.run(query)
+    executor.run(query)
+    assert cache.stats()['entries'] == 0 and cache.stats()['hits'] == 0
+def test_fingerprint_has_the_full_table_id(client):
+    assert query_cache.table_fingerprint(client, 'tests.sessions').startswith(
+        client.get_table('tests.sessions').full_table_id+"/")
+class _LimitedClient(_Client):
+    def __init__(self, failures, error):
+        super().__init__()
+        self.failures = failures
+        self.error = error
+    def query(self, query):
+        self.queries.append(query)
+        if len(self.queries) <= self.failures:
+            raise self.error
+        return _Job(query)
+def test_rate_limited_jobs_are_retried():
+    from google.api_core import exceptions
+    client = _LimitedClient(2, exceptions.TooManyRequests("slow down"))
+    executor = query_executor.QueryExecutor(lambda: client, backoff=0.01)
+    assert executor.run("SELECT 1").loc[0, 'query'] == "SELECT 1"
+    assert len(client.queries) == 3 and executor.retried == 2
+def test_other_errors_are_raised_at_once():
+    from google.api_core import exceptions
+    client = _LimitedClient(1, exceptions.BadRequest("syntax error"))
+    executor = query_executor.QueryExecutor(lambda: client, backoff=0.01)
+    with pytest.raises(exceptions.BadRequest):
+        executor.run("SELECT 1")
+    assert len(client.queries) == 1 and executor.retried == 0
+def test_map_columns_keeps_the_order_of_the_columns():
+    client = _Client()
+    executor = query_executor.QueryExecutor(lambda: client, max_concurrency=4)
+    columns = ["c{position}".format(position=i) for i in range(8)]
+    start = time.perf_counter()
+    results = executor.map_columns(
+        lambda i, table: executor.run("SELECT {i} FROM {table}".format(i=i, table=table)),
+        columns, 'tests.sessions')
+    #eight jobs of 0.2 seconds, four at a time.
+    assert time.perf_counter()-start < 1.2
+    assert [i.loc[0, 'query'] for i in results] == [
+        "SELECT {i} FROM tests.sessions".format(i=i) for i in columns]
+def test_arrow_frame_keeps_the_strings_encoded(client):
+    table = query_executor.run_arrow(
+        "SELECT device_browser, totals_hits, label FROM tests.sessions")
+    data = query_executor.arrow_frame(table)
+    expected = table.to_pandas()
+    assert isinstance(data['device_browser'].dtype, pd.CategoricalDtype)
+    categories = list(data['device_browser'].cat.categories)
+    assert categories == sorted(categories)
+    pd.testing.assert_series_equal(data['device_browser'].astype(object),
+                                   expected['device_browser'].astype(object))
+    #the numeric column without nulls is not copied.
+    label = table.column('label').chunk(0)
+    assert np.shares_memory(data['label'].to_numpy(), label.to_numpy())
+    pd.testing.assert_series_equal(data['totals_hits'], expected['totals_hits'])
@@ -0,0 +1,20 @@
+"""Tests of the sampled fast profile against the sample it is made on."""
+import pytest
+import sampling
+@pytest.mark.parametrize('method', ['system', 'hash'])
+def test_every_query_reads_the_same_sample(client, table, method):
+    profile = sampling.fast_profile(list(table.columns), 'tests', 'sessions', percent=20,
+                                    method=method)
+    for result in profile.values():
+        sample = result['sample']
+        assert sample['total_rows'] == len(table) and 0 < sample['rows'] < len(table)
+        if 'count_coverage_numeric' in result:
+            #the buckets hold every row of the sample, scaled to the whole table.
+            assert result['count_coverage_numeric']['Count'].sum() == pytest.approx(len(table))
+    tables = client.connection.execute("SELECT table_name FROM information_schema.tables")
+    assert [i[0] for i in tables.fetchall()] == ['sessions']
+def test_hash_sample_is_the_same_every_run(client, table):
+    first, second = (sampling.fast_profile(['totals_hits'], 'tests', 'sessions', percent=20,
+                                           method='hash')['totals_hits'] for _ in range(2))
+    assert first['sample']['rows'] == second['sample']['rows']
+    assert first['numeric_data_overview'].equals(second['numeric_data_overview'])
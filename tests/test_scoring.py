@@ -0,0 +1,51 @@
+"""Tests of the exported tree model against the scikit-learn tree it was exported from."""
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.tree import DecisionTreeClassifier
+import decision_tree
+import preprocessing
+import scoring
+@pytest.fixture
+def fitted(client, table):
+    state = preprocessing.fit(list(table.columns), 'tests', 'sessions', 80, 10)
+    data = decision_tree.build_dataset(state['columns'], 'tests', 'sessions',
+                                       state['fill_values'])
+    matrix, label = preprocessing.transform(data, state)
+    tree = DecisionTreeClassifier(max_depth=6, random_state=0).fit(matrix, label)
+    return tree, state, matrix
+def test_loaded_model_scores_like_the_tree(fitted, table, tmp_path):
+    tree, state, matrix = fitted
+    directory = scoring.export_model(tree, state, str(tmp_path/'model'), {'max_depth': 6})
+    model = scoring.load_model(directory)
+    np.testing.assert_allclose(model.predict_proba_matrix(matrix), tree.predict_proba(matrix))
+    #the raw rows, without the label, are preprocessed by the model itself.
+    rows = table.drop(columns='label')
+    np.testing.assert_allclose(model.predict_proba(rows, chunk_size=700),
+                               tree.predict_proba(matrix))
+    np.testing.assert_array_equal(model.predict(rows), tree.predict(matrix))
+def test_score_parquet_writes_every_row(fitted, table, tmp_path):
+    tree, state, matrix = fitted
+    directory = scoring.export_model(tree, state, str(tmp_path/'model'))
+    rows = table.drop(columns='label').reset_index().rename(columns={'index': 'session_id'})
+    rows.to_parquet(str(tmp_path/'rows.parquet'))
+    written = scoring.score_parquet(directory, str(tmp_path/'rows.parquet'),
+                                    str(tmp_path/'scores.parquet'), batch_size=700,
+                                    keep_columns=['session_id'])
+    scores = pd.read_parquet(str(tmp_path/'scores.parquet'))
+    assert written == len(table) and list(scores['session_id']) == list(rows['session_id'])
+    np.testing.assert_array_equal(scores['prediction'], tree.predict(matrix))
+    np.testing.assert_allclose(scores['probability_1'], tree.predict_proba(matrix)[:, 1])
+def test_other_model_versions_are_refused(fitted, tmp_path):
+    tree, state, _ = fitted
+    directory = scoring.export_model(tree, state, str(tmp_path/'model'))
+    path = os.path.join(directory, 'model.json')
+    with open(path) as model_file:
+        model = json.load(model_file)
+    model['version'] = scoring.MODEL_VERSION+1
+    with open(path, 'w') as model_file:
+        json.dump(model, model_file)
+    with pytest.raises(ValueError):
+        scoring.load_model(directory)
@@ -0,0 +1,42 @@
+"""Tests of the per partition sketches against the exact univariate outputs."""
+import numpy as np
+import pandas as pd
+import pytest
+import sketches
+import univariate
+COLUMNS = ['totals_hits', 'device_browser']
+@pytest.fixture
+def days(client, table):
+    table = table.assign(day=np.arange(len(table)) % 3+1)
+    client.register_table('tests', 'sessions', table[table['day'] < 3])
+    return table
+def test_refresh_only_computes_the_new_partitions(client, days, tmp_path):
+    store = sketches.SketchStore(str(tmp_path))
+    first = store.refresh(COLUMNS, 'tests', 'sessions', 'day')
+    assert store.manifest('tests', 'sessions')['partitions'] == ['1', '2']
+    assert int(first.rows.sum()) == int((days['day'] < 3).sum())
+    client.register_table('tests', 'sessions', days)
+    queries = client.queries
+    merged = store.refresh(COLUMNS, 'tests', 'sessions', 'day')
+    #the partitions and the three queries of the one new partition.
+    assert client.queries-queries == 4
+    assert merged.partitions == ['1', '2', '3'] and int(merged.rows.sum()) == len(days)
+    loaded = store.load('tests', 'sessions')
+    assert loaded.profile(COLUMNS).keys() == merged.profile(COLUMNS).keys()
+    assert int(store.load('tests', 'sessions', ['3']).rows.sum()) == int((days['day'] == 3).sum())
+def test_merged_sketch_matches_the_exact_outputs(client, days, tmp_path):
+    client.register_table('tests', 'sessions', days)
+    profile = sketches.SketchStore(str(tmp_path)).refresh(
+        COLUMNS, 'tests', 'sessions', 'day').profile(COLUMNS)
+    for i in COLUMNS:
+        assert profile[i]['data_type'] == univariate.column_info(
+            i, 'tests', 'sessions').iloc[0, 0]
+    overview = profile['totals_hits']['numeric_data_overview']['totals_hits']
+    expected = univariate.numeric_data_overview('totals_hits', 'tests', 'sessions')
+    for i in ('Mean', 'St_deviation', 'min', 'max'):
+        assert overview[i] == pytest.approx(float(expected.loc[i, 'totals_hits']))
+    #the capacity keeps every value, so the counts of the categories are exact.
+    coverage = profile['device_browser']['count_coverage_categorical']
+    expected = univariate.count_coverage_categorical('device_browser', 'tests', 'sessions', 10)
+    pd.testing.assert_series_equal(coverage['Count'].reset_index(drop=True),
+                                   expected['Count'].reset_index(drop=True), check_dtype=False)
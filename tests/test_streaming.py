@@ -0,0 +1,41 @@
+"""Tests of the batch by batch extraction of streaming against preprocessing.transform."""
+import contextlib
+import io
+import numpy as np
+import pyarrow.parquet as pq
+import decision_tree
+import preprocessing
+import streaming
+def _state(table, label=True):
+    columns = [i for i in table.columns if label or i != 'label']
+    return preprocessing.fit(columns, 'tests', 'sessions', 80, 10, single_pass=True)
+def _expected(state):
+    data = decision_tree.build_dataset(state['columns'], 'tests', 'sessions',
+                                       state['fill_values'])
+    return preprocessing.transform(data, state)
+def test_extract_matrix_matches_transform(client, table):
+    state = _state(table)
+    expected, expected_label = _expected(state)
+    matrix, label, names = streaming.extract_matrix(state, 'tests', 'sessions',
+                                                    batch_size=700)
+    assert names == state['feature_names']
+    np.testing.assert_array_equal(matrix, expected)
+    np.testing.assert_array_equal(label, expected_label)
+def test_extract_matrix_without_label(client, table):
+    state = _state(table, label=False)
+    expected, _ = _expected(state)
+    matrix, label, _ = streaming.extract_matrix(state, 'tests', 'sessions', batch_size=700)
+    assert label is None
+    np.testing.assert_array_equal(matrix, expected)
+def test_extract_parquet_without_label(client, table, tmp_path):
+    state = _state(table, label=False)
+    path = str(tmp_path/'features.parquet')
+    assert streaming.extract_parquet(state, 'tests', 'sessions', path, batch_size=700) == len(table)
+    assert pq.read_schema(path).names == state['feature_names']
+def test_decision_tree_trains_on_the_streamed_matrix(client, table, tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = decision_tree.decision_tree(list(table.columns), 'tests', 'sessions',
+                                             n_jobs=1, encoding='stream', batch_size=700,
+                                             model_directory=str(tmp_path/'model'))
+    assert result['rows'] == len(table)
+    assert result['features'] == len(_state(table)['feature_names'])
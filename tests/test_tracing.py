@@ -0,0 +1,47 @@
+"""Tests of the events recorded by the tracing hooks."""
+import json
+import pytest
+import query_cache
+import query_executor
+import tracing
+import univariate
+def test_queries_are_recorded_with_their_caller(client, tmp_path):
+    with tracing.record(str(tmp_path/'trace.json')) as recorder:
+        univariate.numeric_data_overview('totals_hits', 'tests', 'sessions')
+    events = [i for i in recorder.events if i['type'] == 'query']
+    assert events and all(i['function'] == 'univariate.numeric_data_overview' and
+                          i['column'] == 'totals_hits' for i in events)
+    assert all(i['rows'] is not None and i['submitted'] is not None and i['duration'] >= 0
+               for i in events)
+    with open(str(tmp_path/'trace.json')) as trace_file:
+        trace = json.load(trace_file)['traceEvents']
+    assert len([i for i in trace if i['ph'] == 'X' and i['cat'] == 'query']) == len(events)
+    assert any(i['ph'] == 'M' and i['name'] == 'thread_name' for i in trace)
+def test_disk_cache_hits_are_marked(client, tmp_path):
+    query_executor.get_executor().cache = query_cache.QueryCache(str(tmp_path))
+    try:
+        query = "SELECT COUNT(*) as n FROM tests.sessions"
+        with tracing.record(queries=False) as recorder:
+            query_executor.run_query(query)
+            query_executor.run_query(query.replace(" FROM", "\n    FROM")+";")
+    finally:
+        query_executor.get_executor().cache = None
+    first, second = recorder.events
+    assert 'query' not in first and first['fingerprint'] == second['fingerprint']
+    assert second['source'] == 'disk_cache'
+def test_stages_and_errors_are_recorded():
+    with tracing.record() as recorder:
+        with tracing.stage('transform', rows=10):
+            pass
+        with pytest.raises(ValueError):
+            with tracing.stage('search'):
+                raise ValueError("failed")
+    transform, search = recorder.events
+    assert transform['name'] == 'transform' and transform['rows'] == 10
+    assert 'error' not in transform and 'ValueError' in search['error']
+    assert len(recorder.summary('stage')) == 2
+def test_nothing_is_recorded_without_hooks(client):
+    assert not tracing.enabled()
+    assert tracing.start_query("SELECT 1") is None
+    with tracing.stage('transform') as event:
+        assert event is None
@@ -0,0 +1,14 @@
+"""Tests of the scoring of exported trees inside the warehouse."""
+import contextlib
+import io
+import decision_tree
+import tree_sql
+def test_check_predictions_has_no_mismatches(client, table, tmp_path):
+    directory = str(tmp_path/'model')
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = decision_tree.decision_tree(list(table.columns), 'tests', 'sessions',
+                                             n_jobs=1, model_directory=directory)
+    assert result['rows'] == len(table)
+    check = tree_sql.check_predictions(directory, 'tests', 'sessions')
+    assert check['rows'] == len(table)
+    assert check['mismatches'] == 0
@@ -0,0 +1,54 @@
+"""Tests of univariate.table_profile against the single column functions."""
+import pandas as pd
+import pytest
+import univariate
+def _comparable(data):
+    """Turns the NUMERIC columns bigquery gives as Decimal into floats and sorts the
+    rows, whose order is not fixed by the queries of every function."""
+    data = data.reset_index(drop=True)
+    for i in data.columns:
+        if data[i].dtype == object and data[i].map(lambda j: hasattr(j, 'as_tuple')).any():
+            data[i] = data[i].astype('float64')
+    return data.sort_values(list(data.columns)).reset_index(drop=True)
+COLUMNS = ['totals_hits', 'totals_pageviews', 'device_browser', 'device_operatingSystem']
+@pytest.mark.parametrize('column_name', COLUMNS)
+def test_table_profile_matches_the_single_column_functions(client, column_name):
+    profile = univariate.table_profile(COLUMNS, 'tests', 'sessions')[column_name]
+    for name, value in profile.items():
+        if name == 'data_type':
+            assert value == univariate.column_info(column_name, 'tests', 'sessions').iloc[0, 0]
+            continue
+        function = getattr(univariate, name)
+        if name in ('numeric_data_overview', 'categorical_overview'):
+            expected = function(column_name, 'tests', 'sessions')
+        else:
+            expected = function(column_name, 'tests', 'sessions', 10)
+        if isinstance(value, str):
+            assert value == expected
+            continue
+        pd.testing.assert_frame_equal(_comparable(value), _comparable(expected),
+                                      check_dtype=False, check_exact=False)
+def test_bucket_numbers_stay_integers(client):
+    result = univariate.bucket_coverage_numeric('totals_hits', 'tests', 'sessions')
+    assert result['bucket'].dtype == 'Int64'
+    #the null values are the one null bucket, after the outlier buckets 0 and 11.
+    assert result['bucket'].isna().sum() == 1
+    assert list(result['bucket'].dropna()) == list(range(12))
+    lower, upper = univariate.bucket_limits(result)
+    rows = result.set_index('bucket')
+    assert rows.at[1, 'lower_limit'] == lower and rows.at[10, 'upper_limit'] == upper
+def test_segments_are_compared_with_one_scan(client, table):
+    queries = client.queries
+    result = univariate.compare_segments_categorical(
+        'device_browser', 'tests', 'sessions', segment='device_deviceCategory', terms=None,
+        baseline=table['device_deviceCategory'].dropna().iloc[0])
+    assert client.queries-queries == 1
+    rows = table[table['device_deviceCategory'].notna()]
+    expected = pd.crosstab(rows['device_browser'].fillna("null"),
+                           rows['device_deviceCategory'])
+    result = result.set_index(result['device_browser'].fillna("null"))
+    for i in expected.columns:
+        counts = result['count_'+i].reindex(expected.index)
+        assert list(counts) == list(expected[i])
+        assert 'ratio_'+i in result.columns or i == table['device_deviceCategory'].dropna().iloc[0]
+    assert result['Count'].sum() == len(rows)
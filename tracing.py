@@ -0,0 +1,241 @@
+"""This module contains the tracing hooks of the queries and the pandas and
+scikit-learn stages of univariate and decision_tree.
+While at least one hook is added, every query run by the shared executor is
+recorded with the function and column it was run for, the fingerprint of its SQL,
+the time it waited for a slot, the time it was handed to bigquery, the time it ran
+and downloaded, the bytes bigquery processed and billed, the slot milliseconds,
+whether the result came from the cache of bigquery, the disk cache or a query
+already running, and the rows and bytes of the dataframe,
+and every stage wrapped in stage() is recorded with its duration.
+A hook is any function taking the event dictionary, TraceRecorder keeps the events
+and writes them in the trace event format of chrome://tracing and Perfetto, so a
+whole run can be seen as a timeline. No time is spent on any of it without hooks."""
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+#frames of these modules are passed over when finding the function a query is run for.
+_SKIP_MODULES = ('query_executor', 'query_cache', 'tracing', 'threading')
+_SKIP_FUNCTIONS = ('main_func',)
+_HOOKS = ()
+_LOCK = threading.Lock()
+def add_hook(hook):
+    """This function adds a hook which is called with every event from now on.
+    Parameters required:a.)hook: A function taking the event dictionary.
+    Result: The hook, so that it can be removed later."""
+    global _HOOKS
+    with _LOCK:
+        _HOOKS = _HOOKS+(hook,)
+    return hook
+def remove_hook(hook):
+    """This function stops calling a hook."""
+    global _HOOKS
+    with _LOCK:
+        _HOOKS = tuple(i for i in _HOOKS if i is not hook)
+def enabled():
+    """Tells whether any hook is added, the events are only made if one is."""
+    return bool(_HOOKS)
+def emit(event):
+    """This function hands an event to all the hooks.
+    Parameters required:a.)event: The event dictionary."""
+    for hook in _HOOKS:
+        hook(event)
+def fingerprint(query):
+    """This function gives a short fingerprint of the SQL of a query, the same for
+    queries differing only in whitespace.
+    Parameters required:a.)query: The query.
+    Result: The fingerprint as a hex string."""
+    normalized = " ".join(query.split()).rstrip("; ")
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+def caller(depth=1):
+    """This function finds the function a query is being run for, the first one on
+    the stack outside the executor and the main_func wrappers, along with the
+    column_name it was called with.
+    Parameters required:a.)depth: The number of frames to skip.
+    Result: A dictionary with the function as module.name and the column, None
+            for the ones which could not be found."""
+    frame = sys._getframe(depth)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if (module not in _SKIP_MODULES and not module.startswith('concurrent.')
+                and frame.f_code.co_name not in _SKIP_FUNCTIONS):
+            column = frame.f_locals.get('column_name')
+            return {'function': module+'.'+frame.f_code.co_name,
+                    'column': column if isinstance(column, str) else None}
+        frame = frame.f_back
+    return {'function': None, 'column': None}
+def _event(kind, name, **fields):
+    """Makes an event with the fields every event has."""
+    event = {'type': kind, 'name': name, 'start': time.time(), 'duration': None,
+             'pid': os.getpid(), 'thread': threading.get_ident(),
+             'thread_name': threading.current_thread().name}
+    event.update(fields)
+    event['_clock'] = time.perf_counter()
+    return event
+def start_query(query, where=None):
+    """This function starts the event of a query, None when there is no hook.
+    Parameters required:a.)query: The query.
+                        b.)where: The caller dictionary of the function the query
+                        is run for, found from the stack if not passed.
+    Result: The event dictionary to be filled in and passed to finish_query."""
+    if not _HOOKS:
+        return None
+    where = where or caller(2)
+    name = where['function'] or 'query'
+    if where['column']:
+        name = "{function}({column})".format(function=name, column=where['column'])
+    return _event('query', name, function=where['function'], column=where['column'],
+                  fingerprint=fingerprint(query), query=query, queue_time=0.0,
+                  execution_time=None, download_time=None, job_queue_time=None,
+                  bytes_processed=None, bytes_billed=None, slot_millis=None,
+                  cache_hit=None, source='job', retries=0, submitted=None, rows=None,
+                  bytes_downloaded=None, error=None)
+def fetch(job, event, arrow=False):
+    """This function waits for a job and downloads its result, timing the two.
+    Parameters required:a.)job: The query job, a bigquery.QueryJob or the job of
+                        a stand-in client.
+                        b.)event: The event of the query, None when nothing is recorded.
+                        c.)arrow: Whether to download the result as a pyarrow.Table.
+    Result: The dataframe, or the pyarrow.Table, of the job."""
+    if event is None:
+        return _download(job, arrow)
+    #the wall time the job was handed to bigquery, the first of a run being the end
+    #of its cold start.
+    event['submitted'] = time.time()
+    start = time.perf_counter()
+    if hasattr(job, 'result'):
+        job.result()
+    fetched = time.perf_counter()
+    data = _download(job, arrow)
+    event['execution_time'] = fetched-start
+    event['download_time'] = time.perf_counter()-fetched
+    for i, attribute in (('bytes_processed', 'total_bytes_processed'),
+                         ('bytes_billed', 'total_bytes_billed'),
+                         ('slot_millis', 'slot_millis'), ('cache_hit', 'cache_hit')):
+        event[i] = getattr(job, attribute, None)
+    created, started = getattr(job, 'created', None), getattr(job, 'started', None)
+    if created is not None and started is not None:
+        #the time bigquery kept the job pending before running it.
+        event['job_queue_time'] = (started-created).total_seconds()
+    return data
+def _download(job, arrow):
+    """Downloads the result of a job, as a pyarrow.Table from the dataframe for the
+    stand-in clients whose jobs have no to_arrow."""
+    if not arrow:
+        return job.to_dataframe()
+    if hasattr(job, 'to_arrow'):
+        return job.to_arrow()
+    import pyarrow as pa
+    return pa.Table.from_pandas(job.to_dataframe(), preserve_index=False)
+def finish_query(event, data=None, error=None, **fields):
+    """This function completes the event of a query and hands it to the hooks.
+    Parameters required:a.)event: The event from start_query, nothing is done if None.
+                        b.)data: The dataframe or pyarrow.Table the query gave.
+                        c.)error: The exception the query raised.
+                        d.)fields: Other fields of the event, like cache_hit."""
+    if event is None:
+        return
+    event['duration'] = time.perf_counter()-event.pop('_clock')
+    event.update(fields)
+    if data is not None:
+        event['rows'] = len(data)
+        event['bytes_downloaded'] = int(data.nbytes if hasattr(data, 'schema') else
+                                        data.memory_usage(deep=True).sum())
+    if error is not None:
+        event['error'] = repr(error)
+    emit(event)
+@contextlib.contextmanager
+def stage(name, **fields):
+    """This function records the time spent in a block, like a pandas or a
+    scikit-learn step, as a stage event.
+    Parameters required:a.)name: The name of the stage.
+                        b.)fields: Other fields of the event, like the number of rows.
+    Result: A context manager, the event is handed to the hooks when the block ends."""
+    if not _HOOKS:
+        yield None
+        return
+    event = _event('stage', name, **fields)
+    try:
+        yield event
+    except BaseException as error:
+        event['error'] = repr(error)
+        raise
+    finally:
+        event['duration'] = time.perf_counter()-event.pop('_clock')
+        emit(event)
+class TraceRecorder:
+    """A hook keeping the events, to be written as a trace or looked at as a table.
+    Parameters required:a.)queries: Whether the SQL of the queries is kept in the events."""
+    def __init__(self, queries=True):
+        self.queries = queries
+        self.events = []
+        self._lock = threading.Lock()
+    def __call__(self, event):
+        if not self.queries:
+            event = {i: j for i, j in event.items() if i != 'query'}
+        with self._lock:
+            self.events.append(event)
+    def trace_events(self):
+        """This function turns the events into the trace event format, a complete
+        event for every query and stage, with the queue, execution and download
+        of the queries as events nested in them.
+        Result: A list of trace event dictionaries."""
+        result = []
+        with self._lock:
+            events = list(self.events)
+        for i in events:
+            start = i['start']*1e6
+            args = {j: k for j, k in i.items() if j not in ('name', 'start', 'duration', 'pid',
+                                                          'thread', 'thread_name')}
+            result.append({'name': i['name'], 'cat': i['type'], 'ph': 'X', 'ts': start,
+                           'dur': (i['duration'] or 0)*1e6, 'pid': i['pid'],
+                           'tid': i['thread'], 'args': args})
+            if i['type'] != 'query':
+                continue
+            for j in ('queue_time', 'execution_time', 'download_time'):
+                if i.get(j):
+                    result.append({'name': j[:-5], 'cat': 'query_phase', 'ph': 'X', 'ts': start,
+                                   'dur': i[j]*1e6, 'pid': i['pid'], 'tid': i['thread']})
+                    start += i[j]*1e6
+        names = {(i['pid'], i['thread']): i['thread_name'] for i in events}
+        for (pid, thread), name in names.items():
+            result.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread,
+                           'args': {'name': name}})
+        return result
+    def write(self, path):
+        """This function writes the events as a trace event JSON file, which can be
+        opened in chrome://tracing or ui.perfetto.dev.
+        Parameters required:a.)path: The file to be written.
+        Result: The path."""
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'},
+                      trace_file, default=str)
+        return path
+    def summary(self, kind='query'):
+        """This function gives the events of a type as a dataframe, the slowest first.
+        Parameters required:a.)kind: 'query' or 'stage'.
+        Result: A dataframe with a row for every event."""
+        with self._lock:
+            events = [i for i in self.events if i['type'] == kind]
+        import pandas as pd
+        result = pd.DataFrame(events)
+        if result.empty:
+            return result
+        return result.sort_values('duration', ascending=False).reset_index(drop=True)
+@contextlib.contextmanager
+def record(path=None, queries=True):
+    """This function records the events of a block, and writes them as a trace if
+    a path is passed.
+    Parameters required:a.)path: The trace event JSON file to be written at the end.
+                        b.)queries: Whether the SQL of the queries is kept.
+    Result: A context manager giving the TraceRecorder."""
+    recorder = add_hook(TraceRecorder(queries))
+    try:
+        yield recorder
+    finally:
+        remove_hook(recorder)
+        if path is not None:
+            recorder.write(path)
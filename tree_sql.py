@@ -0,0 +1,213 @@
+"""This module compiles an exported decision tree into bigquery SQL, so the whole
+table can be scored where it is stored instead of being extracted to pandas.
+The features the splits use are written on the raw columns, with the null filling,
+the grouping into 'Others', the one hot encoding and the time columns of the
+preprocessing state folded into them, every split becomes a WHEN condition on them
+the same way dynamic_bucket writes its CASE conditions, and the leaf a row ends up
+in gives its class probabilities and prediction."""
+import numpy as np
+import features
+import query_executor
+import scoring
+#the longest query bigquery runs, in characters.
+MAX_QUERY_LENGTH = 1024*1024
+#the time columns written from visitStartTime the way features.time_features makes them,
+#{zone} and {at} being the timezone of the state as an argument and as AT TIME ZONE,
+#{hour} the hour column.
+_TIME_SQL = {
+    'week_day': "FORMAT_TIMESTAMP('%A', TIMESTAMP_SECONDS(visitStartTime){zone})",
+    'hour': "EXTRACT(HOUR FROM TIMESTAMP_SECONDS(visitStartTime){at})",
+    'week_year': "CAST(FORMAT_TIMESTAMP('%W', TIMESTAMP_SECONDS(visitStartTime){zone}) AS INT64)",
+    'day_month': "EXTRACT(DAY FROM TIMESTAMP_SECONDS(visitStartTime){at})",
+    'month': "EXTRACT(MONTH FROM TIMESTAMP_SECONDS(visitStartTime){at})",
+    #%w counts the days of the week from 0 on sunday.
+    'is_weekend': "CAST(FORMAT_TIMESTAMP('%w', TIMESTAMP_SECONDS(visitStartTime){zone}) "
+                  "IN ('0', '6') AS INT64)",
+    'part_day': "CASE WHEN {hour} < 6 THEN 'night' WHEN {hour} < 12 THEN 'morning' "
+                "WHEN {hour} < 18 THEN 'afternoon' WHEN {hour} < 24 THEN 'evening' END"}
+def _string_literal(value):
+    """Writes a python string as a bigquery string literal."""
+    return '"{value}"'.format(value=value.replace('\\', '\\\\').replace('"', '\\"'))
+def _float_literal(value):
+    """Writes a float as a bigquery literal, repr keeps every digit of it."""
+    return "CAST('{value}' AS FLOAT64)".format(value=repr(float(value))) \
+        if not np.isfinite(value) else repr(float(value))
+def _features(state):
+    """Gives the column and the one hot value(None for the columns which are not one
+    hot encoded) of every feature of the state, in the order of the feature names."""
+    columns = [i for i in state['columns'] if i not in ('visitStartTime', 'label')]
+    if state['time']:
+        columns = columns+features.time_columns(state.get('calendar', False))
+    encoded = [i for i in columns if i in state['categories']]
+    result = [(i, None) for i in columns if i not in encoded]
+    for i in encoded:
+        result.extend((i, j) for j in state['categories'][i])
+    return result
+def _time_sql(column_name, state):
+    """Writes the expression of a time column in the timezone of the state."""
+    timezone = state.get('timezone')
+    zone, at = "", ""
+    if timezone is not None:
+        timezone = "'{timezone}'".format(timezone=timezone.replace("'", ""))
+        zone, at = ", "+timezone, " AT TIME ZONE "+timezone
+    hour = _TIME_SQL['hour'].format(zone=zone, at=at)
+    return _TIME_SQL[column_name].format(zone=zone, at=at, hour=hour)
+def _column_sql(column_name, state):
+    """Writes the expression of a column of the dataset after its nulls are filled."""
+    if state['time'] and column_name in features.time_columns(state.get('calendar', False)):
+        return _time_sql(column_name, state)
+    value = state['fill_values'].get(column_name)
+    if column_name in state['numeric']:
+        column = "SAFE_CAST({col_name} AS FLOAT64)".format(col_name=column_name)
+        if value is not None:
+            column = "IFNULL({column}, {value})".format(column=column,
+                                                        value=_float_literal(value))
+        return column
+    if value is not None:
+        return "IFNULL({col_name}, {value})".format(col_name=column_name,
+                                                    value=_string_literal(str(value)))
+    return column_name
+def _indicator_sql(column_name, value, state):
+    """Writes the condition of a one hot encoded feature being 1, never null."""
+    column = _column_sql(column_name, state)
+    categories = state['categories'][column_name]
+    if value == "Others" and "Others" in categories:
+        #the values not kept, and the nulls left after filling, are grouped into Others.
+        kept = [_string_literal(str(i)) for i in categories if i != "Others"]
+        return "IFNULL({column} NOT IN ({kept}), TRUE)".format(column=column,
+                                                              kept=", ".join(kept))
+    return "IFNULL({column} = {value}, FALSE)".format(column=column,
+                                                      value=_string_literal(str(value)))
+def _used_features(model):
+    """Gives the features the splits of the tree use, in the order of the features."""
+    return np.unique(np.asarray(model.feature)[np.asarray(model.children_left) >= 0])
+def _feature_sql(model, feature):
+    """Writes the expression of a feature, a boolean for the one hot encoded ones."""
+    column_name, value = _features(model.state)[feature]
+    if value is not None:
+        return _indicator_sql(column_name, value, model.state)
+    return _column_sql(column_name, model.state)
+def split_condition(model, node):
+    """This function writes the condition sending the rows of a split to its left child,
+    on the f<feature> columns of the features query.
+    Parameters required:a.)model: The TreeModel from scoring.load_model.
+                        b.)node: The node number of the split.
+    Result: The condition as a string, the nulls of the feature go to the right
+            unless the tree sends its missing values to the left."""
+    feature = int(model.feature[node])
+    column = "f{feature}".format(feature=feature)
+    threshold = float(model.threshold[node])
+    if _features(model.state)[feature][1] is not None:
+        #a one hot feature is 0 or 1, so the split only tells which of them goes left.
+        if threshold >= 1:
+            return "TRUE"
+        if threshold < 0:
+            return "FALSE"
+        return "NOT {column}".format(column=column)
+    condition = "{column} <= {threshold}".format(column=column,
+                                                 threshold=_float_literal(threshold))
+    missing = model.missing_go_to_left
+    if missing is not None and missing[node]:
+        condition = "({condition} OR {column} IS NULL)".format(condition=condition,
+                                                               column=column)
+    return condition
+def tree_expression(model, node=0, depth=0):
+    """This function writes the nested CASE expression of the tree, or of the
+    subtree under a node.
+    Parameters required:a.)model: The TreeModel from scoring.load_model, or its directory.
+                        b.)node: The node the expression starts from.
+    Result: A SQL expression on the f<feature> columns giving the position of the
+            leaf of the row among the leaves of the tree."""
+    if not isinstance(model, scoring.TreeModel):
+        model = scoring.load_model(model)
+    leaves = np.flatnonzero(np.asarray(model.children_left) < 0)
+    return _case_sql(model, node, depth, leaves)
+def _case_sql(model, node, depth, leaves):
+    """Writes the CASE of a node, the leaves as their position in leaves."""
+    if model.children_left[node] < 0:
+        return str(int(np.searchsorted(leaves, node)))
+    indent = "    "*(depth+1)
+    return "CASE WHEN {condition}\n{indent}THEN {left}\n{indent}ELSE {right} END".format(
+        condition=split_condition(model, node), indent=indent,
+        left=_case_sql(model, int(model.children_left[node]), depth+1, leaves),
+        right=_case_sql(model, int(model.children_right[node]), depth+1, leaves))
+def _class_literal(value):
+    """Writes a class of the tree as a bigquery literal."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    return _string_literal(value) if isinstance(value, str) else repr(value)
+def scoring_query(model, project_name, table_name, keep_columns=(), source=None):
+    """This function writes the query scoring every row of the table.
+    The features the tree uses are written once in the innermost query, the tree
+    only finds the leaf of every row, and the probabilities and the prediction of
+    the leaf are read from arrays, which keeps the query short for deep trees.
+    Parameters required:a.)model: The TreeModel from scoring.load_model, or its directory.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)keep_columns: Columns of the table, like the ids of the
+                        sessions, selected alongwith the scores.
+                        e.)source: A table expression to read instead of the table,
+                        like the ones of sampling.sample_source.
+    Result: The query as a string, with the kept columns, the prediction and the
+            probability_<class> columns."""
+    if not isinstance(model, scoring.TreeModel):
+        model = scoring.load_model(model)
+    source = source or "{project_name}.{table_name}".format(
+        project_name=project_name, table_name=table_name)
+    leaves = np.flatnonzero(np.asarray(model.children_left) < 0)
+    value = np.asarray(model.value)[leaves]
+    scores = ["[{values}][OFFSET(leaf)] AS probability_{name}".format(
+        values=", ".join(_float_literal(j) for j in value[:, position]), name=i)
+              for position, i in enumerate(model.classes)]
+    prediction = "[{values}][OFFSET(leaf)] AS prediction".format(values=", ".join(
+        _class_literal(i) for i in model.classes[value.argmax(axis=1)]))
+    feature_columns = ["{expression} AS f{feature}".format(
+        expression=_feature_sql(model, i), feature=i) for i in _used_features(model)]
+    keep = "".join(i+", " for i in keep_columns)
+    query = """SELECT {keep}{prediction}, {scores}
+            FROM (SELECT {keep}{expression} AS leaf
+            FROM (SELECT {keep}{features}
+            FROM {source}))""".format(
+                keep=keep, prediction=prediction, scores=", ".join(scores),
+                expression=_case_sql(model, 0, 0, leaves),
+                features=", ".join(feature_columns) or "1 AS f", source=source)
+    if len(query) > MAX_QUERY_LENGTH:
+        raise ValueError("The scoring query is {length} characters long, more than the "
+                         "{limit} bigquery allows, a smaller tree is needed".format(
+                             length=len(query), limit=MAX_QUERY_LENGTH))
+    return query
+def view_query(model, project_name, table_name, view_name, keep_columns=()):
+    """This function writes the statement creating or replacing a view which scores
+    the table whenever it is queried.
+    Parameters required:a.)model: The TreeModel from scoring.load_model, or its directory.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)view_name: Name of the view, in the same project.
+                        e.)keep_columns: Columns of the table selected with the scores.
+    Result: The CREATE OR REPLACE VIEW statement as a string."""
+    return "CREATE OR REPLACE VIEW {project_name}.{view_name} AS\n{query}".format(
+        project_name=project_name, view_name=view_name,
+        query=scoring_query(model, project_name, table_name, keep_columns))
+def check_predictions(model, project_name, table_name, source=None):
+    """This function checks that the SQL scores of the rows are the same as the scores
+    of the model on the same rows, by running the scoring query with the raw columns
+    of the state kept, on a sample of the table when a sample source is passed.
+    Parameters required:a.)model: The TreeModel from scoring.load_model, or its directory.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)source: A table expression to read instead of the table,
+                        like sampling.sample_source(project_name, table_name, 1).
+    Result: A dictionary with the number of rows checked and the number of rows whose
+            prediction or probabilities differ."""
+    if not isinstance(model, scoring.TreeModel):
+        model = scoring.load_model(model)
+    columns = [i for i in model.state['columns'] if i != 'label']
+    data = query_executor.run_query(scoring_query(model, project_name, table_name,
+                                                  columns, source))
+    probability = model.predict_proba(data[columns])
+    sql_probability = data[["probability_"+str(i) for i in model.classes]].to_numpy(
+        dtype='float64')
+    predictions = model.classes[probability.argmax(axis=1)]
+    differ = (data['prediction'].to_numpy() != predictions) | ~np.isclose(
+        sql_probability, probability).all(axis=1)
+    return {'rows': len(data), 'mismatches': int(differ.sum())}
@@ -1,20 +1,25 @@
 """This module contains various functions required
 to carry out univariate analysis of a
 table after generating it dynamically from bigquery. """
-from google.cloud import bigquery
-import pandas as pd
+#pandas and numpy are imported by the functions using them, so the first queries
+#of a run are not kept waiting for their imports.
+import query_executor
+import schema_catalog
+#row names of numeric_data_overview and the suffixes
+#used for them in the table_profile statistics query.
+_OVERVIEW_ROWS = {'Mean': 'mean', 'St_deviation': 'st_deviation', 'min': 'min',
+                  'quantile_25': 'quantile_25', 'quantile_50': 'quantile_50',
+                  'quantile_75': 'quantile_75', 'max': 'max'}
 def column_info(column_name, project_name, table_name):
     """ This function gives information regarding the datatypes of different columns
         Parameters required:a.)project_name: The project name in which the table is located
                             b.)table_name: Name of the table.
                             c.)column_name: Name of the column.
         Result: A dataframe with all the column names and their datatypes"""
-    query = """WITH column_numeric as(
-                    SELECT DATA_TYPE,COLUMN_NAME FROM {project_name}.INFORMATION_SCHEMA.COLUMNS 
-                    WHERE table_name="{table_name}")
-                    Select DATA_TYPE FROM column_numeric WHERE COLUMN_NAME = "{col_name}"; 
-                """.format(project_name=project_name, table_name=table_name, col_name=column_name)
-    result = main_func(query)
+    import pandas as pd
+    #the datatypes of all the columns are fetched once for the table.
+    data_type = schema_catalog.get_catalog(project_name, table_name).data_type(column_name)
+    result = pd.DataFrame({'DATA_TYPE': [data_type] if data_type else []}, dtype=object)
     return result
 def dynamic_bucket(column_name, project_name, table_name, buckets=10):
     """This function will automatically make buckets for any numeric column,
@@ -37,6 +42,16 @@ def dynamic_bucket(column_name, project_name, table_name, buckets=10):
     #converting to float to NaN incase the any value in the column is in string format
     data = data.transpose()
     data = data.reset_index(drop=True)
+    return bucket_case(column_name, data, buckets)
+def bucket_case(column_name, data, buckets=10):
+    """This function builds the CASE conditions for the dynamic buckets
+    of a numeric column from its already computed statistics.
+    Parameters Required:
+        a.)column_name: The name of the numeric column.
+        b.)data: A singular column dataframe with the Mean, St_deviation,
+                min and max of the column in that order.
+        c.)buckets: The number of buckets you want to make.
+    Result: A string with dynamic buckets will be made."""
     #converting dataframe into series for calculating mean
     #standard deviation without dtypes in the output.'''
     data_mean = round(data.iloc[0, :].values[0], 2)
@@ -85,6 +100,39 @@ def dynamic_bucket(column_name, project_name, table_name, buckets=10):
             query = query+text_4
         i += 1
     return query
+def bucket_labels(values, data, buckets=10):
+    """This function puts every value in its bucket, giving the same result
+    as the CASE conditions of bucket_case in a vectorized way.
+    Parameters Required:
+        a.)values: A numpy array with the values of the numeric column.
+        b.)data: A singular column dataframe with the Mean, St_deviation,
+                min and max of the column in that order.
+        c.)buckets: The number of buckets.
+    Result: An array with the bucket label of every value, None where no bucket applies."""
+    import numpy as np
+    #limits rounded exactly the way bucket_case rounds them.
+    data_mean = round(data.iloc[0, 0], 2)
+    data_std = round(data.iloc[1, 0], 2)
+    data_min = round(data.iloc[2, 0], 2)
+    data_max = round(data.iloc[3, 0], 2)
+    min_range = round(data_mean-(2*data_std), 2)
+    max_range = round(data_mean+(2*data_std), 2)
+    bucket_width = (max_range-min_range)/buckets
+    lower = np.array([round(min_range+(k*bucket_width), 2) for k in range(buckets)])
+    upper = np.array([round(min_range+((k+1)*bucket_width), 2) for k in range(buckets)])
+    names = np.array(["[{lower_limit}-{upper_limit})".format(lower_limit=str(i), upper_limit=str(j))
+                      for i, j in zip(lower, upper)] +
+                     ["[{min_data}-{min_data})".format(min_data=str(data_min)),
+                      "[{max_data}-{max_data})".format(max_data=str(data_max)), None],
+                     dtype=object)
+    #the CASE picks the first bucket k with lower_limit>=value AND value<upper_limit.
+    k = np.searchsorted(lower, values, side='left')
+    inside = k < buckets
+    inside[inside] = values[inside] < upper[k[inside]]
+    code = np.where(inside, k, buckets+2)
+    code = np.where(~inside & (values >= data_max), buckets+1, code)
+    code = np.where(values < data_min, buckets, code)
+    return names[code]
 def numeric_data_overview(column_name, project_name, table_name):
     """ This function provides the basic overview for a numeric column.
         Parameters to be passed :
@@ -122,6 +170,7 @@ def categorical_overview(column_name, project_name, table_name):
         Result: You will get a three column matrix with the values distinct values(null not
          included),null_count and total count.
     """
+    import pandas as pd
     query = ("""With table as(
             SELECT COUNT(DISTINCT {col_name}) FROM {project_name}.{table_name})
             Select * from table ;
@@ -209,7 +258,8 @@ def compare_leads_numeric(column_name, project_name, table_name, buckets=10):
                         the user wants to perform some action.
     Result: A 3-columnar dataframe with buckets,converted coverage and non-converted coverage.
     Note:An inner join will be performed between the tables of converted coverage
-        and non-converted coverage to find the common buckets. """
+        and non-converted coverage to find the common buckets, compare_segments_numeric
+        keeps all of them with a single scan of the table. """
     query = dynamic_bucket(column_name, project_name, table_name, buckets)
     #This is the final query that will be passed to the main function
     # after formatting the values of Query and column_name.
@@ -238,6 +288,86 @@ def compare_leads_numeric(column_name, project_name, table_name, buckets=10):
     result = main_func(query_final)
     #returning the result obtained.
     return result
+def bucket_coverage_numeric(column_name, project_name, table_name, buckets=10, limits=None):
+    """This function makes the dynamic buckets of a numeric column inside bigquery
+    and gives the count,coverage and the converted and non-converted coverage of every
+    bucket with a single query.
+    Parameters passed:
+        a.)column_name:Name of the numeric column
+        b.)project_name: The project name in which the table is located
+        c.)table_name: Name of the table.
+        d.)buckets: Number of buckets to be made
+        e.)limits: (min_range,max_range) of an earlier run, obtained from bucket_limits,
+                to reuse the same buckets, if not passed the range is taken from
+                -2σ to 2σ around the mean, the same as dynamic_bucket.
+    Result: A dataframe with the bucket number,Buckets,lower_limit,upper_limit,Count,Coverage,
+            non_converted_coverage and converted_coverage.
+    Note:Every bucket is returned even when its count is 0, and the buckets present
+        for only one of the labels are kept, unlike the inner join in compare_leads_numeric."""
+    import pandas as pd
+    if limits is None:
+        #rounding the same way as dynamic_bucket so that the buckets are the same.
+        min_range = "ROUND(ROUND(AVG({col_name}), 2)-2*ROUND(STDDEV({col_name}), 2), 2)"
+        max_range = "ROUND(ROUND(AVG({col_name}), 2)+2*ROUND(STDDEV({col_name}), 2), 2)"
+        min_range = min_range.format(col_name=column_name)
+        max_range = max_range.format(col_name=column_name)
+    else:
+        min_range, max_range = str(float(limits[0])), str(float(limits[1]))
+    #the bucket number is found arithmetically instead of a CASE for every bucket,
+    #0 and buckets+1 are the outlier buckets and -1 is kept for the null values.
+    query = """With table as(
+        SELECT SAFE_CAST({col_name} AS FLOAT64) as {col_name}, label
+        FROM {project_name}.{table_name}),
+        limits as(
+        SELECT MIN({col_name}) as min, MAX({col_name}) as max,
+        {min_range} as min_range, {max_range} as max_range
+        FROM table),
+        table_2 as(
+        SELECT CASE
+        WHEN {col_name} IS NULL THEN -1
+        WHEN {col_name} < min_range THEN 0
+        WHEN {col_name} >= max_range THEN {buckets}+1
+        ELSE LEAST(1+CAST(FLOOR(SAFE_DIVIDE(({col_name}-min_range)*{buckets}, max_range-min_range)) AS INT64), {buckets})
+        END AS bucket,
+        Count(*) as Count, COUNTIF(label=0) as count_0, COUNTIF(label=1) as count_1
+        FROM table CROSS JOIN limits
+        Group by bucket),
+        table_3 as(
+        SELECT bucket,
+        CASE WHEN bucket=0 THEN ROUND(min, 2) WHEN bucket={buckets}+1 THEN max_range
+        ELSE ROUND(min_range+(bucket-1)*(max_range-min_range)/{buckets}, 2) END as lower_limit,
+        CASE WHEN bucket=0 THEN min_range WHEN bucket={buckets}+1 THEN ROUND(max, 2)
+        ELSE ROUND(min_range+bucket*(max_range-min_range)/{buckets}, 2) END as upper_limit
+        FROM UNNEST(GENERATE_ARRAY(-1, {buckets}+1)) as bucket CROSS JOIN limits)
+        Select a.bucket,
+        IF(a.bucket=-1, NULL, FORMAT('[%s-%s)', CAST(a.lower_limit AS STRING), CAST(a.upper_limit AS STRING))) as Buckets,
+        IF(a.bucket=-1, NULL, a.lower_limit) as lower_limit,
+        IF(a.bucket=-1, NULL, a.upper_limit) as upper_limit,
+        IFNULL(b.Count, 0) as Count,
+        IFNULL(b.Count, 0)*100/(Select Sum(Count) from table_2) as Coverage,
+        SAFE_DIVIDE(IFNULL(b.count_0, 0)*100, (Select Sum(count_0) from table_2)) as non_converted_coverage,
+        SAFE_DIVIDE(IFNULL(b.count_1, 0)*100, (Select Sum(count_1) from table_2)) as converted_coverage
+        from table_3 as a LEFT JOIN table_2 as b
+        ON a.bucket=b.bucket
+        WHERE a.bucket != -1 OR b.Count > 0
+        Order By a.bucket;""".format(col_name=column_name, buckets=str(buckets),
+                                      min_range=min_range, max_range=max_range,
+                                      project_name=project_name, table_name=table_name)
+    result = main_func(query)
+    #the null values are shown as a null bucket the same as count_coverage_numeric,
+    #the bucket numbers staying integers as the nullable Int64.
+    result['bucket'] = result['bucket'].astype('Int64')
+    result.loc[result['bucket'] == -1, 'bucket'] = pd.NA
+    return result
+def bucket_limits(result):
+    """This function gives the range of the buckets made by bucket_coverage_numeric
+    so that the same buckets can be reused for later runs.
+    Parameters passed:
+        a.)result: The dataframe returned by bucket_coverage_numeric.
+    Result: A tuple with the min_range and max_range of the buckets."""
+    bucket = result['bucket'].fillna(-1)
+    inner = result[(bucket > 0) & (bucket < bucket.max())]
+    return (inner['lower_limit'].min(), inner['upper_limit'].max())
 def compare_leads_categorical(column_name, project_name, table_name, terms=10):
     """This function compares the leads values for a categorical column.
     Two tables are created one in which the data is sorted according to coverage_converted and
@@ -249,6 +379,8 @@ def compare_leads_categorical(column_name, project_name, table_name, terms=10):
         c.)project_name: The project name in which the table is located
         d.)table_name: Name of the table.
     Result: A 3-columnar dataframe with converted coverage,terms ,non-converted coverage
+    Note:Only the values present for both the labels are compared, compare_segments_categorical
+        keeps all of them with a single scan of the table.
     """
     query = ("""With table as(
             SELECT Count(*) as Count,{col_name} as {col_name}
@@ -276,15 +408,270 @@ def compare_leads_categorical(column_name, project_name, table_name, terms=10):
                                        table_name=table_name)
     result = main_func(query)
     return result
-def main_func(query_passed):
+def compare_segments_numeric(column_name, project_name, table_name, segment='label',
+                             buckets=10, baseline=None):
+    """This function compares the coverage of the dynamic buckets of a numeric column
+    across all the values of a segment column, like the label, the device or the
+    channel, counting every bucket of every segment with a single scan of the table.
+    Parameters passed:
+        a.)column_name:Name of the numeric column
+        b.)project_name: The project name in which the table is located
+        c.)table_name: Name of the table.
+        d.)segment: The column whose values are compared, label by default.
+        e.)buckets: Number of buckets to be made
+        f.)baseline: The segment value the ratio_<segment> columns are taken against.
+    Result: A dataframe with Buckets,Count,Coverage and the count_<segment>,
+            coverage_<segment> and lift_<segment>(coverage of the segment over the
+            overall coverage) of every segment, ordered by Count.
+    Note:Unlike compare_leads_numeric, the buckets present in only some of the segments
+        are kept with a count of 0 for the others, and the null bucket is kept."""
+    query = dynamic_bucket(column_name, project_name, table_name, buckets)
+    source = """(SELECT SAFE_CAST({col_name} AS FLOAT64) as {col_name}, {segment}
+            FROM {project_name}.{table_name})""".format(
+                col_name=column_name, segment=segment, project_name=project_name,
+                table_name=table_name)
+    value = """CASE
+        {Query}
+        END""".format(Query=query)
+    data = main_func(_segment_query(value, segment, source))
+    return _segment_table(data, 'Buckets', baseline)
+def compare_segments_categorical(column_name, project_name, table_name, segment='label',
+                                 terms=10, baseline=None):
+    """This function compares the coverage of the values of a categorical column
+    across all the values of a segment column with a single scan of the table,
+    keeping the top terms of every segment.
+    Parameters:
+        a.)column_name: Name of the categorical column.
+        b.)project_name: The project name in which the table is located
+        c.)table_name: Name of the table.
+        d.)segment: The column whose values are compared, label by default.
+        e.)terms: Number of values kept from the top of every segment, all the values
+            are kept if None.
+        f.)baseline: The segment value the ratio_<segment> columns are taken against.
+    Result: A dataframe with the values,Count,Coverage and the count_<segment>,
+            coverage_<segment> and lift_<segment> of every segment, ordered by Count.
+    Note:A value in the top terms of one segment is given with its counts in all the
+        segments, including the ones it is not present in, and the nulls are kept."""
+    source = "{project_name}.{table_name}".format(project_name=project_name,
+                                                  table_name=table_name)
+    data = main_func(_segment_query(column_name, segment, source, terms))
+    return _segment_table(data, column_name, baseline)
+def _segment_query(value, segment, source, terms=None):
+    """Builds the single query counting every value in every segment alongwith the
+    total of the segment, the rows with a null segment are left out."""
+    query = """With table as(
+            SELECT {value} as value, CAST({segment} AS STRING) as segment, Count(*) as Count
+            FROM {source}
+            WHERE {segment} IS NOT NULL
+            Group by value, segment),
+            table_2 as(
+            SELECT *, SUM(Count) OVER (PARTITION BY segment) as segment_total,
+            ROW_NUMBER() OVER (PARTITION BY segment ORDER BY Count DESC, value) as segment_rank
+            FROM table),
+            table_3 as(
+            SELECT value, segment, Count, segment_total,
+            MIN(segment_rank) OVER (PARTITION BY value) as best_rank
+            FROM table_2)
+            Select value, segment, Count, segment_total from table_3""".format(
+                value=value, segment=segment, source=source)
+    if terms is not None:
+        #a value in the top terms of any segment is kept for all the segments.
+        query += " WHERE best_rank<={terms}".format(terms=str(terms))
+    return query
+def _segment_table(data, key, baseline=None):
+    """Builds the comparison of the segments from the counts of every value in
+    every segment and the totals of the segments."""
+    import numpy as np
+    import pandas as pd
+    data = data.rename(columns={'value': key})
+    totals = data.groupby('segment')['segment_total'].first().astype('float64')
+    counts = data.groupby([key, 'segment'], dropna=False)['Count'].sum()
+    counts = counts.unstack('segment', fill_value=0).reindex(columns=totals.index, fill_value=0)
+    #the columns are made first and put together at once, there being three for
+    #every segment.
+    result = {key: counts.index.to_numpy()}
+    result['Count'] = counts.sum(axis=1).to_numpy(dtype='int64')
+    result['Coverage'] = result['Count']*100/totals.sum()
+    for i in totals.index:
+        result['count_'+i] = counts[i].to_numpy(dtype='int64')
+        result['coverage_'+i] = result['count_'+i]*100/totals[i]
+        result['lift_'+i] = result['coverage_'+i]/result['Coverage']
+    if baseline is not None:
+        for i in totals.index:
+            if i != str(baseline):
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    ratio = result['coverage_'+i]/result['coverage_'+str(baseline)]
+                #a value missing from the baseline has no ratio, like SAFE_DIVIDE.
+                result['ratio_'+i] = np.where(np.isinf(ratio), np.nan, ratio)
+    result = pd.DataFrame(result).sort_values('Count', ascending=False, kind='stable')
+    return result.reset_index(drop=True)
+def table_profile(column_list, project_name, table_name, terms=10, buckets=10, sample=None):
+    """This function profiles all the columns of a table together in a fixed
+    number of scans instead of running every univariate function column by column.
+    Parameters required:a.)column_list:Name of all columns for which univariate
+                            analysis is to be carried out.
+                        b.)project_name: The project name in which the table is located
+                        c.)table_name: Name of the table.
+                        d.)terms: number of top terms for the categorical columns.
+                        e.)buckets: The number of buckets for the numeric columns.
+                        f.)sample: The table expression the rows are read from instead
+                        of the whole table, like the ones sampling.sample_source writes.
+    Result: A dictionary with the column names as keys, each holding a dictionary with
+            the same dataframes(and bucket string) the single column functions return,
+            keyed on the name of that function, alongwith the data_type of the column.
+    Note:Only four queries are run whatever the number of columns is, one for the
+        datatypes(shared through the schema catalog), one for the overview statistics of all the columns, one for the
+        bucket counts of the numeric columns and one for the top terms of the
+        categorical columns."""
+    import pandas as pd
+    catalog = schema_catalog.get_catalog(project_name, table_name)
+    numeric_columns = catalog.numeric_columns(column_list)
+    string_columns = catalog.string_columns(column_list)
+    profile = {i: {'data_type': catalog.data_type(i)} for i in column_list}
+    if not numeric_columns and not string_columns:
+        return profile
+    source = sample or "{project_name}.{table_name}".format(
+        project_name=project_name, table_name=table_name)
+    terms_data = None
+    if string_columns:
+        #the terms query does not depend on the statistics, so it runs meanwhile.
+        terms_data = query_executor.submit(
+            _profile_terms_query(string_columns, source, terms))
+    #one scan for the overview of every numeric and categorical column.
+    stats_data = main_func(_profile_stats_query(numeric_columns, string_columns, source))
+    stats = stats_data.iloc[0]
+    bucket_cases = {}
+    for i in numeric_columns:
+        #same rows as the transposed dynamic_bucket statistics.
+        data = pd.DataFrame([[stats[i+'__mean']], [stats[i+'__st_deviation']],
+                             [stats[i+'__bucket_min']], [stats[i+'__bucket_max']]])
+        bucket_cases[i] = bucket_case(i, data, buckets)
+        overview = pd.DataFrame({i: [stats[i+'__'+j] for j in _OVERVIEW_ROWS.values()]},
+                                index=list(_OVERVIEW_ROWS))
+        profile[i]['dynamic_bucket'] = bucket_cases[i]
+        profile[i]['numeric_data_overview'] = overview
+    for i in string_columns:
+        overview = stats_data[[i+'__distinct', i+'__count_null', i+'__total_count']]
+        profile[i]['categorical_overview'] = overview.rename(columns={
+            i+'__distinct': 'distinct', i+'__count_null': 'count_null',
+            i+'__total_count': 'total_count'})
+    if numeric_columns:
+        counts = main_func(_profile_bucket_query(bucket_cases, source))
+        for i in numeric_columns:
+            data = counts[counts['name'] == i]
+            profile[i]['count_coverage_numeric'] = _coverage_from_counts(
+                data, 'Buckets', 'Count')
+            profile[i]['compare_leads_numeric'] = _compare_from_label_counts(data)
+    if string_columns:
+        counts = terms_data.result()
+        for i in string_columns:
+            data = counts[counts['name'] == i].rename(columns={'value': i})
+            coverage = data[data['rank_all'] <= terms].sort_values('Count', ascending=False)
+            coverage = coverage.assign(Coverage=coverage['Count']*100/coverage['total'])
+            profile[i]['count_coverage_categorical'] = coverage[
+                [i, 'Count', 'Coverage']].reset_index(drop=True)
+            profile[i]['compare_leads_categorical'] = _compare_leads_terms(data, i, terms)
+    return profile
+def _profile_stats_query(numeric_columns, string_columns, source):
+    """Builds the single query computing the overview statistics of all the columns."""
+    select = []
+    for i in numeric_columns:
+        select.append("""AVG({col_name}) as {col_name}__mean,
+            STDDEV({col_name}) as {col_name}__st_deviation,
+            APPROX_QUANTILES({col_name}, 100)[OFFSET(0)] AS {col_name}__bucket_min,
+            APPROX_QUANTILES({col_name}, 100)[OFFSET(100)] AS {col_name}__bucket_max,
+            APPROX_QUANTILES(SAFE_CAST({col_name} AS FLOAT64), 100)[OFFSET(0)] AS {col_name}__min,
+            APPROX_QUANTILES(SAFE_CAST({col_name} AS FLOAT64), 100)[OFFSET(25)] AS {col_name}__quantile_25,
+            APPROX_QUANTILES(SAFE_CAST({col_name} AS FLOAT64), 100)[OFFSET(50)] AS {col_name}__quantile_50,
+            APPROX_QUANTILES(SAFE_CAST({col_name} AS FLOAT64), 100)[OFFSET(75)] AS {col_name}__quantile_75,
+            APPROX_QUANTILES(SAFE_CAST({col_name} AS FLOAT64), 100)[OFFSET(100)] AS {col_name}__max""".format(
+                col_name=i))
+    for i in string_columns:
+        #NULLIF keeps the count_null empty when there are no nulls,
+        #the same as categorical_overview.
+        select.append("""COUNT(DISTINCT {col_name}) as {col_name}__distinct,
+            NULLIF(COUNTIF({col_name} IS NULL), 0) as {col_name}__count_null,
+            COUNT({col_name}) as {col_name}__total_count""".format(col_name=i))
+    query = """SELECT {select}
+            FROM {source}""".format(select=",\n            ".join(select), source=source)
+    return query
+def _profile_bucket_query(bucket_cases, source):
+    """Builds the single query counting the rows of every bucket of all the
+    numeric columns split by label."""
+    cast = ["SAFE_CAST({col_name} AS FLOAT64) as {col_name}".format(col_name=i)
+            for i in bucket_cases]
+    structs = ["""STRUCT('{col_name}' AS name, CASE
+        {Query}
+        END AS Buckets)""".format(col_name=i, Query=bucket_cases[i]) for i in bucket_cases]
+    query = """SELECT f.name as name, f.Buckets as Buckets, label, Count(*) as Count
+        FROM (SELECT {cast}, label FROM {source}),
+        UNNEST([{structs}]) as f
+        Group by name, Buckets, label;""".format(
+            cast=", ".join(cast), structs=",\n        ".join(structs), source=source)
+    return query
+def _profile_terms_query(string_columns, source, terms):
+    """Builds the single query finding the top terms of all the categorical columns,
+    overall and for each label, alongwith the totals needed for their coverage."""
+    structs = ["STRUCT('{col_name}' AS name, CAST({col_name} AS STRING) AS value)".format(
+        col_name=i) for i in string_columns]
+    query = """With table as(
+            SELECT f.name as name, f.value as value, Count(*) as Count,
+            COUNTIF(label=0) as count_0, COUNTIF(label=1) as count_1
+            FROM {source}, UNNEST([{structs}]) as f
+            Group by name, value),
+            table_2 as(
+            SELECT *,
+            SUM(Count) OVER (PARTITION BY name) as total,
+            SUM(count_0) OVER (PARTITION BY name) as total_0,
+            SUM(count_1) OVER (PARTITION BY name) as total_1,
+            ROW_NUMBER() OVER (PARTITION BY name ORDER BY Count DESC) as rank_all,
+            ROW_NUMBER() OVER (PARTITION BY name ORDER BY
+                IF(count_0>0 AND count_1>0 AND value IS NOT NULL, count_0, -1) DESC) as rank_0,
+            ROW_NUMBER() OVER (PARTITION BY name ORDER BY
+                IF(count_0>0 AND count_1>0 AND value IS NOT NULL, count_1, -1) DESC) as rank_1
+            FROM table)
+            Select * from table_2
+            WHERE rank_all<={terms} OR rank_0<={terms} OR rank_1<={terms};""".format(
+                structs=",\n            ".join(structs), terms=str(terms), source=source)
+    return query
+def _coverage_from_counts(data, key, count):
+    """Sums the counts of every key and adds their coverage in descending order."""
+    result = data.groupby(key, dropna=False)[count].sum().reset_index()
+    result['Coverage'] = result[count]*100/result[count].sum()
+    result = result.sort_values('Coverage', ascending=False).reset_index(drop=True)
+    return result
+def _compare_from_label_counts(data):
+    """Builds the compare_leads_numeric dataframe from bucket counts split by label."""
+    non_converted = _coverage_from_counts(data[data['label'] == 0], 'Buckets', 'Count')
+    converted = _coverage_from_counts(data[data['label'] == 1], 'Buckets', 'Count')
+    #the null bucket takes part in the coverage but not in the inner join.
+    result = non_converted.dropna(subset=['Buckets']).merge(
+        converted.dropna(subset=['Buckets']), on='Buckets', suffixes=('', '_1'))
+    result = result.sort_values('Count', ascending=False).rename(columns={
+        'Coverage': 'non_converted_coverage', 'Coverage_1': 'converted_coverage'})
+    result = result[['non_converted_coverage', 'Buckets', 'converted_coverage']]
+    return result.reset_index(drop=True)
+def _compare_leads_terms(data, column_name, terms):
+    """Builds the compare_leads_categorical dataframe from the ranked term counts."""
+    data = data[(data['count_0'] > 0) & (data['count_1'] > 0) & data[column_name].notna()]
+    data = data.assign(non_converted_coverage=data['count_0']*100/data['total_0'],
+                       converted_coverage=data['count_1']*100/data['total_1'])
+    result = data[(data['rank_0'] <= terms) | (data['rank_1'] <= terms)]
+    result = result.sort_values('converted_coverage', ascending=False)
+    result = result[['non_converted_coverage', column_name, 'converted_coverage']]
+    return result.reset_index(drop=True)
+def main_func(query_passed, arrow=False):
     """ This function takes the query as the parameter and runs
     it on bigquery to generate a table which is
     then converted to dataframe.
     Parameters:
         a.)query_passed:The query which is to be run on bigquery.
+        b.)arrow:Whether to return the pyarrow.Table the result is downloaded
+                as, without converting it, see query_executor.arrow_frame.
     Result:The table generated by the query will be converted to a dataframe."""
-    client = bigquery.Client()
-    data = client.query(query_passed).to_dataframe()
+    if arrow:
+        return query_executor.run_arrow(query_passed)
+    data = query_executor.run_query(query_passed)
     return data
 def test_func(column_list, project_name, table_name, terms=10, buckets=10):
     """This function is created to test
@@ -294,23 +681,17 @@ def test_func(column_list, project_name, table_name, terms=10, buckets=10):
                             analysis is to be carried out.
                         b.)project_name: The project name in which the table is located
                         c.)table_name: Name of the table."""
+    #all the columns are profiled together by table_profile
+    #instead of running every function column by column.
+    profile = table_profile(column_list, project_name, table_name, terms, buckets)
     for i in column_list:
-        column_name = i
-        result = column_info(column_name, project_name, table_name)
-        if (result.iloc[0, :] == "INT64").bool() or (result.iloc[0, :] == "FLOAT64").bool():
-            bucket_limits = dynamic_bucket(column_name, project_name, table_name, buckets)
-            print(bucket_limits)
-            overview = numeric_data_overview(column_name, project_name, table_name, buckets)
-            print(overview)
-            count_coverage = count_coverage_numeric(column_name, project_name, table_name, buckets)
-            print(count_coverage)
-            compare_numeric = compare_leads_numeric(column_name, project_name, table_name, buckets)
-            print(compare_numeric)
-        if (result.iloc[0, :] == "STRING").bool():
-            categorical_view = categorical_overview(column_name, project_name, table_name)
-            print(categorical_view)
-            count_coverage = count_coverage_categorical(column_name, project_name, table_name, terms)
-            print(count_coverage)
-            compare_categorical = compare_leads_categorical(
-                column_name, project_name, table_name, terms)
-            print(compare_categorical)
+        result = profile[i]
+        if result['data_type'] in ("INT64", "FLOAT64"):
+            print(result['dynamic_bucket'])
+            print(result['numeric_data_overview'])
+            print(result['count_coverage_numeric'])
+            print(result['compare_leads_numeric'])
+        if result['data_type'] == "STRING":
+            print(result['categorical_overview'])
+            print(result['count_coverage_categorical'])
+            print(result['compare_leads_categorical'])